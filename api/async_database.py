@@ -0,0 +1,78 @@
+import asyncio
+from typing import AsyncIterator
+from database import DB_FILE_PATH, STORAGE_PROFILE, SessionLocal, init_db
+from metrics import METRICS_ENABLED, instrument_engine
+from query_log import track_queries
+from price_store import price_store
+
+# SQLite through the aiosqlite driver, used when the API runs in the async database mode
+ASYNC_DATABASE_URL = f'sqlite+aiosqlite:///{DB_FILE_PATH}'
+
+# Created on first use, so the sync mode does not need the asyncio extension
+_async_engine = None
+_async_session_factory = None
+
+
+def get_async_session_factory():
+    """
+    Get the factory of async sessions, creating the async engine the first time.
+
+    Committed objects are not expired, so their attributes can be read after a commit
+    without an implicit query, which an async session cannot run.
+
+    :return: An `async_sessionmaker` bound to the async engine.
+    """
+    global _async_engine, _async_session_factory
+    if _async_session_factory is None:
+        try:
+            from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker
+            import aiosqlite  # noqa: F401
+        except ImportError as error:
+            raise RuntimeError("The async database mode needs the aiosqlite and greenlet packages") from error
+
+        _async_engine = create_async_engine(ASYNC_DATABASE_URL, **STORAGE_PROFILE.engine_options())
+        STORAGE_PROFILE.apply(_async_engine.sync_engine)
+        track_queries(_async_engine.sync_engine)
+        if METRICS_ENABLED:
+            instrument_engine(_async_engine.sync_engine)
+        _async_session_factory = async_sessionmaker(_async_engine, autoflush=False, expire_on_commit=False)
+    return _async_session_factory
+
+
+async def dispose_async_engine():
+    """
+    Close the connections of the async engine, their driver threads keep the process alive otherwise.
+    """
+    if _async_engine is not None:
+        await _async_engine.dispose()
+
+
+async def load_price_store():
+    """
+    Initialize the database and load the price store in a worker thread, unless already done.
+
+    The async handlers only use the in-memory store once it is loaded, so they never read it
+    from the database while holding its lock on the event loop thread.
+    """
+    if not price_store.loaded:
+        def load():
+            init_db()
+            with SessionLocal() as db:
+                price_store.load(db)
+
+        await asyncio.to_thread(load)
+
+
+async def get_async_db() -> AsyncIterator:
+    """
+    Create and yield an async database session.
+
+    The async counterpart of `get_db`, used by the routers of the async database mode.
+    The database initialization runs in a worker thread, so it never blocks the event loop.
+
+    :return: An `AsyncSession` object that connects to the database.
+    """
+    await load_price_store()
+
+    async with get_async_session_factory()() as db:
+        yield db
@@ -0,0 +1,111 @@
+"""
+Compare the throughput and latency of the sync and async database modes under concurrent load.
+
+Both applications are driven in-process through their ASGI interface with a fixed mix of
+stock, price and profit requests, so the numbers include routing, validation, the database
+access and serialization, but no network. Sync handlers run in the threadpool of the server,
+async handlers on the event loop.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_async [--requests 2000] [--concurrency 64]
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import List, Tuple
+import httpx
+import numpy as np
+from async_database import dispose_async_engine
+from database import init_db, SessionLocal
+from main import create_app, DB_MODES
+from price_store import price_store
+from profit_cache import profit_cache
+
+TICKERS = ("AMZN", "AAPL", "META", "GOOGL", "NFLX")
+
+
+def build_requests(count: int, seed: int) -> List[Tuple[str, str, dict]]:
+    """
+    Build a reproducible mix of read requests.
+
+    :param count: The number of requests.
+    :param seed: The seed of the random choices.
+    :return: A list of (method, url, json body) tuples.
+    """
+    rng = random.Random(seed)
+    requests = []
+    for _ in range(count):
+        ticker = rng.choice(TICKERS)
+        year = rng.randint(2005, 2019)
+        kind = rng.random()
+        if kind < 0.25:
+            requests.append(("GET", f"/stocks/{ticker}", None))
+        elif kind < 0.5:
+            requests.append(("GET", f"/prices/{ticker}/0{rng.randint(1, 9)}/1{rng.randint(0, 9)}/{year}", None))
+        elif kind < 0.75:
+            requests.append(("GET", f"/prices/{ticker}?start={year}-01-01&limit=50", None))
+        else:
+            body = {"ticker": ticker, "start_date": f"0{rng.randint(1, 6)}/01/{year}", "end_date": f"12/01/{year}"}
+            requests.append(("POST", "/profit/", body))
+    return requests
+
+
+async def run_load(db_mode: str, requests: List[Tuple[str, str, dict]],
+                   concurrency: int) -> Tuple[float, np.ndarray, int]:
+    """
+    Send the requests to an application with a fixed number of concurrent clients.
+
+    :param db_mode: The database mode of the application.
+    :param requests: The requests to send.
+    :param concurrency: The number of requests in flight at any time.
+    :return: The total time in seconds, the latency of every request in milliseconds and the number of
+             server errors, e.g. requests that timed out waiting for a database connection.
+    """
+    transport = httpx.ASGITransport(app=create_app(db_mode), raise_app_exceptions=False)
+    latencies, errors = [], 0
+    pending = iter(requests)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for method, url, body in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 500
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    await dispose_async_engine()
+    return elapsed, np.array(latencies), errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per mode")
+    parser.add_argument("--concurrency", type=int, default=64, help="Requests in flight at any time")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the request mix")
+    args = parser.parse_args()
+
+    # Both modes share the database and the price store, warm them up first
+    init_db()
+    with SessionLocal() as db:
+        price_store.load(db)
+    requests = build_requests(args.requests, args.seed)
+
+    print(f"{args.requests} requests, {args.concurrency} concurrent")
+    print(f"{'mode':<8}{'req/s':>10}{'p50 [ms]':>11}{'p99 [ms]':>11}{'max [ms]':>11}{'errors':>8}")
+    for db_mode in DB_MODES:
+        # Every mode starts with a cold profit cache
+        profit_cache.clear()
+        elapsed, latencies, errors = asyncio.run(run_load(db_mode, requests, args.concurrency))
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{db_mode:<8}{len(latencies) / elapsed:>10.0f}{p50:>11.1f}{p99:>11.1f}{latencies.max():>11.1f}"
+              f"{errors:>8}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""
+Time the initial database fill from the bundled CSV files and report rows per second.
+
+Every variant fills a new SQLite file in a temporary directory:
+  original  - row by row ORM inserts and one commit per stock
+  bulk      - vectorized parsing and one bulk insert transaction, in this process
+  parallel  - like bulk, with the CSV files parsed in a process pool
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_init_db [--repeat 3] [--workers N]
+"""
+import argparse
+import os
+import tempfile
+import time
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from database import Base, StockPrice, CSV_DIRECTORY, populate_db
+from migrations import stamp
+from benchmarks import reference
+
+
+def time_fill(fill, repeat: int):
+    """
+    Fill a new database several times and return the fastest run with its row count.
+
+    :param fill: A function taking a database session and filling the database.
+    :param repeat: How many times the database is filled.
+    :return: A (seconds, rows) tuple for the fastest run.
+    """
+    timings = []
+    rows = 0
+    for _ in range(repeat):
+        with tempfile.TemporaryDirectory() as directory:
+            engine = create_engine(f"sqlite:///{os.path.join(directory, 'stock_data.db')}")
+            Base.metadata.create_all(bind=engine)
+            stamp(engine)
+            with Session(engine) as db:
+                started = time.perf_counter()
+                fill(db)
+                timings.append(time.perf_counter() - started)
+                rows = db.query(StockPrice).count()
+            engine.dispose()
+    return min(timings), rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per variant, the fastest one is kept")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes for the parallel variant")
+    args = parser.parse_args()
+
+    variants = {
+        "original": lambda db: reference.populate_db(db, CSV_DIRECTORY),
+        "bulk": lambda db: populate_db(db, CSV_DIRECTORY, workers=1),
+        "parallel": lambda db: populate_db(db, CSV_DIRECTORY, workers=args.workers),
+    }
+
+    print(f"{'variant':<10}{'rows':>8}{'time [s]':>11}{'rows/s':>12}")
+    for name, fill in variants.items():
+        seconds, rows = time_fill(fill, args.repeat)
+        print(f"{name:<10}{rows:>8}{seconds:>11.3f}{rows / seconds:>12.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""
+Measure the overhead of the request and database metrics under concurrent load.
+
+The same mix of read requests (see `bench_async`) is sent to an application with and without
+metrics, in alternating rounds so both see the same machine state. Without metrics, the
+middleware and /metrics are not installed and the engine events are removed, including the
+statement tracking of `query_log`.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_metrics [--requests 2000] [--concurrency 32] [--rounds 5]
+"""
+import argparse
+import asyncio
+import time
+from typing import Tuple
+import httpx
+import numpy as np
+from benchmarks.bench_async import build_requests
+from database import engine, init_db, SessionLocal
+from main import create_app
+from metrics import instrument_engine, uninstrument_engine
+from query_log import track_queries, untrack_queries
+from price_store import price_store
+from profit_cache import profit_cache
+
+
+async def run_round(metrics: bool, requests, concurrency: int) -> Tuple[float, np.ndarray]:
+    """
+    Send the requests to a new application with a fixed number of concurrent clients.
+
+    :param metrics: If True, the application and the engine are instrumented.
+    :param requests: The (method, url, json body) requests to send.
+    :param concurrency: The number of requests in flight at any time.
+    :return: The total time in seconds and the latency of every request in milliseconds.
+    """
+    if metrics:
+        track_queries(engine)
+        instrument_engine(engine)
+    else:
+        untrack_queries(engine)
+        uninstrument_engine(engine)
+    profit_cache.clear()
+    transport = httpx.ASGITransport(app=create_app("sync", metrics=metrics))
+    latencies = []
+    pending = iter(requests)
+
+    async def worker(client: httpx.AsyncClient):
+        for method, url, body in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies.append((time.perf_counter() - started) * 1000)
+            assert response.status_code < 500, url
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        return time.perf_counter() - started, np.array(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=2000, help="Requests per round")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at any time")
+    parser.add_argument("--rounds", type=int, default=5, help="Rounds per variant, the fastest one is kept")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the request mix")
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        price_store.load(db)
+    requests = build_requests(args.requests, args.seed)
+
+    # Alternate the variants, the fastest round of each one is kept
+    best = {}
+    for _ in range(args.rounds):
+        for variant, metrics in (("off", False), ("on", True)):
+            elapsed, latencies = asyncio.run(run_round(metrics, requests, args.concurrency))
+            if variant not in best or elapsed < best[variant][0]:
+                best[variant] = (elapsed, latencies)
+    track_queries(engine)
+    instrument_engine(engine)
+
+    print(f"{'metrics':<9}{'req/s':>10}{'p50 [ms]':>10}{'p99 [ms]':>10}{'us/req':>10}")
+    for variant, (elapsed, latencies) in best.items():
+        p50, p99 = np.percentile(latencies, [50, 99])
+        print(f"{variant:<9}{len(latencies) / elapsed:>10.0f}{p50:>10.2f}{p99:>10.2f}"
+              f"{elapsed / len(latencies) * 1e6:>10.1f}")
+    overhead = best["on"][0] / best["off"][0] - 1
+    per_request = (best["on"][0] - best["off"][0]) / args.requests * 1e6
+    print(f"\nOverhead: {overhead:+.1%} of the total time, {per_request:+.1f} us per request")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,59 @@
+"""
+Compare the vectorized profit engine with the original nested-loop implementation.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_profit [--repeat 3]
+"""
+import argparse
+import os
+import time
+from typing import Callable
+import pandas as pd
+import profit_engine
+from benchmarks import reference
+
+CSV_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv_files")
+
+
+def best_time(func: Callable, repeat: int) -> float:
+    """
+    Run a function several times and return the fastest wall time in seconds.
+
+    :param func: The function to time.
+    :param repeat: How many times the function is run.
+    :return: The fastest run time in seconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        func()
+        timings.append(time.perf_counter() - started)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per implementation, the fastest one is kept")
+    args = parser.parse_args()
+
+    print(f"{'file':<14}{'rows':>8}{'original [s]':>15}{'engine [s]':>13}{'speedup':>10}  parity")
+    for file in sorted(os.listdir(CSV_DIRECTORY)):
+        if not file.endswith(".csv"):
+            continue
+
+        # Load the full history of one stock
+        df = pd.read_csv(os.path.join(CSV_DIRECTORY, file)).dropna()
+        dates = pd.to_datetime(df["Date"], format="%Y-%m-%d").to_numpy().astype("datetime64[D]")
+        closes = df["Close"].to_numpy(dtype="float64")
+        rows = [reference.PriceRow(d, c) for d, c in zip(dates.astype(object), closes.tolist())]
+
+        # Time both implementations on the same data
+        original = best_time(lambda: reference.calc_profit(rows), args.repeat)
+        engine = best_time(lambda: profit_engine.calc_profit(dates, closes), args.repeat)
+        parity = reference.calc_profit(rows) == profit_engine.calc_profit(dates, closes)
+        print(f"{file:<14}{len(rows):>8}{original:>15.4f}{engine:>13.6f}{original / engine:>9.0f}x  {parity}")
+
+
+if __name__ == "__main__":
+    main()
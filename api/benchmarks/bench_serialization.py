@@ -0,0 +1,91 @@
+"""
+Time the response serialization of a stock's full price history, before and after the fast path.
+
+Every variant reads all prices of one stock and encodes them like GET /prices/{ticker}:
+  orm        - ORM objects validated against `StockPriceResponse` and encoded with json
+  rows       - row dictionaries validated against `StockPriceResponse` and encoded with json
+  fast       - plain tuples turned into dictionaries and encoded with `fast_json.dumps`
+
+The query and the serialization are timed separately, the fastest of the repetitions is reported.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_serialization [--ticker AAPL] [--repeat 10]
+"""
+import argparse
+import json
+import time
+from typing import Callable, List, Tuple
+from pydantic import TypeAdapter
+from database import init_db, SessionLocal, Stock, StockPrice
+from fast_json import dumps, orjson, row_dicts
+from routers.api_stock_prices import PriceQuery, build_price_select
+from schemas import StockPriceResponse
+
+RESPONSE_ADAPTER = TypeAdapter(List[StockPriceResponse])
+
+
+def encode_validated(prices) -> bytes:
+    """
+    Validate prices against the response model and encode them, like FastAPI does for a `response_model`.
+    """
+    content = RESPONSE_ADAPTER.dump_python(RESPONSE_ADAPTER.validate_python(prices, from_attributes=True), mode="json")
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode("utf-8")
+
+
+def time_variant(read: Callable, encode: Callable, repeat: int) -> Tuple[float, float, bytes]:
+    """
+    Time the query and the serialization of one variant.
+
+    :param read: A function taking a database session and returning the prices.
+    :param encode: A function encoding the prices as JSON.
+    :param repeat: How many times the variant runs.
+    :return: The fastest query and serialization times in milliseconds, and the encoded body.
+    """
+    read_times, encode_times = [], []
+    body = b""
+    for _ in range(repeat):
+        with SessionLocal() as db:
+            started = time.perf_counter()
+            prices = read(db)
+            read_times.append((time.perf_counter() - started) * 1000)
+        started = time.perf_counter()
+        body = encode(prices)
+        encode_times.append((time.perf_counter() - started) * 1000)
+    return min(read_times), min(encode_times), body
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ticker", default="AAPL", help="The stock whose full history is serialized")
+    parser.add_argument("--repeat", type=int, default=10, help="Repetitions per variant")
+    args = parser.parse_args()
+
+    init_db()
+    with SessionLocal() as db:
+        stock_id = db.query(Stock.id).filter(Stock.ticker == args.ticker).scalar()
+    price_query = PriceQuery(stock_id)
+    price_select = build_price_select(price_query, None, None)
+
+    variants = {
+        "orm": (lambda db: db.query(StockPrice).filter(StockPrice.stock_id == stock_id).order_by(StockPrice.date).all(),
+                encode_validated),
+        "rows": (lambda db: [dict(row._mapping) for row in db.execute(price_select)], encode_validated),
+        "fast": (lambda db: row_dicts(price_query.fields, db.execute(price_select)), dumps),
+    }
+
+    print(f"{args.ticker} full history, JSON encoder of the fast path: {'orjson' if orjson else 'json'}")
+    print(f"{'variant':<10}{'query':>10}{'serialize':>12}{'total':>10}{'speedup':>9}")
+    baseline, expected = None, None
+    for name, (read, encode) in variants.items():
+        read_ms, encode_ms, body = time_variant(read, encode, args.repeat)
+        baseline = baseline or read_ms + encode_ms
+        expected = expected or json.loads(body)
+        assert json.loads(body) == expected, f"{name} returns different prices"
+        print(f"{name:<10}{read_ms:>8.1f}ms{encode_ms:>10.1f}ms{read_ms + encode_ms:>8.1f}ms"
+              f"{baseline / (read_ms + encode_ms):>8.1f}x")
+    print(f"{len(expected)} prices, {len(body) / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
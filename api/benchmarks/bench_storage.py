@@ -0,0 +1,136 @@
+"""
+Compare the mixed read/write throughput of the SQLite storage profiles.
+
+Every profile runs on its own copy of the API database. Reader threads query the prices of
+a random stock and year, like GET /prices/{ticker}?start&end, while writer threads add or
+update one price per transaction, like POST and PUT /prices. Busy errors of the rollback
+journal, where readers and writers block each other, are counted as errors.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_storage [--seconds 5] [--readers 8] [--writers 2] [--profiles default,tuned]
+"""
+import argparse
+import os
+import random
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List
+import numpy as np
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from database import DB_FILE_PATH, init_db
+from storage_profile import PROFILES, StorageProfile
+
+READ_QUERY = text(
+    "SELECT date, open, high, low, close, adj_close, volume, id, stock_id FROM stock_prices "
+    "WHERE stock_id = :stock_id AND date >= :start AND date <= :end ORDER BY date"
+)
+WRITE_QUERY = text(
+    "INSERT INTO stock_prices (stock_id, date, open, high, low, close, adj_close, volume) "
+    "VALUES (:stock_id, :date, 1.0, 2.0, 0.5, :close, :close, 100) "
+    "ON CONFLICT (stock_id, date) DO UPDATE SET close = excluded.close, adj_close = excluded.adj_close"
+)
+
+
+def copy_database(directory: str) -> str:
+    """
+    Copy the API database with SQLite's backup API, so the copy is consistent and in rollback journal mode.
+
+    :param directory: The directory of the copy.
+    :return: The path of the copy.
+    """
+    path = os.path.join(directory, "stock_data.db")
+    source, target = sqlite3.connect(DB_FILE_PATH), sqlite3.connect(path)
+    source.backup(target)
+    target.execute("PRAGMA journal_mode = DELETE")
+    source.close()
+    target.close()
+    return path
+
+
+def run_profile(profile: StorageProfile, path: str, readers: int, writers: int, seconds: float) -> Dict:
+    """
+    Run the mixed workload on one database with one profile.
+
+    :return: The operation counts, errors and latencies in milliseconds by operation.
+    """
+    engine = create_engine(f"sqlite:///{path}", connect_args={"check_same_thread": False}, **profile.engine_options())
+    profile.apply(engine)
+    with engine.connect() as connection:
+        stock_ids = [row[0] for row in connection.execute(text("SELECT id FROM stocks"))]
+
+    latencies: Dict[str, List[float]] = {"read": [], "write": []}
+    errors = {"read": 0, "write": 0}
+    deadline = time.perf_counter() + seconds
+
+    def reader(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            year = rng.randint(2000, 2019)
+            params = {"stock_id": rng.choice(stock_ids), "start": f"{year}-01-01", "end": f"{year}-12-31"}
+            started = time.perf_counter()
+            try:
+                with engine.connect() as connection:
+                    connection.execute(READ_QUERY, params).all()
+            except OperationalError:
+                errors["read"] += 1
+                continue
+            latencies["read"].append((time.perf_counter() - started) * 1000)
+
+    def writer(seed: int):
+        rng = random.Random(seed)
+        while time.perf_counter() < deadline:
+            day = date(2030, 1, 1) + timedelta(days=rng.randint(0, 3650))
+            params = {"stock_id": rng.choice(stock_ids), "date": day.isoformat(), "close": rng.random()}
+            started = time.perf_counter()
+            try:
+                with engine.begin() as connection:
+                    connection.execute(WRITE_QUERY, params)
+            except OperationalError:
+                errors["write"] += 1
+                continue
+            latencies["write"].append((time.perf_counter() - started) * 1000)
+
+    threads = [threading.Thread(target=reader, args=(i,)) for i in range(readers)]
+    threads += [threading.Thread(target=writer, args=(-i - 1,)) for i in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    return {"latencies": {op: np.array(values) for op, values in latencies.items()}, "errors": errors}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--seconds", type=float, default=5, help="Run time per profile")
+    parser.add_argument("--readers", type=int, default=8, help="Reader threads")
+    parser.add_argument("--writers", type=int, default=2, help="Writer threads")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help="Comma separated profiles to run")
+    args = parser.parse_args()
+
+    init_db()
+    print(f"{args.readers} readers, {args.writers} writers, {args.seconds:g} s per profile")
+    print(f"{'profile':<10}{'reads/s':>10}{'read p99':>10}{'writes/s':>10}{'write p99':>11}{'errors':>8}")
+    for name in args.profiles.split(","):
+        directory = tempfile.mkdtemp()
+        try:
+            result = run_profile(PROFILES[name], copy_database(directory), args.readers, args.writers, args.seconds)
+        finally:
+            shutil.rmtree(directory)
+
+        reads, writes = result["latencies"]["read"], result["latencies"]["write"]
+        read_p99 = np.percentile(reads, 99) if len(reads) else float("nan")
+        write_p99 = np.percentile(writes, 99) if len(writes) else float("nan")
+        print(f"{name:<10}{len(reads) / args.seconds:>10.0f}{read_p99:>8.1f}ms{len(writes) / args.seconds:>10.0f}"
+              f"{write_p99:>9.1f}ms{sum(result['errors'].values()):>8}")
+
+
+if __name__ == "__main__":
+    main()
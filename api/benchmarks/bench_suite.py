@@ -0,0 +1,318 @@
+"""
+Run the micro-benchmarks and an in-process load test, and compare the results with a baseline.
+
+Micro-benchmarks time single functions on the bundled CSV files, the fastest of the
+repetitions is kept:
+  calc_profit                 - single and multi-trade profit of Apple's full history
+  calc_profit_multi_tread     - multi-trade profit of Apple's full history
+  import_csv_to_stock_prices  - import of Apple's CSV file into an empty database
+  serialization               - query and JSON encoding of Apple's full price list
+
+The load test sends a fixed mix of requests to every router through the ASGI interface of
+the application, with a number of requests in flight at any time, and reports the throughput
+and the latency percentiles overall and per route. Its bulk upserts change the price store,
+and every write clears the profit cache, so the profit latencies include recalculations and
+vary with the order in which the concurrent requests run.
+
+Everything runs on a temporary copy of the database (`STOCK_API_DB_FILE`, or the default
+`stock_data.db`), which is removed afterwards, so the writes never reach the real database.
+
+All results are flat metrics, written as JSON with --output. With --baseline, every metric is
+compared with the same metric of an earlier run, and the run fails if one of them got worse
+by more than the threshold.
+
+Run from the `api` directory:
+
+    python -m benchmarks.bench_suite [--requests 2000] [--concurrency 32] [--db-mode sync]
+                                     [--output results.json] [--baseline baseline.json] [--threshold 0.2]
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+# The application modules create their engines on import, so they are pointed at the copy first
+SOURCE_DB_FILE = os.environ.get("STOCK_API_DB_FILE", "./stock_data.db")
+BENCH_DB_FILE = os.path.join(tempfile.gettempdir(), f"stock_api_bench_{os.getpid()}.db")
+os.environ["STOCK_API_DB_FILE"] = BENCH_DB_FILE
+
+import httpx
+import numpy as np
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+import profit_engine
+from async_database import dispose_async_engine
+from database import Base, Stock, CSV_DIRECTORY, SessionLocal, engine, init_db, read_price_csv, \
+    import_csv_to_stock_prices
+from fast_json import dumps
+from main import create_app, DB_MODES
+from migrations import stamp
+from price_store import price_store
+from profit_cache import profit_cache
+from routers.api_stock_prices import PriceQuery, select_prices
+
+TICKERS = ("AMZN", "AAPL", "META", "GOOGL", "NFLX")
+
+# A load request: the route it is reported under, the method, the URL and the JSON body
+LoadRequest = Tuple[str, str, str, object]
+
+
+def copy_database(source: str, target: str):
+    """
+    Copy a SQLite database, including the changes still in its WAL file.
+
+    :param source: The database file to copy, if it does not exist the target is built by `init_db`.
+    :param target: The file of the copy.
+    """
+    if not os.path.exists(source):
+        return
+    with sqlite3.connect(source) as connection, sqlite3.connect(target) as copy:
+        connection.backup(copy)
+    connection.close()
+    copy.close()
+
+
+def remove_database(path: str):
+    # The database file with the WAL and shared memory files of the WAL journal
+    engine.dispose()
+    for file in (path, f"{path}-wal", f"{path}-shm"):
+        if os.path.exists(file):
+            os.remove(file)
+
+
+def best_time(func: Callable, repeat: int, setup: Callable = lambda: None) -> float:
+    """
+    Run a function several times and return the fastest wall time in milliseconds.
+
+    :param func: The function to time, it gets the value returned by `setup`.
+    :param repeat: How many times the function is run.
+    :param setup: Prepares every run, it is not timed.
+    :return: The fastest run time in milliseconds.
+    """
+    timings = []
+    for _ in range(repeat):
+        value = setup()
+        started = time.perf_counter()
+        func(value)
+        timings.append((time.perf_counter() - started) * 1000)
+    return min(timings)
+
+
+def run_micro(repeat: int) -> Dict[str, float]:
+    """
+    Time the micro-benchmarks on Apple's prices.
+
+    :param repeat: How many times every function is run.
+    :return: The fastest time of every benchmark in milliseconds, by metric name.
+    """
+    csv_file = os.path.join(CSV_DIRECTORY, "Apple.csv")
+    df = read_price_csv(csv_file)
+    dates = df["date"].to_numpy().astype("datetime64[D]")
+    closes = df["close"].to_numpy(dtype="float64")
+
+    def empty_database():
+        # A new database with the Apple stock in a temporary directory
+        directory = tempfile.mkdtemp()
+        engine = create_engine(f"sqlite:///{os.path.join(directory, 'stock_data.db')}")
+        Base.metadata.create_all(bind=engine)
+        stamp(engine)
+        db = Session(engine)
+        db.add(Stock(name="Apple", ticker="AAPL", inception_date=dates[0].item()))
+        db.commit()
+        return db, directory
+
+    def import_csv(database):
+        db, directory = database
+        import_csv_to_stock_prices(csv_file, "Apple", db)
+        db.close()
+        db.get_bind().dispose()
+        shutil.rmtree(directory)
+
+    with SessionLocal() as db:
+        price_query = PriceQuery(db.query(Stock.id).filter(Stock.ticker == "AAPL").scalar())
+        return {
+            "micro.calc_profit.ms": best_time(lambda _: profit_engine.calc_profit(dates, closes), repeat),
+            "micro.calc_profit_multi_tread.ms": best_time(lambda _: profit_engine.calc_profit_multi_tread(closes),
+                                                          repeat),
+            "micro.import_csv_to_stock_prices.ms": best_time(import_csv, repeat, empty_database),
+            "micro.serialization.ms": best_time(lambda _: dumps(select_prices(db, price_query, None, None)), repeat),
+        }
+
+
+def build_requests(count: int, seed: int) -> List[LoadRequest]:
+    """
+    Build a reproducible mix of requests covering the stock, price and profit routers.
+
+    Writes upsert prices in 2040, into the temporary copy of the database.
+
+    :param count: The number of requests.
+    :param seed: The seed of the random choices.
+    :return: The requests.
+    """
+    rng = random.Random(seed)
+    routes = [
+        (10, lambda t, y: ("GET /stocks/", "GET", "/stocks/", None)),
+        (10, lambda t, y: ("GET /stocks/{ticker}", "GET", f"/stocks/{t}", None)),
+        (15, lambda t, y: ("GET /prices/{ticker}", "GET", f"/prices/{t}?start={y}-01-01&limit=100", None)),
+        (3, lambda t, y: ("GET /prices/{ticker}?format", "GET", f"/prices/{t}?start={y}-01-01&format=arrow", None)),
+        (10, lambda t, y: ("GET /prices/{ticker}/{date}", "GET",
+                           f"/prices/{t}/0{rng.randint(1, 9)}/1{rng.randint(0, 9)}/{y}", None)),
+        (5, lambda t, y: ("GET /prices/{ticker}/bars", "GET", f"/prices/{t}/bars?period=week&start={y}-01-01", None)),
+        (5, lambda t, y: ("GET /prices/{ticker}/indicators", "GET",
+                          f"/prices/{t}/indicators/{rng.choice(('sma', 'rsi', 'vwap'))}?start={y}-01-01", None)),
+        (2, lambda t, y: ("GET /prices/export", "GET", f"/prices/export?start={y}-01-01&end={y}-03-31", None)),
+        (3, lambda t, y: ("POST /prices/{ticker}/bulk", "POST", f"/prices/{t}/bulk", [
+            {"date": f"2040-01-0{rng.randint(2, 6)}", "open": 1.0, "high": 2.0, "low": 0.5, "close": rng.random(),
+             "adj_close": 1.0, "volume": 10}])),
+        (30, lambda t, y: ("POST /profit/", "POST", "/profit/",
+                           {"ticker": t, "start_date": f"0{rng.randint(1, 6)}/01/{y}", "end_date": f"12/01/{y}"})),
+        (2, lambda t, y: ("POST /profit/batch", "POST", "/profit/batch", [
+            {"ticker": ticker, "start_date": f"01/01/{y}", "end_date": f"12/31/{y}"} for ticker in TICKERS])),
+        (5, lambda t, y: ("GET /health", "GET", "/", None)),
+    ]
+    weights = [weight for weight, _ in routes]
+    builders = [builder for _, builder in routes]
+    return [rng.choices(builders, weights)[0](rng.choice(TICKERS), rng.randint(2013, 2019)) for _ in range(count)]
+
+
+async def run_load(db_mode: str, requests: List[LoadRequest], concurrency: int) -> Dict[str, float]:
+    """
+    Send the requests to the application with a fixed number of concurrent clients.
+
+    :param db_mode: The database mode of the application.
+    :param requests: The requests to send.
+    :param concurrency: The number of requests in flight at any time.
+    :return: The throughput, error count and latency percentiles in milliseconds, by metric name.
+    """
+    transport = httpx.ASGITransport(app=create_app(db_mode), raise_app_exceptions=False)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors = 0
+    pending = iter(requests)
+
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for route, method, url, body in pending:
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            latencies[route].append((time.perf_counter() - started) * 1000)
+            errors += response.status_code >= 500
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+    if db_mode == "async":
+        await dispose_async_engine()
+
+    everything = np.concatenate([np.array(values) for values in latencies.values()])
+    metrics = {"load.throughput.rps": len(everything) / elapsed, "load.errors.count": errors}
+    for route, values in [("all", everything), *sorted(latencies.items())]:
+        p50, p90, p99 = np.percentile(values, [50, 90, 99])
+        metrics.update({f"load.{route}.p50_ms": p50, f"load.{route}.p90_ms": p90, f"load.{route}.p99_ms": p99})
+    return metrics
+
+
+def is_regression(name: str, baseline: float, value: float, threshold: float) -> bool:
+    """
+    Check if a metric got worse than its baseline by more than the threshold.
+
+    Throughputs ("rps") are better when higher, times and error counts when lower.
+
+    :param name: The metric name.
+    :param baseline: The value of the baseline run.
+    :param value: The value of this run.
+    :param threshold: The allowed relative change, e.g. 0.2 for 20 %.
+    :return: True if the metric regressed.
+    """
+    if name.endswith(".rps"):
+        return value < baseline * (1 - threshold)
+    if name.endswith(".count"):
+        return value > baseline
+    return value > baseline * (1 + threshold)
+
+
+def compare(metrics: Dict[str, float], baseline: Dict[str, float], threshold: float) -> List[str]:
+    """
+    Print every metric next to its baseline and list the regressions.
+
+    :param metrics: The metrics of this run.
+    :param baseline: The metrics of the baseline run, metrics missing in either run are skipped.
+    :param threshold: The allowed relative change.
+    :return: The names of the regressed metrics.
+    """
+    regressions = []
+    print(f"\n{'metric':<58}{'baseline':>12}{'current':>12}{'change':>9}")
+    for name in sorted(set(metrics) & set(baseline)):
+        change = (metrics[name] - baseline[name]) / baseline[name] if baseline[name] else 0.0
+        regressed = is_regression(name, baseline[name], metrics[name], threshold)
+        if regressed:
+            regressions.append(name)
+        print(f"{name:<58}{baseline[name]:>12.2f}{metrics[name]:>12.2f}{change:>+8.0%}"
+              f"{'  REGRESSION' if regressed else ''}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per micro-benchmark, the fastest one is kept")
+    parser.add_argument("--requests", type=int, default=2000, help="Requests of the load test, 0 to skip it")
+    parser.add_argument("--concurrency", type=int, default=32, help="Requests in flight at any time")
+    parser.add_argument("--db-mode", choices=DB_MODES, default="sync", help="Database mode of the load test")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the request mix")
+    parser.add_argument("--output", help="Write the results to this JSON file")
+    parser.add_argument("--baseline", help="Compare with the results of an earlier run")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Allowed relative regression")
+    args = parser.parse_args()
+
+    copy_database(SOURCE_DB_FILE, BENCH_DB_FILE)
+    try:
+        init_db()
+        with SessionLocal() as db:
+            price_store.load(db)
+
+        metrics = run_micro(args.repeat)
+        if args.requests:
+            profit_cache.clear()
+            metrics.update(asyncio.run(run_load(args.db_mode, build_requests(args.requests, args.seed),
+                                                args.concurrency)))
+    finally:
+        remove_database(BENCH_DB_FILE)
+    for name, value in metrics.items():
+        print(f"{name:<58}{value:>12.2f}")
+
+    results = {
+        "meta": {
+            "created": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "requests": args.requests,
+            "concurrency": args.concurrency,
+            "db_mode": args.db_mode,
+        },
+        "metrics": metrics,
+    }
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)["metrics"]
+        regressions = compare(metrics, baseline, args.threshold)
+        if regressions:
+            print(f"\n{len(regressions)} metrics regressed by more than {args.threshold:.0%}")
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
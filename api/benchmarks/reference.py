@@ -0,0 +1,160 @@
+import os
+from collections import namedtuple
+from datetime import datetime
+from typing import List, Dict
+import pandas as pd
+from sqlalchemy.orm import Session
+from database import Stock, StockPrice
+
+
+# Minimal stand-in for the `StockPrice` rows the original implementation worked on
+PriceRow = namedtuple("PriceRow", ["date", "close"])
+
+
+def calc_profit_multi_tread(prices: List[PriceRow]) -> float:
+    """
+    Original loop based multi-trade profit, kept as a baseline for parity tests and benchmarks.
+
+    :param prices: A list of price rows sorted by date.
+    :return: The maximum multi-trade profit.
+    """
+    max_multi_trade_profit: float = 0
+    bought_price: float = 0
+    for i in range(len(prices) - 1):
+        if prices[i].close == prices[i + 1].close:
+            continue
+
+        # Buy
+        if bought_price == 0:
+            if prices[i].close < prices[i + 1].close:
+                bought_price = prices[i].close
+        # Sell
+        elif prices[i].close > prices[i + 1].close:
+            max_multi_trade_profit += float(prices[i].close) - bought_price
+            bought_price = 0
+    # Sell last day
+    if bought_price != 0 and bought_price < prices[-1].close:
+        max_multi_trade_profit += prices[-1].close - bought_price
+
+    return max_multi_trade_profit
+
+
+def calc_profit(prices: List[PriceRow]) -> Dict:
+    """
+    Original O(n²) single and multi-trade profit, kept as a baseline for parity tests and benchmarks.
+
+    :param prices: A list of price rows sorted by date.
+    :return: A dictionary with profit details for a single trade and multi-trade profit.
+    """
+    if not prices:
+        return {"detail": "No price data available for the given range"}
+
+    result = {
+        "buy_date": prices[0].date,
+        "sell_date": prices[0].date,
+        "buy_close": float('inf'),
+        "sell_close": .0,
+        "profit": .0,
+        "max_multi_trade_profit": .0,
+        "stocks_with_better_profit": ""
+    }
+
+    # Calculate profit with single trade
+    counter: int = 0
+    for price_buy in prices[:-1]:
+        counter += 1
+        if price_buy.close < result["buy_close"]:
+            # Find max profit
+            for price_sell in prices[counter:]:
+                new_profit = price_sell.close - price_buy.close
+                if new_profit > result["profit"]:
+                    # Save if new profit is better
+                    result["buy_date"] = price_buy.date
+                    result["sell_date"] = price_sell.date
+                    result["buy_close"] = price_buy.close
+                    result["sell_close"] = price_sell.close
+                    result["profit"] = new_profit
+
+    # Calculate profit with multi trade
+    result["max_multi_trade_profit"] = calc_profit_multi_tread(prices)
+
+    return result
+
+
+def add_stocks(db: Session):
+    """
+    Original stock registration with one commit per stock, kept as a baseline for benchmarks.
+
+    :param db: The database session used to commit the stock data to the database.
+    """
+    company_data = {
+        "Amazon": {"ticker": "AMZN", "inception_date": "1997-05-15"},
+        "Apple": {"ticker": "AAPL", "inception_date": "1976-04-01"},
+        "Facebook": {"ticker": "META", "inception_date": "2004-02-04"},
+        "Google": {"ticker": "GOOGL", "inception_date": "1998-09-04"},
+        "Netflix": {"ticker": "NFLX", "inception_date": "1997-08-29"},
+    }
+
+    for name, info in company_data.items():
+        stock = Stock(
+            name=name,
+            ticker=info["ticker"],
+            inception_date=datetime.strptime(info["inception_date"], "%Y-%m-%d").date()
+        )
+        db.add(stock)
+        db.commit()
+
+
+def import_csv_to_stock_prices(csv_file_path: str, company_name: str, db: Session):
+    """
+    Original row by row CSV import, kept as a baseline for benchmarks.
+
+    :param csv_file_path: The path to the CSV file containing the stock price data.
+    :param company_name: The name of the company whose stock prices are being imported.
+    :param db: The database session used to insert the stock price data into the database.
+    """
+    # Read the CSV file
+    df = pd.read_csv(csv_file_path)
+
+    # Check if all columns exists
+    required_columns = {"Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"}
+    if not required_columns.issubset(df.columns):
+        return
+
+    # Check if Stock exists
+    stock = db.query(Stock).filter(Stock.name == company_name).first()
+    if not stock:
+        return
+
+    # Drop NaN rows
+    df.dropna(inplace=True)
+
+    # Add data into DB
+    for _, row in df.iterrows():
+        stock_price = StockPrice(
+            stock_id=stock.id,
+            date=datetime.strptime(row["Date"], "%Y-%m-%d").date(),
+            open=row["Open"],
+            high=row["High"],
+            low=row["Low"],
+            close=row["Close"],
+            adj_close=row["Adj Close"],
+            volume=int(row["Volume"]),
+        )
+        db.add(stock_price)
+
+    # Commit the changes
+    db.commit()
+
+
+def populate_db(db: Session, csv_directory: str):
+    """
+    Original database fill from `init_db`, kept as a baseline for benchmarks.
+
+    :param db: The database session used to fill the database.
+    :param csv_directory: The directory with one "<Company name>.csv" file per stock.
+    """
+    add_stocks(db)
+    for file in os.listdir(csv_directory):
+        if file.endswith(".csv"):
+            import_csv_to_stock_prices(os.path.join(csv_directory, file), os.path.splitext(file)[0], db)
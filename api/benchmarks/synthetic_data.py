@@ -0,0 +1,281 @@
+"""
+Generate synthetic stock prices for scale testing.
+
+Writes a CSV directory that `init_db` reads like the bundled one: the bundled CSV files, one
+CSV file per synthetic stock in the same schema, and a `stocks.csv` registry of all stocks
+(see `database.read_stock_registry`). The directory can also be loaded into a new SQLite
+database right away.
+
+Every synthetic stock trades on the weekdays without NYSE holidays, lists on its own day,
+may delist, and misses single days and longer trading halts. Its close prices follow a
+random walk with fat-tailed daily returns and its own drift and volatility, the adjusted
+close includes a dividend yield, and the volume grows with the size of the price moves.
+The output only depends on the arguments, stocks are seeded one by one, so every stock
+is the same for any number of stocks or workers.
+
+`--scale` sets the size as a multiple of the bundled rows, e.g. 10, 100 or 1000, and
+`--tickers` sets the number of synthetic stocks instead.
+
+Run from the `api` directory:
+
+    python -m benchmarks.synthetic_data --output ./synthetic_10x [--scale 10 | --tickers N] [--db ./synthetic_10x.db]
+                                        [--start 2000-01-01] [--end 2019-12-31] [--seed 42] [--workers N]
+
+Then run the application or any benchmark on it:
+
+    STOCK_API_CSV_DIRECTORY=./synthetic_10x STOCK_API_DB_FILE=./synthetic_10x.db python -m benchmarks.bench_suite
+"""
+import argparse
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from typing import Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from pandas.tseries.holiday import (AbstractHolidayCalendar, GoodFriday, Holiday, nearest_workday, USLaborDay,
+                                    USMartinLutherKingJr, USMemorialDay, USPresidentsDay, USThanksgivingDay)
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from database import (Base, CSV_COLUMNS, STOCKS, STOCK_REGISTRY_FILE, REGISTRY_COLUMNS, populate_db,
+                      read_price_csv)
+from migrations import stamp
+
+# The bundled CSV files, copied into every synthetic directory
+BUNDLED_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv_files")
+
+DEFAULT_START = "2000-01-01"
+DEFAULT_END = "2019-12-31"
+TRADING_DAYS = 252
+
+# Synthetic tickers are "X" and four letters, which no predefined ticker is
+TICKER_PREFIX = "X"
+TICKER_LETTERS = 4
+
+
+class TradingCalendar(AbstractHolidayCalendar):
+    """
+    The NYSE holidays, weekend holidays are observed on the nearest weekday.
+    """
+    rules = [
+        Holiday("New Year's Day", month=1, day=1, observance=nearest_workday),
+        USMartinLutherKingJr,
+        USPresidentsDay,
+        GoodFriday,
+        USMemorialDay,
+        Holiday("Juneteenth", month=6, day=19, start_date="2022-01-01", observance=nearest_workday),
+        Holiday("Independence Day", month=7, day=4, observance=nearest_workday),
+        USLaborDay,
+        USThanksgivingDay,
+        Holiday("Christmas Day", month=12, day=25, observance=nearest_workday),
+    ]
+
+
+def trading_days(start: str, end: str) -> np.ndarray:
+    """
+    Get the trading days between two dates.
+
+    :param start: The first date, "YYYY-MM-DD".
+    :param end: The last date, "YYYY-MM-DD".
+    :return: The weekdays without holidays as a `datetime64[D]` array.
+    """
+    holidays = TradingCalendar().holidays(start, end)
+    return pd.bdate_range(start, end, freq="C", holidays=holidays).to_numpy().astype("datetime64[D]")
+
+
+def synthetic_ticker(index: int) -> str:
+    """
+    Get the ticker of a synthetic stock: "XAAAA", "XAAAB", ...
+
+    :param index: The index of the synthetic stock.
+    :return: The ticker.
+    """
+    letters = []
+    for _ in range(TICKER_LETTERS):
+        index, letter = divmod(index, 26)
+        letters.append(chr(ord("A") + letter))
+    return TICKER_PREFIX + "".join(reversed(letters))
+
+
+def plan_stock(index: int, calendar: np.ndarray, seed: int) -> Tuple[np.random.Generator, np.ndarray, str]:
+    """
+    Draw the trading days and the inception date of a synthetic stock.
+
+    :param index: The index of the synthetic stock.
+    :param calendar: The trading days, see `trading_days`.
+    :param seed: The seed of the data set.
+    :return: The random generator of the stock for its prices, the positions of the calendar
+             it has prices for, and its inception date as "YYYY-MM-DD".
+    """
+    rng = np.random.default_rng((seed, index))
+    length = len(calendar)
+
+    # A third of the stocks trade on the first day, the others list later, some delist
+    listing = 0 if rng.random() < 1 / 3 else int(rng.integers(0, int(length * 0.8)))
+    delisting = length if rng.random() < 0.9 else int(rng.integers(listing + (length - listing) // 5, length))
+    listed = np.zeros(length, dtype=bool)
+    listed[listing:delisting] = True
+
+    # Single missing days and trading halts of 2 to 15 days
+    listed &= rng.random(length) >= 0.002
+    for _ in range(rng.poisson(1.0)):
+        halt = int(rng.integers(listing, delisting))
+        listed[halt:halt + int(rng.integers(2, 16))] = False
+    listed[listing] = True
+
+    inception_date = calendar[listing] - int(rng.integers(0, 10 * 365))
+    return rng, np.flatnonzero(listed), str(inception_date)
+
+
+def generate_prices(rng: np.random.Generator, calendar: np.ndarray, positions: np.ndarray) -> pd.DataFrame:
+    """
+    Generate the prices of a synthetic stock.
+
+    The close prices are simulated on every calendar day from the listing on, so the price
+    moves across missing days and halts are as large as they would be.
+
+    :param rng: The random generator of the stock, returned by `plan_stock`.
+    :param calendar: The trading days, see `trading_days`.
+    :param positions: The positions of the calendar the stock has prices for.
+    :return: The prices with the columns of the bundled CSV files.
+    """
+    first, length = positions[0], positions[-1] - positions[0] + 1
+
+    # Fat-tailed daily log returns (Student's t with unit variance) around the yearly drift
+    drift, volatility = rng.normal(0.07, 0.1), rng.uniform(0.15, 0.6)
+    daily = volatility / np.sqrt(TRADING_DAYS)
+    returns = (drift - volatility ** 2 / 2) / TRADING_DAYS + daily * rng.standard_t(4, size=length) / np.sqrt(2)
+    close = np.exp(rng.uniform(np.log(5), np.log(500)) + np.cumsum(returns))
+
+    # Opens gap from the previous close, highs and lows stretch beyond the open and the close
+    previous = np.concatenate(([close[0]], close[:-1]))
+    open_ = previous * np.exp(rng.normal(0, 0.3 * daily, size=length))
+    high = np.maximum(open_, close) * np.exp(np.abs(rng.normal(0, 0.5 * daily, size=length)))
+    low = np.minimum(open_, close) * np.exp(-np.abs(rng.normal(0, 0.5 * daily, size=length)))
+
+    # Half of the stocks pay dividends, which lower the adjusted close of earlier days
+    dividend_yield = rng.uniform(0, 0.03) if rng.random() < 0.5 else 0.0
+    years_to_end = (length - 1 - np.arange(length)) / TRADING_DAYS
+    adj_close = close * np.exp(-dividend_yield * years_to_end)
+    volume = np.exp(rng.uniform(np.log(1e5), np.log(5e7)) + rng.normal(0, 0.4, size=length))
+    volume *= 1 + 20 * np.abs(returns)
+
+    kept = positions - first
+    prices = {
+        "Date": calendar[positions],
+        **{name: np.round(np.maximum(values[kept], 0.01), 6) for name, values in (
+            ("Open", open_), ("High", high), ("Low", low), ("Close", close), ("Adj Close", adj_close))},
+        "Volume": volume[kept].astype(np.int64),
+    }
+    return pd.DataFrame(prices, columns=list(CSV_COLUMNS))
+
+
+def write_stock(directory: str, calendar: np.ndarray, seed: int, name: str, index: int) -> int:
+    """
+    Generate a synthetic stock and write its CSV file.
+
+    :param directory: The output directory.
+    :param calendar: The trading days, see `trading_days`.
+    :param seed: The seed of the data set.
+    :param name: The company name, which is the file name.
+    :param index: The index of the synthetic stock.
+    :return: The number of written rows.
+    """
+    rng, positions, _ = plan_stock(index, calendar, seed)
+    df = generate_prices(rng, calendar, positions)
+    df.to_csv(os.path.join(directory, f"{name}.csv"), index=False, float_format="%.6f")
+    return len(df)
+
+
+def write_dataset(directory: str, scale: float = 10, tickers: Optional[int] = None,
+                  start: str = DEFAULT_START, end: str = DEFAULT_END, seed: int = 42,
+                  workers: Optional[int] = None) -> Dict[str, Dict[str, str]]:
+    """
+    Write the bundled and the synthetic stocks into a CSV directory with a stock registry.
+
+    :param directory: The output directory, created if needed.
+    :param scale: The total number of rows as a multiple of the bundled rows, at least one synthetic stock more.
+    :param tickers: The number of synthetic stocks, instead of `scale`.
+    :param start: The first trading day of the synthetic stocks, "YYYY-MM-DD".
+    :param end: The last trading day of the synthetic stocks, "YYYY-MM-DD".
+    :param seed: The seed of the data set.
+    :param workers: The number of processes writing CSV files, defaults to the CPU count.
+    :return: All stocks by company name, shaped like `database.STOCKS`.
+    """
+    os.makedirs(directory, exist_ok=True)
+    registry = dict(STOCKS)
+    rows = 0
+    for name in STOCKS:
+        shutil.copy(os.path.join(BUNDLED_DIRECTORY, f"{name}.csv"), directory)
+        rows += len(read_price_csv(os.path.join(directory, f"{name}.csv")))
+
+    # Add stocks until there are enough of them or enough rows
+    calendar = trading_days(start, end)
+    limit, target = (np.inf, rows * scale) if tickers is None else (tickers, np.inf)
+    synthetic = []
+    while len(synthetic) < limit and rows < target:
+        index = len(synthetic)
+        _, positions, inception_date = plan_stock(index, calendar, seed)
+        ticker = synthetic_ticker(index)
+        synthetic.append(f"Synthetic {ticker}")
+        registry[synthetic[-1]] = {"ticker": ticker, "inception_date": inception_date}
+        rows += len(positions)
+
+    # Generate the prices in parallel, every stock has its own random generator
+    write = partial(write_stock, directory, calendar, seed)
+    workers = max(1, min(workers or os.cpu_count() or 1, len(synthetic)))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            chunksize = max(1, len(synthetic) // (4 * workers))
+            list(executor.map(write, synthetic, range(len(synthetic)), chunksize=chunksize))
+    else:
+        list(map(write, synthetic, range(len(synthetic))))
+
+    pd.DataFrame([(name, info["ticker"], info["inception_date"]) for name, info in registry.items()],
+                 columns=list(REGISTRY_COLUMNS)).to_csv(os.path.join(directory, STOCK_REGISTRY_FILE), index=False)
+    return registry
+
+
+def seed_database(db_file: str, csv_directory: str, workers: Optional[int] = None):
+    """
+    Create a new SQLite database and fill it from a CSV directory, like `init_db` does.
+
+    :param db_file: The path of the new database file.
+    :param csv_directory: The directory written by `write_dataset`.
+    :param workers: The number of processes parsing CSV files, defaults to the CPU count.
+    """
+    if os.path.exists(db_file):
+        raise FileExistsError(f"Database file already exists: {db_file}")
+    engine = create_engine(f"sqlite:///{db_file}")
+    Base.metadata.create_all(bind=engine)
+    stamp(engine)
+    with Session(engine) as db:
+        populate_db(db, csv_directory, workers)
+    engine.dispose()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", required=True, help="Directory of the CSV files")
+    size = parser.add_mutually_exclusive_group()
+    size.add_argument("--scale", type=float, default=10, help="Total rows as a multiple of the bundled rows")
+    size.add_argument("--tickers", type=int, help="Number of synthetic stocks")
+    parser.add_argument("--start", default=DEFAULT_START, help="First trading day of the synthetic stocks")
+    parser.add_argument("--end", default=DEFAULT_END, help="Last trading day of the synthetic stocks")
+    parser.add_argument("--seed", type=int, default=42, help="Seed of the data set")
+    parser.add_argument("--workers", type=int, default=os.cpu_count(), help="Processes writing and parsing files")
+    parser.add_argument("--db", help="Also create this SQLite database from the CSV files")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    registry = write_dataset(args.output, args.scale, args.tickers, args.start, args.end, args.seed, args.workers)
+    print(f"Wrote {len(registry)} stocks to {args.output} in {time.perf_counter() - started:.1f} s")
+    if args.db:
+        started = time.perf_counter()
+        seed_database(args.db, args.output, args.workers)
+        print(f"Created {args.db} in {time.perf_counter() - started:.1f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,61 @@
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
+from typing import Dict, Optional
+import multiprocessing
+import threading
 import pandas as pd
-from sqlalchemy import create_engine, Column, Integer, String, ForeignKey, Date, Float
+from sqlalchemy import create_engine, insert, Column, Integer, String, ForeignKey, Date, Float, Index
 from sqlalchemy.orm import sessionmaker, declarative_base, relationship, Session
+from metrics import METRICS_ENABLED, instrument_engine
+from migrations import migrate, stamp
+from profit_engine import PRICE_DECIMALS
+from query_log import track_queries
+from storage_profile import StorageProfile
 import os
 
-# SQLite
-DB_FILE_PATH = './stock_data.db'
+# SQLite, tuned by the storage profile from the environment
+DB_FILE_PATH = os.environ.get("STOCK_API_DB_FILE", './stock_data.db')
 DATABASE_URL = f'sqlite:///{DB_FILE_PATH}'
-engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False})
+STORAGE_PROFILE = StorageProfile.from_env()
+engine = create_engine(DATABASE_URL, connect_args={'check_same_thread': False}, **STORAGE_PROFILE.engine_options())
+STORAGE_PROFILE.apply(engine)
+track_queries(engine)
+if METRICS_ENABLED:
+    instrument_engine(engine)
+
+# CSV files with the initial stock prices, and their columns mapped to `StockPrice` attributes
+CSV_DIRECTORY = os.environ.get("STOCK_API_CSV_DIRECTORY", "./csv_files")
+CSV_COLUMNS = {
+    "Date": "date",
+    "Open": "open",
+    "High": "high",
+    "Low": "low",
+    "Close": "close",
+    "Adj Close": "adj_close",
+    "Volume": "volume",
+}
+
+# The predefined stocks by company name, the name is also the name of the stock's CSV file
+STOCKS = {
+    "Amazon": {"ticker": "AMZN", "inception_date": "1997-05-15"},
+    "Apple": {"ticker": "AAPL", "inception_date": "1976-04-01"},
+    "Facebook": {"ticker": "META", "inception_date": "2004-02-04"},
+    "Google": {"ticker": "GOOGL", "inception_date": "1998-09-04"},
+    "Netflix": {"ticker": "NFLX", "inception_date": "1997-08-29"},
+}
+
+# Optional file in a CSV directory listing its stocks, replacing `STOCKS`
+STOCK_REGISTRY_FILE = "stocks.csv"
+REGISTRY_COLUMNS = ("Name", "Ticker", "Inception Date")
 
 # Create the session
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 Base = declarative_base()
 
+# Guards the one-time database initialization
+_init_lock = threading.Lock()
+_initialized = False
+
 
 def get_db():
     """
@@ -24,7 +67,7 @@ def get_db():
 
     :return: A session object that connects to the database.
     """
-    # Init the database
+    # Init the database, this only checks a flag once the startup event has done it
     init_db()
 
     # Start the session
@@ -35,32 +78,89 @@ def get_db():
         db.close()
 
 
-def add_stocks(db: Session):
+def read_stock_registry(csv_directory: str) -> Dict[str, Dict[str, str]]:
     """
-    Add predefined stocks to the database.
+    Read the stocks of a CSV directory.
+
+    A directory can list its stocks in a `STOCK_REGISTRY_FILE` with the "Name", "Ticker" and
+    "Inception Date" columns, e.g. one written by `benchmarks.synthetic_data`. Without it,
+    the directory holds the predefined `STOCKS`.
+
+    :param csv_directory: The directory with one "<Company name>.csv" file per stock.
+    :return: The stocks by company name, shaped like `STOCKS`.
+    """
+    registry_path = os.path.join(csv_directory, STOCK_REGISTRY_FILE)
+    if not os.path.exists(registry_path):
+        return STOCKS
+
+    df = pd.read_csv(registry_path, dtype=str, keep_default_na=False)
+    return {name: {"ticker": ticker, "inception_date": inception_date}
+            for name, ticker, inception_date in df[list(REGISTRY_COLUMNS)].itertuples(index=False)}
 
-    This function inserts several predefined stocks into the database, along with their
-    ticker symbols and inception dates. The stock data is hardcoded in the function.
 
-    :param db: The database session used to commit the stock data to the database.
+def add_stocks(db: Session, stocks: Optional[Dict[str, Dict[str, str]]] = None):
     """
-    company_data = {
-        "Amazon": {"ticker": "AMZN", "inception_date": "1997-05-15"},
-        "Apple": {"ticker": "AAPL", "inception_date": "1976-04-01"},
-        "Facebook": {"ticker": "META", "inception_date": "2004-02-04"},
-        "Google": {"ticker": "GOOGL", "inception_date": "1998-09-04"},
-        "Netflix": {"ticker": "NFLX", "inception_date": "1997-08-29"},
-    }
+    Add predefined stocks to the database.
+
+    This function inserts the stocks into the database, along with their ticker symbols
+    and inception dates. By default these are the predefined `STOCKS`.
+    The caller commits the stocks together with the rest of the initial data.
 
-    for name, info in company_data.items():
+    :param db: The database session used to add the stock data to the database.
+    :param stocks: The stocks by company name, shaped like `STOCKS`. Defaults to `STOCKS`.
+    """
+    for name, info in (stocks or STOCKS).items():
         stock = Stock(
             name=name,
             ticker=info["ticker"],
             inception_date=datetime.strptime(info["inception_date"], "%Y-%m-%d").date()
         )
         db.add(stock)
-        db.commit()
         print(f"Stock '{name}' added to the database.")
+    db.flush()
+
+
+def read_price_csv(csv_file_path: str) -> Optional[pd.DataFrame]:
+    """
+    Read and validate a CSV file with stock prices.
+
+    The file must have the "Date", "Open", "High", "Low", "Close", "Adj Close" and "Volume"
+    columns. Rows with missing values are dropped, the dates are parsed in one vectorized
+    step and the columns are renamed to the `StockPrice` attribute names.
+
+    This function does not use the database, so it can run in a worker process.
+
+    :param csv_file_path: The path to the CSV file containing the stock price data.
+    :return: A DataFrame with the stock prices, or None if required columns are missing.
+    """
+    # Read the CSV file
+    df = pd.read_csv(csv_file_path)
+
+    # Check if all columns exists
+    if not set(CSV_COLUMNS).issubset(df.columns):
+        print(f"CSV file {csv_file_path} is missing required columns: {set(CSV_COLUMNS)}")
+        return None
+
+    # Drop NaN rows and convert the columns
+    df = df[list(CSV_COLUMNS)].dropna().rename(columns=CSV_COLUMNS)
+    df["date"] = pd.to_datetime(df["date"], format="%Y-%m-%d").dt.date
+    prices = ["open", "high", "low", "close", "adj_close"]
+    df[prices] = df[prices].round(PRICE_DECIMALS)
+    df["volume"] = df["volume"].astype("int64")
+    return df
+
+
+def insert_stock_prices(df: pd.DataFrame, stock_id: int, db: Session):
+    """
+    Insert the stock prices of one stock with a single bulk INSERT statement.
+
+    :param df: A DataFrame returned by `read_price_csv`.
+    :param stock_id: The ID of the stock the prices belong to.
+    :param db: The database session used to insert the stock price data into the database.
+    """
+    if df.empty:
+        return
+    db.execute(insert(StockPrice), df.assign(stock_id=stock_id).to_dict("records"))
 
 
 def import_csv_to_stock_prices(csv_file_path: str, company_name: str, db: Session):
@@ -75,13 +175,8 @@ def import_csv_to_stock_prices(csv_file_path: str, company_name: str, db: Sessio
     :param company_name: The name of the company whose stock prices are being imported.
     :param db: The database session used to insert the stock price data into the database.
     """
-    # Read the CSV file
-    df = pd.read_csv(csv_file_path)
-
-    # Check if all columns exists
-    required_columns = {"Date", "Open", "High", "Low", "Close", "Adj Close", "Volume"}
-    if not required_columns.issubset(df.columns):
-        print(f"CSV file {csv_file_path} is missing required columns: {required_columns}")
+    df = read_price_csv(csv_file_path)
+    if df is None:
         return
 
     # Check if Stock exists
@@ -89,22 +184,53 @@ def import_csv_to_stock_prices(csv_file_path: str, company_name: str, db: Sessio
     if not stock:
         return
 
-    # Drop NaN rows
-    df.dropna(inplace=True)
-
     # Add data into DB
-    for _, row in df.iterrows():
-        stock_price = StockPrice(
-            stock_id=stock.id,
-            date=datetime.strptime(row["Date"], "%Y-%m-%d").date(),
-            open=row["Open"],
-            high=row["High"],
-            low=row["Low"],
-            close=row["Close"],
-            adj_close=row["Adj Close"],
-            volume=int(row["Volume"]),
-        )
-        db.add(stock_price)
+    insert_stock_prices(df, stock.id, db)
+
+    # Commit the changes
+    db.commit()
+
+
+def populate_db(db: Session, csv_directory: str = CSV_DIRECTORY, workers: Optional[int] = None):
+    """
+    Fill an empty database with the predefined stocks and their prices from CSV files.
+
+    The stocks come from the registry of the directory (see `read_stock_registry`). The CSV
+    files are parsed in parallel in a process pool, and all stocks and prices are written
+    in a single transaction. The pool spawns fresh interpreters instead of forking, because
+    the server calls this from a warm-up thread of a multithreaded process, and a fork can
+    copy a lock held by another thread into the child and deadlock it.
+
+    :param db: The database session used to fill the database.
+    :param csv_directory: The directory with one "<Company name>.csv" file per stock.
+    :param workers: The number of processes parsing CSV files, defaults to the CPU count.
+                    With 1 worker, the files are parsed in the current process.
+    """
+    # Add Stocks info
+    add_stocks(db, read_stock_registry(csv_directory))
+    stock_ids = dict(db.query(Stock.name, Stock.id).all())
+
+    # Find the CSV files of the known stocks, the company name is the file name
+    files = {}
+    for file in sorted(os.listdir(csv_directory)):
+        company_name, extension = os.path.splitext(file)
+        if extension == ".csv" and company_name in stock_ids:
+            files[company_name] = os.path.join(csv_directory, file)
+
+    # Parse the CSV files
+    workers = min(workers or os.cpu_count() or 1, len(files))
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as executor:
+            frames = executor.map(read_price_csv, files.values(), chunksize=max(1, len(files) // (4 * workers)))
+            frames = dict(zip(files, frames))
+    else:
+        frames = {company_name: read_price_csv(path) for company_name, path in files.items()}
+
+    # Add CSV files into base
+    for company_name, df in frames.items():
+        if df is not None:
+            print(f"Importing data for {company_name} from {files[company_name]}...")
+            insert_stock_prices(df, stock_ids[company_name], db)
 
     # Commit the changes
     db.commit()
@@ -114,38 +240,44 @@ def init_db():
     """
     Initialize the database by creating tables and importing stock data.
 
-    This function checks if the database already exists. If it doesn't, it creates the tables
-    and populates the database with predefined stock data and stock prices from CSV files
-    located in the "csv_files" directory.
+    This function checks if the database already exists. If it does, pending schema migrations
+    are applied to it. If it doesn't, it creates the tables and populates the database with
+    predefined stock data and stock prices from CSV files located in `CSV_DIRECTORY`
+    ("csv_files" unless `STOCK_API_CSV_DIRECTORY` is set).
 
     This function is intended to be used to set up the database during the initial setup.
+    It does the work only once per process, concurrent callers wait until it is finished.
+    If filling a new database fails, the database is removed and the next call starts over.
     """
-    # Check if DB file exists
-    if os.path.exists(DB_FILE_PATH):
+    global _initialized
+    if _initialized:
         return
 
-    # Create DB
-    Base.metadata.create_all(bind=engine)
-
-    # Fill DB
-    csv_directory = "./csv_files"
-    with SessionLocal() as db:
-        # Add Stocks info
-        add_stocks(db)
-
-        # Add CSV files into base
-        for file in os.listdir(csv_directory):
-            # Avoid non CSV files
-            if not file.endswith(".csv"):
-                continue
-
-            # Derive the company name from the file name
-            company_name = os.path.splitext(file)[0]
-            file_path = os.path.join(csv_directory, file)
-
-            # Import the CSV into its own table
-            print(f"Importing data for {company_name} from {file_path}...")
-            import_csv_to_stock_prices(file_path, company_name, db)
+    with _init_lock:
+        if _initialized:
+            return
+
+        # Check if DB file exists
+        if os.path.exists(DB_FILE_PATH):
+            migrate(engine)
+        else:
+            try:
+                # Create DB
+                Base.metadata.create_all(bind=engine)
+                stamp(engine)
+
+                # Fill DB
+                with SessionLocal() as db:
+                    populate_db(db)
+            except Exception:
+                # Remove the partly created DB, so the next call creates it again instead of migrating it
+                engine.dispose()
+                for path in (DB_FILE_PATH, f"{DB_FILE_PATH}-wal", f"{DB_FILE_PATH}-shm"):
+                    if os.path.exists(path):
+                        os.remove(path)
+                raise
+
+        _initialized = True
 
 
 class Stock(Base):
@@ -192,8 +324,14 @@ class StockPrice(Base):
         adj_close: The adjusted closing price, accounting for splits, dividends, etc.
         volume: The trading volume for the stock on the given date.
         stock: The relationship to the `Stock` model, which provides the stock this price belongs to.
+
+    A stock has at most one price per date, enforced by a unique index on (stock_id, date)
+    that also serves the date range lookups of a stock.
     """
     __tablename__ = "stock_prices"
+    __table_args__ = (
+        Index("ix_stock_prices_stock_id_date", "stock_id", "date", unique=True),
+    )
 
     id = Column(Integer, primary_key=True, index=True)
     stock_id = Column(Integer, ForeignKey("stocks.id"), nullable=False)
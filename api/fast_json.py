@@ -0,0 +1,69 @@
+import json
+import math
+from datetime import date
+from typing import Any, Dict, Iterable, List, Sequence
+from fastapi.responses import JSONResponse
+
+# orjson is optional, the standard library encoder produces the same documents, NaN and infinity as null
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """
+    Encode trusted data as compact UTF-8 JSON, dates as ISO strings.
+
+    Uses orjson when it is installed and the standard library encoder otherwise. Both encode
+    NaN and infinity as null, because JSON cannot represent them.
+
+    :param content: Plain lists, dictionaries, numbers, strings and dates.
+    :return: The JSON document.
+    """
+    if orjson is not None:
+        return orjson.dumps(content)
+    try:
+        document = _dumps(content)
+    except ValueError:
+        # Only content with NaN or infinity is copied
+        document = _dumps(_finite(content))
+    return document.encode("utf-8")
+
+
+def _dumps(content: Any) -> str:
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":"), default=date.isoformat, allow_nan=False)
+
+
+def _finite(content: Any) -> Any:
+    # Replace NaN and infinity by None, like orjson does
+    if isinstance(content, float):
+        return content if math.isfinite(content) else None
+    if isinstance(content, dict):
+        return {key: _finite(value) for key, value in content.items()}
+    if isinstance(content, (list, tuple)):
+        return [_finite(value) for value in content]
+    return content
+
+
+def row_dicts(fields: Sequence[str], rows: Iterable[Sequence]) -> List[Dict]:
+    """
+    Turn plain result tuples into dictionaries, without validating them.
+
+    :param fields: The names of the columns, in the order they were selected.
+    :param rows: The result tuples.
+    :return: One dictionary per row.
+    """
+    return [dict(zip(fields, row)) for row in rows]
+
+
+class FastJSONResponse(JSONResponse):
+    """
+    A JSON response encoded with `dumps`.
+
+    Handlers return it for data read from the database, which needs no validation
+    against the response model. The model still documents the response in OpenAPI.
+    """
+
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
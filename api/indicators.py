@@ -0,0 +1,211 @@
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional, Tuple
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# Trading days per year, used to annualize the volatility
+TRADING_DAYS = 252
+
+# Maximum number of indicator series cached per stock, the oldest one is dropped first
+MAX_CACHED_INDICATORS = 32
+
+# Columns computed by an indicator for the positions from `start` on, see `INDICATORS`
+Columns = Dict[str, np.ndarray]
+
+
+def _windows(values: np.ndarray, offset: int, start: int, window: int) -> Tuple[int, np.ndarray]:
+    """
+    Get the sliding windows ending at every position from `start` on.
+
+    :param values: The inputs of the positions from `offset` on.
+    :param offset: The position of the first input, at most `start - window + 1`.
+    :param start: The first position that needs a window.
+    :param window: The window length.
+    :return: The number of positions before the first full window, and a read-only view with one window per row.
+    """
+    stop = offset + len(values)
+    first = min(max(start, window - 1), stop)
+    if stop - first == 0:
+        return first - start, np.empty((0, window))
+    return first - start, sliding_window_view(values[first - window + 1 - offset:], window)
+
+
+def _lead(count: int, values: np.ndarray) -> np.ndarray:
+    # Prefix NaN for the positions without a full window
+    return np.concatenate((np.full(count, np.nan), values))
+
+
+def _offset(start: int, window: int) -> int:
+    # The first position whose input is needed for the windows from `start` on
+    return max(0, start - window + 1)
+
+
+def _log_returns(close: np.ndarray, offset: int) -> np.ndarray:
+    # The log returns of the positions from `offset` on, the first position has none
+    returns = np.log(close[max(offset, 1):] / close[max(offset, 1) - 1:-1])
+    return _lead(1, returns) if offset == 0 else returns
+
+
+def _ewm(values: np.ndarray, alpha: float, previous: Optional[float]) -> np.ndarray:
+    # The recursive exponential average `s[i] = (1 - alpha) * s[i - 1] + alpha * x[i]`, continued from `previous`
+    if previous is None:
+        return pd.Series(values).ewm(alpha=alpha, adjust=False).mean().to_numpy()
+    return pd.Series(np.concatenate(([previous], values))).ewm(alpha=alpha, adjust=False).mean().to_numpy()[1:]
+
+
+def sma(columns: Columns, start: int, previous: Optional[Columns], window: int) -> Columns:
+    """
+    The simple moving average of the close prices.
+    """
+    lead, windows = _windows(columns["close"][_offset(start, window):], _offset(start, window), start, window)
+    return {"sma": _lead(lead, windows.mean(axis=1))}
+
+
+def ema(columns: Columns, start: int, previous: Optional[Columns], window: int) -> Columns:
+    """
+    The exponential moving average of the close prices with `alpha = 2 / (window + 1)`, seeded with the first close.
+    """
+    state = previous["_ema"][start - 1] if start else None
+    values = _ewm(columns["close"][start:], 2 / (window + 1), state)
+    positions = np.arange(start, len(columns["close"]))
+    return {"ema": np.where(positions >= window - 1, values, np.nan), "_ema": values}
+
+
+def rsi(columns: Columns, start: int, previous: Optional[Columns], window: int) -> Columns:
+    """
+    The relative strength index with Wilder's smoothing of the close changes.
+    """
+    close = columns["close"]
+    first = min(max(start, 1), len(close))
+    changes = close[first:] - close[first - 1:-1]
+    gains = _ewm(np.maximum(changes, 0), 1 / window, previous["_gain"][start - 1] if start > 1 else None)
+    losses = _ewm(np.maximum(-changes, 0), 1 / window, previous["_loss"][start - 1] if start > 1 else None)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        values = np.where(losses == 0, 100.0, 100 - 100 / (1 + gains / losses))
+    positions = np.arange(first, len(close))
+    lead = first - start
+    return {
+        "rsi": _lead(lead, np.where(positions >= window, values, np.nan)),
+        "_gain": _lead(lead, gains),
+        "_loss": _lead(lead, losses),
+    }
+
+
+def bollinger(columns: Columns, start: int, previous: Optional[Columns], window: int, width: float) -> Columns:
+    """
+    The Bollinger bands: the moving average of the close prices, `width` population standard deviations around it.
+    """
+    lead, windows = _windows(columns["close"][_offset(start, window):], _offset(start, window), start, window)
+    middle, deviation = windows.mean(axis=1), windows.std(axis=1)
+    return {
+        "middle": _lead(lead, middle),
+        "upper": _lead(lead, middle + width * deviation),
+        "lower": _lead(lead, middle - width * deviation),
+    }
+
+
+def volatility(columns: Columns, start: int, previous: Optional[Columns], window: int) -> Columns:
+    """
+    The annualized standard deviation of the daily log returns in a moving window.
+    """
+    offset = _offset(start, window)
+    lead, windows = _windows(_log_returns(columns["close"], offset), offset, start, window)
+    return {"volatility": _lead(lead, windows.std(axis=1, ddof=1) * np.sqrt(TRADING_DAYS))}
+
+
+def vwap(columns: Columns, start: int, previous: Optional[Columns], window: int) -> Columns:
+    """
+    The volume weighted average of the typical price `(high + low + close) / 3` in a moving window.
+    """
+    offset = _offset(start, window)
+    volume = columns["volume"][offset:].astype(np.float64)
+    typical = (columns["high"][offset:] + columns["low"][offset:] + columns["close"][offset:]) / 3
+    lead, turnover = _windows(typical * volume, offset, start, window)
+    _, volumes = _windows(volume, offset, start, window)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return {"vwap": _lead(lead, turnover.sum(axis=1) / volumes.sum(axis=1))}
+
+
+# The indicators by name: the function computing them and their default parameters
+INDICATORS: Dict[str, Tuple[Callable[..., Columns], Dict]] = {
+    "sma": (sma, {"window": 20}),
+    "ema": (ema, {"window": 20}),
+    "rsi": (rsi, {"window": 14}),
+    "bollinger": (bollinger, {"window": 20, "width": 2.0}),
+    "volatility": (volatility, {"window": 20}),
+    "vwap": (vwap, {"window": 20}),
+}
+
+
+@dataclass(frozen=True)
+class IndicatorSeries:
+    """
+    An indicator computed over the full price history of one stock, aligned with its dates.
+
+    Every indicator is a function `f(columns, start, previous, **params)` that computes its
+    columns for the positions from `start` on with vectorized operations. It only reads the
+    prices it needs before `start`, and the columns of the previous series for its recursive
+    state, so a changed series is updated from its first changed position on.
+
+    Attributes:
+        name: The name of the indicator, a key of `INDICATORS`.
+        params: The parameters of the indicator as sorted (name, value) pairs.
+        columns: The computed columns, names starting with "_" hold internal state.
+    """
+    name: str
+    params: Tuple[Tuple[str, float], ...]
+    columns: Columns
+
+    @classmethod
+    def compute(cls, name: str, params: Tuple[Tuple[str, float], ...], prices: Columns) -> "IndicatorSeries":
+        """
+        Compute an indicator over all prices.
+
+        :param name: The name of the indicator.
+        :param params: The parameters as sorted (name, value) pairs.
+        :param prices: The price columns of the stock, see `PriceSeries.columns`.
+        :return: The indicator series.
+        """
+        function, _ = INDICATORS[name]
+        return cls(name, params, function(prices, 0, None, **dict(params)))
+
+    def updated(self, prices: Columns, first_changed: int) -> "IndicatorSeries":
+        """
+        Create the indicator of a changed series, computing only the positions from the first changed day on.
+
+        :param prices: The price columns of the changed series.
+        :param first_changed: The first position of the changed series that differs from the old one.
+        :return: The indicator of the changed series.
+        """
+        function, _ = INDICATORS[self.name]
+        tail = function(prices, first_changed, self.columns, **dict(self.params))
+        return IndicatorSeries(self.name, self.params, {
+            name: np.concatenate((column[:first_changed], tail[name])) for name, column in self.columns.items()
+        })
+
+    def values(self, start: int, stop: int) -> Dict[str, list]:
+        """
+        Get the public columns between two positions as lists, NaN is replaced by None.
+
+        :param start: The first position.
+        :param stop: The position after the last one.
+        :return: The values by column name.
+        """
+        return {
+            name: [None if value != value else value for value in column[start:stop].tolist()]
+            for name, column in self.columns.items() if not name.startswith("_")
+        }
+
+
+def indicator_params(name: str, **params) -> Tuple[Tuple[str, float], ...]:
+    """
+    Complete the parameters of an indicator with its defaults, as a hashable cache key.
+
+    :param name: The name of the indicator, a key of `INDICATORS`.
+    :param params: The given parameters, None values take the default.
+    :return: The parameters the indicator takes, as sorted (name, value) pairs.
+    """
+    _, defaults = INDICATORS[name]
+    return tuple(sorted((key, default if params.get(key) is None else type(default)(params[key]))
+                        for key, default in defaults.items()))
@@ -1,24 +1,133 @@
-from fastapi import FastAPI
-from fastapi.responses import RedirectResponse
-from routers import api_stocks, api_stock_prices, api_profit
-from database import init_db
+import asyncio
+import logging
+import os
+from typing import Optional
+from fastapi import FastAPI, Header, HTTPException, Query, status
+from fastapi.responses import FileResponse, RedirectResponse, JSONResponse, Response
+from database import init_db, SessionLocal
+from metrics import CONTENT_TYPE, METRICS_ENABLED, MetricsMiddleware, render
+from request_profiler import PROFILE_TOKEN, ProfilerMiddleware, is_authorized, profile_path
+from price_store import price_store
 
-app = FastAPI()
+logger = logging.getLogger(__name__)
 
+# Database access of the routers: "sync" runs blocking handlers in the threadpool,
+# "async" runs coroutine handlers on the event loop with the aiosqlite driver
+DB_MODES = ("sync", "async")
+DB_MODE = os.environ.get("STOCK_API_DB_MODE", "sync")
 
-# Init the DB
-@app.on_event("startup")
-async def startup_event():
-    init_db()
 
+def create_app(db_mode: str = DB_MODE, metrics: bool = METRICS_ENABLED,
+               profile_token: Optional[str] = PROFILE_TOKEN) -> FastAPI:
+    """
+    Create the API application.
 
-# Redirect root path to /docs
-@app.get("/", include_in_schema=False)
-async def redirect_to_docs():
-    return RedirectResponse(url="/docs")
+    :param db_mode: The database access mode of the routers, one of `DB_MODES`.
+    :param metrics: If True, requests are measured and the metrics are served at /metrics.
+    :param profile_token: The admin token of the request profiling, None to leave it out.
+    :return: The FastAPI application.
+    """
+    if db_mode not in DB_MODES:
+        raise ValueError(f"Unknown database mode {db_mode!r}, expected one of {', '.join(DB_MODES)}")
 
+    app = FastAPI()
 
-# Routers
-app.include_router(api_stocks.router)
-app.include_router(api_stock_prices.router)
-app.include_router(api_profit.router)
+    # Startup state reported by /ready: "warming_up", "ready" or "failed"
+    app.state.status = "warming_up"
+    app.state.db_mode = db_mode
+
+    def warm_up():
+        """
+        Initialize the database and preload the in-memory caches.
+
+        Requests that arrive before the warm-up is finished wait for the parts they need,
+        so the warm-up only moves the cold-start latency out of the first requests.
+        """
+        try:
+            init_db()
+            with SessionLocal() as db:
+                price_store.load(db)
+        except Exception:
+            app.state.status = "failed"
+            raise
+        app.state.status = "ready"
+
+    def warm_up_done(future: asyncio.Future):
+        # The warm-up is not awaited, so its error is logged here
+        if not future.cancelled() and future.exception() is not None:
+            logger.error("Warm-up failed, it is retried by the next /ready request", exc_info=future.exception())
+
+    def start_warm_up():
+        app.state.status = "warming_up"
+        asyncio.get_running_loop().run_in_executor(None, warm_up).add_done_callback(warm_up_done)
+
+    # Init the DB and warm up in the background, so the server accepts connections right away
+    @app.on_event("startup")
+    async def startup_event():
+        start_warm_up()
+
+    # Close the async database connections
+    if db_mode == "async":
+        @app.on_event("shutdown")
+        async def shutdown_event():
+            from async_database import dispose_async_engine
+            await dispose_async_engine()
+
+    # Redirect root path to /docs
+    @app.get("/", include_in_schema=False)
+    async def redirect_to_docs():
+        return RedirectResponse(url="/docs")
+
+    # Readiness probe
+    @app.get("/ready", tags=["Health"])
+    async def readiness():
+        """
+        Report the startup state: "warming_up", "ready" or "failed".
+
+        A failed warm-up is started again by the probe that reports it, so the application
+        recovers once the cause is fixed, e.g. a missing CSV directory, without a restart.
+        """
+        status_code = status.HTTP_200_OK if app.state.status == "ready" else status.HTTP_503_SERVICE_UNAVAILABLE
+        content = {"status": app.state.status}
+        if app.state.status == "failed":
+            start_warm_up()
+        return JSONResponse(status_code=status_code, content=content)
+
+    # Request, database and cache metrics in the Prometheus text format
+    if metrics:
+        app.add_middleware(MetricsMiddleware)
+
+        @app.get("/metrics", include_in_schema=False)
+        async def get_metrics():
+            return Response(render(), media_type=CONTENT_TYPE)
+
+    # Profiling of single requests carrying the admin token, added last so it also covers the metrics
+    if profile_token:
+        app.add_middleware(ProfilerMiddleware, token=profile_token)
+
+        @app.get("/profiles/{profile_id}", include_in_schema=False)
+        async def get_profile(profile_id: str, format: str = Query("folded", pattern="^(folded|json)$"),
+                              x_profile_token: Optional[str] = Header(None)):
+            if not is_authorized(profile_token, x_profile_token):
+                raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail="Invalid profile token")
+            path = profile_path(profile_id, format)
+            if path is None or not os.path.exists(path):
+                raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Profile not found")
+            return FileResponse(path, media_type="application/json" if format == "json" else "text/plain")
+
+    # Routers, the async ones are only imported in the async mode
+    if db_mode == "async":
+        from routers import async_api_stocks, async_api_stock_prices, async_api_profit
+        app.include_router(async_api_stocks.router)
+        app.include_router(async_api_stock_prices.router)
+        app.include_router(async_api_profit.router)
+    else:
+        from routers import api_stocks, api_stock_prices, api_profit
+        app.include_router(api_stocks.router)
+        app.include_router(api_stock_prices.router)
+        app.include_router(api_profit.router)
+
+    return app
+
+
+app = create_app()
@@ -0,0 +1,247 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from typing import Callable, Dict, List, Sequence, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from profit_cache import profit_cache
+from query_log import add_observer, current_stats, remove_observer, track_request
+
+# Metrics are collected unless `STOCK_API_METRICS=0`
+METRICS_ENABLED = os.environ.get("STOCK_API_METRICS", "1") != "0"
+
+# Content type of the Prometheus text exposition format
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Bucket upper bounds of the histograms
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+STATEMENT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+
+# Route label of requests that match no route, so unknown paths do not create new series
+UNMATCHED_ROUTE = "unmatched"
+
+
+def _labels(names: Sequence[str], values: Sequence) -> str:
+    # Render `{name="value",...}` with the escaping of the text format
+    values = [str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") for value in values]
+    return "{" + ",".join(f'{name}="{value}"' for name, value in zip(names, values)) + "}" if names else ""
+
+
+class Counter:
+    """
+    A monotonic counter, one series per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, labels: Tuple[str, ...] = (), amount: float = 1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def render(self) -> List[str]:
+        with self._lock:
+            values = sorted(self._values.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        lines += [f"{self.name}{_labels(self.labels, labels)} {value}" for labels, value in values]
+        return lines
+
+
+class Histogram:
+    """
+    A histogram with fixed buckets, one series per combination of label values.
+
+    Every series keeps one count per bucket and the sum of the observed values, the
+    cumulative bucket counts of the text format are only computed when rendering.
+    """
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(buckets)
+        self.labels = tuple(labels)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, labels: Tuple[str, ...] = ()):
+        # The first bucket whose upper bound is at least the value, the last slot is +Inf followed by the sum
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(labels)
+            if series is None:
+                series = self._series[labels] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = sorted((labels, list(values)) for labels, values in self._series.items())
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        names = self.labels + ("le",)
+        for labels, values in series:
+            count = 0
+            for bound, bucket in zip(self.buckets + ("+Inf",), values):
+                count += bucket
+                lines.append(f"{self.name}_bucket{_labels(names, labels + (bound,))} {count}")
+            lines.append(f"{self.name}_sum{_labels(self.labels, labels)} {values[-1]}")
+            lines.append(f"{self.name}_count{_labels(self.labels, labels)} {count}")
+        return lines
+
+
+class Gauge:
+    """
+    A value read when the metrics are rendered, one series per combination of label values.
+    """
+
+    def __init__(self, name: str, documentation: str, read: Callable[[], Dict[Tuple[str, ...], float]],
+                 labels: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self.read = read
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} gauge"]
+        lines += [f"{self.name}{_labels(self.labels, labels)} {value}" for labels, value in sorted(self.read().items())]
+        return lines
+
+
+# Requests being served
+_in_flight = 0
+
+REQUESTS = Counter("stock_api_requests_total", "Handled HTTP requests.", ("method", "route", "status"))
+REQUEST_SECONDS = Histogram("stock_api_request_duration_seconds", "HTTP request latency in seconds.",
+                            LATENCY_BUCKETS, ("method", "route"))
+IN_FLIGHT = Gauge("stock_api_requests_in_flight", "HTTP requests being served.", lambda: {(): _in_flight})
+REQUEST_STATEMENTS = Histogram("stock_api_request_db_statements", "SQL statements executed per HTTP request.",
+                               STATEMENT_BUCKETS, ("method", "route"))
+REQUEST_DB_SECONDS = Histogram("stock_api_request_db_seconds", "Time per HTTP request spent executing SQL statements.",
+                               LATENCY_BUCKETS, ("method", "route"))
+REQUEST_CHECKOUT_SECONDS = Histogram("stock_api_request_db_checkout_seconds",
+                                     "Time per HTTP request database connections were checked out of the pool.",
+                                     LATENCY_BUCKETS, ("method", "route"))
+STATEMENT_SECONDS = Histogram("stock_api_db_statement_duration_seconds", "SQL statement execution time in seconds.",
+                              LATENCY_BUCKETS)
+CHECKOUT_SECONDS = Histogram("stock_api_db_checkout_duration_seconds",
+                             "Time a database connection is checked out of the pool in seconds.", LATENCY_BUCKETS)
+
+# The profit cache statistics, read on every scrape
+PROFIT_CACHE_LOOKUPS = Gauge(
+    "stock_api_profit_cache_lookups", "Profit cache lookups since the last reset by result.",
+    lambda: {(result,): stats[result] for stats in [profit_cache.stats()]
+             for result in ("hits", "misses", "collapsed")},
+    ("result",),
+)
+PROFIT_CACHE_HIT_RATIO = Gauge("stock_api_profit_cache_hit_ratio",
+                               "Share of the profit cache lookups served without a new calculation.",
+                               lambda: {(): profit_cache.stats()["hit_ratio"]})
+PROFIT_CACHE_ENTRIES = Gauge("stock_api_profit_cache_entries", "Profit results in the cache.",
+                             lambda: {(): profit_cache.stats()["entries"]})
+
+METRICS = (REQUESTS, REQUEST_SECONDS, IN_FLIGHT, REQUEST_STATEMENTS, REQUEST_DB_SECONDS, REQUEST_CHECKOUT_SECONDS,
+           STATEMENT_SECONDS, CHECKOUT_SECONDS, PROFIT_CACHE_LOOKUPS, PROFIT_CACHE_HIT_RATIO, PROFIT_CACHE_ENTRIES)
+
+
+def render() -> str:
+    """
+    Render all metrics in the Prometheus text format.
+
+    :return: The metrics page.
+    """
+    return "\n".join(line for metric in METRICS for line in metric.render()) + "\n"
+
+
+def _observe_statement(statement: str, elapsed: float):
+    STATEMENT_SECONDS.observe(elapsed)
+
+
+def _checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["checked_out"] = time.perf_counter()
+
+
+def _checkin(dbapi_connection, connection_record):
+    started = connection_record.info.pop("checked_out", None)
+    if started is None:
+        return
+    elapsed = time.perf_counter() - started
+    CHECKOUT_SECONDS.observe(elapsed)
+    stats = current_stats()
+    if stats is not None:
+        stats.checkout_seconds += elapsed
+
+
+# Pool events of the instrumentation
+_POOL_EVENTS = (("checkout", _checkout), ("checkin", _checkin))
+
+
+def instrument_engine(engine: Engine):
+    """
+    Time the connection checkouts of an engine, once per engine, and every statement tracked by `query_log`.
+
+    :param engine: The engine, the `sync_engine` of an async engine.
+    """
+    add_observer(_observe_statement)
+    for name, listener in _POOL_EVENTS:
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+
+
+def uninstrument_engine(engine: Engine):
+    """
+    Remove the instrumentation of an engine, e.g. to measure its overhead.
+
+    :param engine: The engine passed to `instrument_engine`.
+    """
+    remove_observer(_observe_statement)
+    for name, listener in _POOL_EVENTS:
+        if event.contains(engine, name, listener):
+            event.remove(engine, name, listener)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the count, latency and database work of every HTTP request.
+
+    Requests are labelled with their route template, e.g. "/prices/{ticker}", so the number
+    of series does not grow with the requested tickers or dates. Their statements are
+    counted by `query_log.track_request`.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        global _in_flight
+        status_code = 500
+
+        async def send_with_status(message):
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+
+        _in_flight += 1
+        started = time.perf_counter()
+        try:
+            with track_request() as stats:
+                await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            _in_flight -= 1
+
+            route = scope.get("route")
+            labels = (scope["method"], getattr(route, "path", UNMATCHED_ROUTE))
+            REQUESTS.inc(labels + (str(status_code),))
+            REQUEST_SECONDS.observe(elapsed, labels)
+            REQUEST_STATEMENTS.observe(stats.statements, labels)
+            REQUEST_DB_SECONDS.observe(stats.statement_seconds, labels)
+            REQUEST_CHECKOUT_SECONDS.observe(stats.checkout_seconds, labels)
@@ -0,0 +1,85 @@
+import logging
+import re
+from typing import List, Tuple
+from sqlalchemy import text
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Schema changes applied to existing databases, in order. The version of a database is
+# stored in SQLite's `user_version` pragma. New databases are created from the current
+# models and only stamped with the latest version.
+MIGRATIONS: List[Tuple[int, str, List[str]]] = [
+    (1, "Unique (stock_id, date) index on stock_prices", [
+        # Keep only the oldest row of any duplicated date, so the unique index can be built,
+        # the other rows are copied to a backup table first
+        "CREATE TABLE IF NOT EXISTS stock_prices_duplicates_v1 AS SELECT * FROM stock_prices WHERE id NOT IN "
+        "(SELECT MIN(id) FROM stock_prices GROUP BY stock_id, date)",
+        "DELETE FROM stock_prices WHERE id NOT IN "
+        "(SELECT MIN(id) FROM stock_prices GROUP BY stock_id, date)",
+        "CREATE UNIQUE INDEX IF NOT EXISTS ix_stock_prices_stock_id_date ON stock_prices (stock_id, date)",
+    ]),
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Backup tables created by migration statements, before rows are deleted
+_BACKUP_TABLE = re.compile(r"^CREATE TABLE (?:IF NOT EXISTS )?(\w+) AS SELECT")
+
+# Engines that are already on the latest version
+_migrated_urls = set()
+
+
+def get_version(engine: Engine) -> int:
+    """
+    Read the schema version of a database.
+
+    :param engine: The engine connected to the database.
+    :return: The schema version, 0 for databases created before migrations existed.
+    """
+    with engine.connect() as connection:
+        return connection.execute(text("PRAGMA user_version")).scalar()
+
+
+def stamp(engine: Engine):
+    """
+    Mark a database created from the current models as being on the latest version.
+
+    :param engine: The engine connected to the database.
+    """
+    with engine.begin() as connection:
+        connection.execute(text(f"PRAGMA user_version = {LATEST_VERSION}"))
+    _migrated_urls.add(str(engine.url))
+
+
+def migrate(engine: Engine):
+    """
+    Bring a database up to the latest schema version.
+
+    Every pending migration runs in its own transaction together with the version update,
+    so an interrupted migration is retried on the next start. Once an engine is on the
+    latest version, later calls return without touching the database. Rows deleted by a
+    migration are copied to a backup table first and logged as a warning, so an operator
+    sees that data was removed and can restore it.
+
+    :param engine: The engine connected to the database.
+    """
+    if str(engine.url) in _migrated_urls:
+        return
+
+    version = get_version(engine)
+    for target, description, statements in MIGRATIONS:
+        if target <= version:
+            continue
+
+        print(f"Migrating database to version {target}: {description}")
+        backups = [match.group(1) for match in map(_BACKUP_TABLE.match, statements) if match]
+        with engine.begin() as connection:
+            for statement in statements:
+                result = connection.execute(text(statement))
+                if statement.startswith("DELETE") and result.rowcount > 0:
+                    logger.warning("Migration to version %d deleted %d rows, backed up in %s: %s", target,
+                                   result.rowcount, ", ".join(backups) or "no table", statement)
+            connection.execute(text(f"PRAGMA user_version = {target}"))
+
+    _migrated_urls.add(str(engine.url))
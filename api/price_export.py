@@ -0,0 +1,159 @@
+import io
+from datetime import date
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+import pandas as pd
+from fastapi import HTTPException, Response, status
+from price_store import PriceSeries
+
+# pyarrow is optional, it is only needed for the Arrow and Parquet formats
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+# Media types of the export formats, JSON is served by the regular list endpoint
+EXPORT_MEDIA_TYPES = {
+    "json": "application/json",
+    "csv": "text/csv",
+    "arrow": "application/vnd.apache.arrow.stream",
+    "parquet": "application/vnd.apache.parquet",
+}
+
+# File extensions of the export formats
+EXPORT_EXTENSIONS = {"csv": "csv", "arrow": "arrows", "parquet": "parquet"}
+
+# Formats that are built from the price store columns
+COLUMNAR_FORMATS = tuple(EXPORT_EXTENSIONS)
+
+# OpenAPI description of the export responses
+EXPORT_RESPONSES = {200: {"content": {EXPORT_MEDIA_TYPES[name]: {} for name in COLUMNAR_FORMATS}}}
+
+
+def negotiate_format(format: Optional[str], accept: Optional[str], formats: Sequence[str], default: str) -> str:
+    """
+    Choose the format of a response from the `format` query parameter or the Accept header.
+
+    The query parameter wins. Otherwise the first media type of the Accept header that
+    matches one of the formats is used, and the default if none does.
+
+    :param format: The `format` query parameter, e.g. "parquet".
+    :param accept: The Accept header of the request.
+    :param formats: The formats the endpoint supports.
+    :param default: The format used without a parameter or a matching media type.
+    :return: The chosen format, a 406 error is raised for an unsupported `format` parameter.
+    """
+    if format:
+        if format not in formats:
+            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                                detail=f"Unsupported format, use one of: {', '.join(formats)}")
+        return format
+
+    for media_type in (accept or "").split(","):
+        media_type = media_type.split(";")[0].strip().lower()
+        for name in formats:
+            if EXPORT_MEDIA_TYPES[name] == media_type:
+                return name
+    return default
+
+
+def select_tickers(tickers: Optional[str], stock_ids: Dict[str, int]) -> List[Tuple[str, int]]:
+    """
+    Parse the comma separated `tickers` query parameter of the multi-ticker export.
+
+    :param tickers: The requested tickers, e.g. "AAPL,AMZN", None for all stocks sorted by ticker.
+    :param stock_ids: The IDs of all stocks by ticker.
+    :return: The ticker and ID of every requested stock, a 404 error is raised for unknown tickers.
+    """
+    names = [ticker.strip() for ticker in (tickers or "").split(",") if ticker.strip()] or sorted(stock_ids)
+    unknown = [ticker for ticker in names if ticker not in stock_ids]
+    if unknown or not names:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND,
+                            detail=f"Stock not found: {', '.join(unknown)}" if unknown else "Stock not found")
+    return [(ticker, stock_ids[ticker]) for ticker in dict.fromkeys(names)]
+
+
+def series_columns(series: PriceSeries, fields: Sequence[str], start: Optional[date], end: Optional[date],
+                   after: Optional[date] = None, limit: Optional[int] = None) -> Tuple[Dict[str, np.ndarray], bool]:
+    """
+    Slice the columns of a price series by date, without copying them.
+
+    :param series: The price series of the stock.
+    :param fields: The columns to return, names of `PRICE_FIELDS`.
+    :param start: The first date of the range, None for no lower bound.
+    :param end: The last date of the range, None for no upper bound.
+    :param after: Only prices after this date are returned (the keyset cursor), None for the first page.
+    :param limit: The maximum number of prices, None for all of them.
+    :return: The columns by field name, and whether more prices follow the limit.
+    """
+    lower = 0 if start is None else int(np.searchsorted(series.date, np.datetime64(start, "D"), side="left"))
+    upper = len(series) if end is None else int(np.searchsorted(series.date, np.datetime64(end, "D"), side="right"))
+    if after is not None:
+        lower = max(lower, int(np.searchsorted(series.date, np.datetime64(after, "D"), side="right")))
+    upper = max(lower, upper)
+    more = bool(limit) and upper - lower > limit
+    if more:
+        upper = lower + limit
+
+    columns = {}
+    for field in fields:
+        if field == "stock_id":
+            columns[field] = np.full(upper - lower, series.stock_id, dtype=np.int64)
+        else:
+            columns[field] = getattr(series, field)[lower:upper]
+    return columns, more
+
+
+def concat_columns(parts: List[Tuple[str, Dict[str, np.ndarray]]]) -> Dict[str, np.ndarray]:
+    """
+    Join the columns of several stocks into one table with a leading "ticker" column.
+
+    :param parts: The ticker and the columns of every stock, all with the same fields.
+    :return: The joined columns.
+    """
+    columns = {"ticker": np.concatenate([np.full(len(next(iter(part.values()))), ticker, dtype=object)
+                                         for ticker, part in parts])}
+    for field in parts[0][1]:
+        columns[field] = np.concatenate([part[field] for _, part in parts])
+    return columns
+
+
+def encode_columns(columns: Dict[str, np.ndarray], format: str) -> bytes:
+    """
+    Encode columns as one CSV, Arrow IPC stream or Parquet file.
+
+    :param columns: The columns by name, dates as `datetime64[D]` arrays.
+    :param format: One of `COLUMNAR_FORMATS`.
+    :return: The encoded file, a 501 error is raised for Arrow and Parquet if pyarrow is not installed.
+    """
+    if format == "csv":
+        return pd.DataFrame(columns).to_csv(index=False, date_format="%Y-%m-%d").encode("utf-8")
+
+    if pyarrow is None:
+        raise HTTPException(status_code=status.HTTP_501_NOT_IMPLEMENTED,
+                            detail=f"The {format} format requires the pyarrow package")
+    table = pyarrow.table(columns)
+    buffer = io.BytesIO()
+    if format == "arrow":
+        with pyarrow.ipc.new_stream(buffer, table.schema) as writer:
+            writer.write_table(table)
+    else:
+        pyarrow.parquet.write_table(table, buffer)
+    return buffer.getvalue()
+
+
+def export_response(columns: Dict[str, np.ndarray], format: str, name: str,
+                    headers: Optional[Dict[str, str]] = None) -> Response:
+    """
+    Build the response of an export, downloaded as a file.
+
+    :param columns: The columns to export.
+    :param format: One of `COLUMNAR_FORMATS`.
+    :param name: The file name without extension.
+    :param headers: Additional response headers.
+    :return: The response with the encoded file.
+    """
+    headers = {**(headers or {}), "Content-Disposition": f'attachment; filename="{name}.{EXPORT_EXTENSIONS[format]}"'}
+    return Response(content=encode_columns(columns, format), media_type=EXPORT_MEDIA_TYPES[format], headers=headers)
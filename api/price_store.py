@@ -0,0 +1,507 @@
+import threading
+from dataclasses import dataclass, replace
+from functools import cached_property
+from datetime import date
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from database import StockPrice
+from profit_engine import gain_prefix, update_gain_prefix, window_multi_trade_profit
+from rollups import ROLLUP_PERIODS, Rollup
+from indicators import IndicatorSeries, MAX_CACHED_INDICATORS
+from trade_tree import TradeTree
+
+# Columns kept for every stock, in the order they are selected from the database
+PRICE_COLUMNS = ("id", "date", "open", "high", "low", "close", "adj_close", "volume")
+COLUMN_DTYPES = {
+    "id": np.int64,
+    "date": "datetime64[D]",
+    "open": np.float64,
+    "high": np.float64,
+    "low": np.float64,
+    "close": np.float64,
+    "adj_close": np.float64,
+    "volume": np.int64,
+}
+
+
+def price_columns(rows: Iterable[Dict]) -> Dict[str, np.ndarray]:
+    """
+    Convert price rows into NumPy columns, e.g. to merge them with `PriceSeries.with_prices`.
+
+    :param rows: Dictionaries with the `PRICE_COLUMNS` keys.
+    :return: One array per column.
+    """
+    rows = list(rows)
+    return {name: np.array([row[name] for row in rows], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()}
+
+
+@dataclass(frozen=True)
+class PriceSeries:
+    """
+    The price history of one stock stored as NumPy columns sorted by date.
+
+    A series is never modified after it is created. Writes build a new series and swap it
+    into the store, so readers can keep using the arrays they already hold. Structures derived
+    from the prices are built on first use and updated incrementally for the new series.
+
+    Attributes:
+        stock_id: The ID of the stock this series belongs to.
+        id: The primary keys of the `stock_prices` rows.
+        date: The trading dates as a `datetime64[D]` array, sorted ascending.
+        open, high, low, close, adj_close: The price columns.
+        volume: The trading volume column.
+    """
+    stock_id: int
+    id: np.ndarray
+    date: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    adj_close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def empty(cls, stock_id: int) -> "PriceSeries":
+        """
+        Create a series without any prices.
+
+        :param stock_id: The ID of the stock.
+        :return: An empty price series.
+        """
+        return cls(stock_id, **{name: np.array([], dtype=dtype) for name, dtype in COLUMN_DTYPES.items()})
+
+    def __len__(self) -> int:
+        return len(self.date)
+
+    @cached_property
+    def trade_tree(self) -> TradeTree:
+        """
+        The segment tree of the close prices for best single trade queries, built on first use.
+        """
+        return TradeTree(self.close)
+
+    @cached_property
+    def gain_prefix(self) -> np.ndarray:
+        """
+        The prefix sums of the positive close changes for multi-trade profit queries, built on first use.
+        """
+        return gain_prefix(self.close)
+
+    @cached_property
+    def rollups(self) -> Dict[str, Rollup]:
+        """
+        The OHLCV bars by period (see `ROLLUP_PERIODS`), materialized when the store is loaded.
+        """
+        return {period: Rollup.build(period, self.columns()) for period in ROLLUP_PERIODS}
+
+    @cached_property
+    def indicators(self) -> Dict[Tuple, IndicatorSeries]:
+        """
+        The indicators computed for this series by (name, params), see `indicator`.
+        """
+        return {}
+
+    def indicator(self, name: str, params: Tuple) -> IndicatorSeries:
+        """
+        Get an indicator over the full history, computing and caching it on first use.
+
+        :param name: The name of the indicator, a key of `INDICATORS`.
+        :param params: The parameters of the indicator, see `indicator_params`.
+        :return: The indicator series, aligned with the dates of this series.
+        """
+        cache = self.indicators
+        result = cache.get((name, params))
+        if result is None:
+            result = IndicatorSeries.compute(name, params, self.columns())
+            if len(cache) >= MAX_CACHED_INDICATORS:
+                cache.pop(next(iter(cache), None), None)
+            cache[name, params] = result
+        return result
+
+    def columns(self) -> Dict[str, np.ndarray]:
+        """
+        Get the `PRICE_COLUMNS` of the series by name, without copying them.
+        """
+        return {name: getattr(self, name) for name in PRICE_COLUMNS}
+
+    def multi_trade_profit(self, start: int, stop: int) -> float:
+        """
+        Calculate the multi-trade profit between two positions in constant time.
+
+        :param start: The first position of the window.
+        :param stop: The position after the last one of the window.
+        :return: The multi-trade profit, equal to the profit engine's up to float rounding, see `exceeds`.
+        """
+        return float(window_multi_trade_profit(self.gain_prefix, start, stop))
+
+    def index_of(self, day: date) -> Optional[int]:
+        """
+        Find the position of a date with binary search.
+
+        :param day: The date to look for.
+        :return: The position of the date, or None if there is no price on that date.
+        """
+        key = np.datetime64(day, "D")
+        index = int(np.searchsorted(self.date, key))
+        if index < len(self.date) and self.date[index] == key:
+            return index
+        return None
+
+    def window(self, start_date: date, end_date: date) -> Tuple[int, int]:
+        """
+        Find the slice bounds of all prices between two dates, both included.
+
+        :param start_date: The first date of the range.
+        :param end_date: The last date of the range.
+        :return: A (start, stop) tuple for slicing the columns, start is never after stop.
+        """
+        start = int(np.searchsorted(self.date, np.datetime64(start_date, "D"), side="left"))
+        stop = int(np.searchsorted(self.date, np.datetime64(end_date, "D"), side="right"))
+        return start, max(start, stop)
+
+    def row(self, index: int) -> Dict:
+        """
+        Build a plain dictionary with the price on one position, shaped like `StockPriceResponse`.
+
+        :param index: The position of the price.
+        :return: A dictionary with the price data.
+        """
+        data = {name: getattr(self, name)[index].item() for name in PRICE_COLUMNS}
+        data["stock_id"] = self.stock_id
+        return data
+
+    def with_price(self, price) -> "PriceSeries":
+        """
+        Create a new series with a price inserted, replacing any price on the same date.
+
+        :param price: An object with the `PRICE_COLUMNS` attributes, e.g. a `StockPrice`.
+        :return: The new price series.
+        """
+        series = self.without_date(price.date)
+        index = int(np.searchsorted(series.date, np.datetime64(price.date, "D")))
+        columns = {
+            name: np.insert(getattr(series, name), index, np.array(getattr(price, name), dtype=dtype))
+            for name, dtype in COLUMN_DTYPES.items()
+        }
+        return series._derive(index, **columns)
+
+    def with_prices(self, prices: Dict[str, np.ndarray]) -> "PriceSeries":
+        """
+        Create a new series with many prices merged in, replacing the prices on the same dates.
+
+        :param prices: The `PRICE_COLUMNS` of the prices as arrays, the last price of a repeated date wins.
+        :return: The new price series.
+        """
+        dates = np.asarray(prices["date"], dtype=COLUMN_DTYPES["date"])
+        if not len(dates):
+            return self
+
+        # The last price of every date, then the kept prices of this series followed by the new ones
+        unique_dates, last = np.unique(dates[::-1], return_index=True)
+        latest = len(dates) - 1 - last
+        keep = ~np.isin(self.date, unique_dates)
+        columns = {
+            name: np.concatenate((getattr(self, name)[keep], np.asarray(prices[name], dtype=dtype)[latest]))
+            for name, dtype in COLUMN_DTYPES.items()
+        }
+        order = np.argsort(columns["date"], kind="stable")
+        columns = {name: column[order] for name, column in columns.items()}
+
+        # The prices before the earliest new date keep their positions
+        first_changed = int(np.searchsorted(columns["date"], unique_dates[0]))
+        return self._derive(first_changed, **columns)
+
+    def without_date(self, day: date) -> "PriceSeries":
+        """
+        Create a new series without the price on a date.
+
+        :param day: The date to remove.
+        :return: The new price series, or this one if there is no price on that date.
+        """
+        index = self.index_of(day)
+        if index is None:
+            return self
+        return self._derive(index, **{name: np.delete(getattr(self, name), index) for name in COLUMN_DTYPES})
+
+    def without_window(self, start_date: date, end_date: date) -> "PriceSeries":
+        """
+        Create a new series without the prices between two dates.
+
+        :param start_date: The first date to remove.
+        :param end_date: The last date to remove.
+        :return: The new price series, or this one if there are no prices between the dates.
+        """
+        start, stop = self.window(start_date, end_date)
+        if start == stop:
+            return self
+        return self._derive(start, **{name: np.delete(getattr(self, name), slice(start, stop))
+                                      for name in COLUMN_DTYPES})
+
+    def _derive(self, first_changed: int, **columns) -> "PriceSeries":
+        # Create the changed series, updating the derived structures that are already built
+        series = replace(self, **columns)
+        if "trade_tree" in self.__dict__:
+            series.__dict__["trade_tree"] = self.trade_tree.updated(series.close, first_changed)
+        if "gain_prefix" in self.__dict__:
+            series.__dict__["gain_prefix"] = update_gain_prefix(self.gain_prefix, series.close, first_changed)
+        if "rollups" in self.__dict__:
+            columns = series.columns()
+            series.__dict__["rollups"] = {
+                period: rollup.updated(columns, first_changed) for period, rollup in self.rollups.items()
+            }
+        if "indicators" in self.__dict__:
+            columns = series.columns()
+            series.__dict__["indicators"] = {
+                key: indicator.updated(columns, first_changed) for key, indicator in list(self.indicators.items())
+            }
+        return series
+
+
+class PriceUniverse:
+    """
+    The close prices of all stocks concatenated into single arrays, for calculations over every stock at once.
+
+    The stocks are sorted by ID and stored one after another, `offsets[i]:offsets[i + 1]`
+    is the slice of the i-th stock. A universe is a snapshot of the store at one generation.
+
+    Attributes:
+        generation: The store generation this universe was built from.
+        stock_ids: The IDs of the stocks, sorted ascending.
+        offsets: The start of every stock in the concatenated arrays, followed by the total length.
+        keys: Sortable (stock position, date) keys, used to find the date windows of all stocks with one search.
+        prefix: The gain prefix sums of every stock (see `profit_engine.gain_prefix`), concatenated.
+    """
+    # Key layout: the stock position above bit 33, the date (days since 1970, shifted to be positive) below it
+    _STOCK_SHIFT = 33
+    _DAY_OFFSET = 2 ** 31
+
+    def __init__(self, generation: int, series: List[PriceSeries]):
+        self.generation = generation
+        self.stock_ids = np.array([item.stock_id for item in series], dtype=np.int64)
+        lengths = np.array([len(item) for item in series], dtype=np.int64)
+        self.offsets = np.concatenate(([0], np.cumsum(lengths)))
+
+        positions = np.repeat(np.arange(len(series), dtype=np.int64), lengths)
+        days = np.concatenate([item.date for item in series] or [np.array([], "datetime64[D]")]).astype(np.int64)
+        self.keys = self._key(positions, days)
+
+        self.prefix = np.concatenate([item.gain_prefix for item in series] or [np.array([], np.float64)])
+
+    def _key(self, positions: np.ndarray, days) -> np.ndarray:
+        return (positions << self._STOCK_SHIFT) + (days + self._DAY_OFFSET)
+
+    def window_sums(self, starts: np.ndarray, stops: np.ndarray) -> np.ndarray:
+        """
+        Calculate the multi-trade profits of many windows, with two prefix sum lookups per window.
+
+        :param starts: The first position of every window in the concatenated arrays.
+        :param stops: The position after the last one of every window.
+        :return: The multi-trade profit of every window, zero for windows shorter than two days.
+        """
+        return window_multi_trade_profit(self.prefix, starts, stops)
+
+    def multi_trade_profits(self, start_date: date, end_date: date) -> Dict[str, np.ndarray]:
+        """
+        Calculate the multi-trade profit of every stock for the main, pre, and post periods.
+
+        The periods are the same as in the profit endpoint: the main period holds the prices
+        between the dates, the pre and post periods hold as many trading days of the same
+        stock directly before and after it.
+
+        :param start_date: The start date of the main period.
+        :param end_date: The end date of the main period.
+        :return: A dictionary with one profit array per period, aligned with `stock_ids`.
+        """
+        positions = np.arange(len(self.stock_ids), dtype=np.int64)
+        first, last = self.offsets[:-1], self.offsets[1:]
+
+        # Find the main period of every stock with one binary search
+        start = np.searchsorted(self.keys, self._key(positions, np.datetime64(start_date, "D").astype(np.int64)))
+        stop = np.searchsorted(self.keys, self._key(positions, np.datetime64(end_date, "D").astype(np.int64)),
+                               side="right")
+        stop = np.maximum(start, stop)
+        delta_days = stop - start
+
+        return {
+            "main_period": self.window_sums(start, stop),
+            "pre_period": self.window_sums(np.maximum(first, start - delta_days), start),
+            "post_period": self.window_sums(stop, np.minimum(last, stop + delta_days))
+        }
+
+
+class PriceStore:
+    """
+    A process-level, in-memory copy of the `stock_prices` table, split into one columnar series per stock.
+
+    The store is loaded once from the database, either on startup or by the first request
+    that needs it, and the price handlers keep it up to date after every commit. Each API
+    process has its own store, so writes are only visible to the process that made them.
+
+    Every change increases the store generation, which tells derived data when to rebuild.
+    """
+
+    def __init__(self):
+        self._series: Dict[int, PriceSeries] = {}
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._generation = 0
+        self._universe: Optional[PriceUniverse] = None
+
+    @property
+    def loaded(self) -> bool:
+        return self._loaded
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def load(self, db: Session):
+        """
+        Read every stock price from the database and build the series of all stocks with their
+        OHLCV bars, unless the store is already loaded.
+
+        :param db: The database session used to read the stock prices.
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self._series = self._read_all(db)
+                    for series in self._series.values():
+                        series.rollups
+                    self._generation += 1
+                    self._loaded = True
+
+    def get(self, db: Session, stock_id: int) -> PriceSeries:
+        """
+        Get the price series of a stock, loading the store first if needed.
+
+        :param db: The database session used if the store is not loaded yet.
+        :param stock_id: The ID of the stock.
+        :return: The price series, empty if the stock has no prices.
+        """
+        self.load(db)
+        return self._series.get(stock_id) or PriceSeries.empty(stock_id)
+
+    def universe(self, db: Session) -> PriceUniverse:
+        """
+        Get the close prices of all stocks as one `PriceUniverse`, rebuilt only after changes.
+
+        :param db: The database session used if the store is not loaded yet.
+        :return: The universe of the current generation.
+        """
+        self.load(db)
+        universe = self._universe
+        if universe is None or universe.generation != self._generation:
+            with self._lock:
+                if self._universe is None or self._universe.generation != self._generation:
+                    self._universe = PriceUniverse(
+                        self._generation, [self._series[stock_id] for stock_id in sorted(self._series)]
+                    )
+                universe = self._universe
+        return universe
+
+    def upsert(self, stock_id: int, price):
+        """
+        Add a committed price to a stock's series, replacing any price on the same date.
+
+        :param stock_id: The ID of the stock.
+        :param price: An object with the `PRICE_COLUMNS` attributes, e.g. a `StockPrice`.
+        """
+        with self._lock:
+            if self._loaded:
+                series = self._series.get(stock_id) or PriceSeries.empty(stock_id)
+                self._replace(stock_id, series.with_price(price))
+
+    def upsert_many(self, stock_id: int, prices: Dict[str, np.ndarray]):
+        """
+        Merge committed prices into a stock's series in one step, replacing prices on the same dates.
+
+        :param stock_id: The ID of the stock.
+        :param prices: The `PRICE_COLUMNS` of the prices as arrays.
+        """
+        with self._lock:
+            if self._loaded:
+                series = self._series.get(stock_id) or PriceSeries.empty(stock_id)
+                self._replace(stock_id, series.with_prices(prices))
+
+    def move(self, stock_id: int, old_date: date, price):
+        """
+        Replace a committed price whose date may have changed.
+
+        :param stock_id: The ID of the stock.
+        :param old_date: The date of the price before the update.
+        :param price: An object with the `PRICE_COLUMNS` attributes holding the updated price.
+        """
+        with self._lock:
+            if self._loaded:
+                series = self._series.get(stock_id) or PriceSeries.empty(stock_id)
+                self._replace(stock_id, series.without_date(old_date).with_price(price))
+
+    def delete(self, stock_id: int, day: date):
+        """
+        Remove a deleted price from a stock's series.
+
+        :param stock_id: The ID of the stock.
+        :param day: The date of the deleted price.
+        """
+        with self._lock:
+            if self._loaded and stock_id in self._series:
+                self._replace(stock_id, self._series[stock_id].without_date(day))
+
+    def delete_range(self, stock_id: int, start_date: date, end_date: date):
+        """
+        Remove the deleted prices between two dates from a stock's series.
+
+        :param stock_id: The ID of the stock.
+        :param start_date: The first deleted date.
+        :param end_date: The last deleted date.
+        """
+        with self._lock:
+            if self._loaded and stock_id in self._series:
+                self._replace(stock_id, self._series[stock_id].without_window(start_date, end_date))
+
+    def drop(self, stock_id: int):
+        """
+        Forget all prices of a deleted stock.
+
+        :param stock_id: The ID of the stock.
+        """
+        with self._lock:
+            if self._series.pop(stock_id, None) is not None:
+                self._generation += 1
+
+    def _replace(self, stock_id: int, series: PriceSeries):
+        # Called with the lock held
+        self._series[stock_id] = series
+        self._generation += 1
+
+    @staticmethod
+    def _read_all(db: Session) -> Dict[int, PriceSeries]:
+        rows = db.execute(
+            select(StockPrice.stock_id, *(getattr(StockPrice, name) for name in PRICE_COLUMNS))
+            .order_by(StockPrice.stock_id, StockPrice.date)
+        ).all()
+        if not rows:
+            return {}
+
+        # Build one array per column, then split them on stock boundaries
+        values = list(zip(*rows))
+        stock_ids = np.array(values[0], dtype=np.int64)
+        columns = {name: np.array(values[i + 1], dtype=COLUMN_DTYPES[name]) for i, name in enumerate(PRICE_COLUMNS)}
+        bounds = np.flatnonzero(np.diff(stock_ids)) + 1
+        starts = np.concatenate(([0], bounds))
+        stops = np.concatenate((bounds, [len(stock_ids)]))
+
+        return {
+            int(stock_ids[start]): PriceSeries(
+                int(stock_ids[start]), **{name: column[start:stop] for name, column in columns.items()}
+            )
+            for start, stop in zip(starts, stops)
+        }
+
+
+# The store shared by all routers
+price_store = PriceStore()
@@ -0,0 +1,309 @@
+import codecs
+import csv
+import json
+import re
+from datetime import date
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+import numpy as np
+from fastapi import HTTPException, Request, status
+from pydantic import ValidationError
+from sqlalchemy import select
+from sqlalchemy.dialects.sqlite import insert
+from sqlalchemy.orm import Session
+from database import CSV_COLUMNS, StockPrice
+from price_store import PRICE_COLUMNS, COLUMN_DTYPES, price_columns
+from schemas import StockPriceCreate
+
+# Content types accepted by the bulk upload, all of them are parsed while the body arrives
+UPLOAD_CONTENT_TYPES = ("application/json", "application/x-ndjson", "text/csv")
+
+# Rows written to the database per statement
+UPLOAD_BATCH_SIZE = 1000
+
+# OpenAPI description of the bulk upload body, which is read from the raw request
+UPLOAD_REQUEST_BODY = {
+    "required": True,
+    "content": {
+        "application/json": {"schema": {"type": "array", "items": {"$ref": "#/components/schemas/StockPriceCreate"}}},
+        "application/x-ndjson": {"schema": {"type": "string"}, "example": '{"date": "2023-01-02", "open": 145.3, '
+                                 '"high": 147.0, "low": 144.5, "close": 146.2, "adj_close": 146.0, "volume": 1234567}'},
+        "text/csv": {"schema": {"type": "string"}, "example": "Date,Open,High,Low,Close,Adj Close,Volume\n"
+                     "2023-01-02,145.3,147.0,144.5,146.2,146.0,1234567"},
+    },
+}
+
+# Decoder of the items of JSON array bodies, and the whitespace JSON allows between them
+_JSON_DECODER = json.JSONDecoder()
+_JSON_WHITESPACE = re.compile(r"[ \t\n\r]*")
+
+# One parsed row of an upload: its number, the validated price or None, and the error detail
+UploadRow = Tuple[int, Optional[StockPriceCreate], Optional[str]]
+
+
+def validate_price(number: int, data) -> UploadRow:
+    """
+    Validate one uploaded price.
+
+    :param number: The number of the row in the upload, starting at 1.
+    :param data: The parsed row, a dictionary with the `StockPriceCreate` fields.
+    :return: The row with the price, or with an error detail if it is invalid.
+    """
+    try:
+        return number, StockPriceCreate.model_validate(data), None
+    except ValidationError as error:
+        detail = "; ".join(f"{'.'.join(map(str, item['loc'])) or 'row'}: {item['msg']}" for item in error.errors())
+        return number, None, detail
+
+
+async def iter_lines(request: Request) -> AsyncIterator[str]:
+    """
+    Yield the lines of a request body while it is received, without buffering the whole body.
+
+    :param request: The request with a UTF-8 encoded body.
+    :return: An async iterator of the lines, without line endings.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    pending = ""
+    async for chunk in request.stream():
+        pending += decoder.decode(chunk)
+        *lines, pending = pending.split("\n")
+        for line in lines:
+            yield line.rstrip("\r")
+    pending += decoder.decode(b"", final=True)
+    if pending.rstrip("\r"):
+        yield pending.rstrip("\r")
+
+
+async def iter_json_array(request: Request) -> AsyncIterator[Any]:
+    """
+    Yield the items of a JSON array body while it is received, without buffering the whole body.
+
+    Every item is decoded as soon as it is complete, so only the item being received is kept
+    in memory. Items already yielded stay valid if the body turns out to be invalid later.
+
+    :param request: The request with a UTF-8 encoded JSON array body.
+    :return: An async iterator of the decoded items.
+    :raises HTTPException: 400 if the body is not valid JSON or not an array.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    chunks = request.stream()
+    buffer, position, done = "", 0, False
+
+    async def receive() -> bool:
+        # Append the next chunk to the unparsed text, False once the body is complete
+        nonlocal buffer, position, done
+        if done:
+            return False
+        chunk = await anext(chunks, None)
+        done = chunk is None
+        buffer = buffer[position:] + decoder.decode(chunk or b"", final=done)
+        position = 0
+        return True
+
+    async def peek() -> Optional[str]:
+        # The next character after whitespace, None at the end of the body
+        nonlocal position
+        while True:
+            position = _JSON_WHITESPACE.match(buffer, position).end()
+            if position < len(buffer):
+                return buffer[position]
+            if not await receive():
+                return None
+
+    invalid = HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid JSON")
+    if await peek() != "[":
+        # Read the rest to tell invalid JSON from a JSON document that is not an array
+        while await receive():
+            pass
+        try:
+            json.loads(buffer)
+        except ValueError:
+            raise invalid
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Expected a JSON array of prices")
+
+    position += 1
+    if await peek() == "]":
+        position += 1
+    else:
+        while True:
+            if await peek() is None:
+                raise invalid
+
+            # An item is complete when more text follows it, a number could still go on otherwise
+            while True:
+                try:
+                    item, end = _JSON_DECODER.raw_decode(buffer, position)
+                except ValueError:
+                    end = None
+                if end is not None and (end < len(buffer) or done):
+                    break
+                if not await receive():
+                    raise invalid
+            position = end
+            yield item
+
+            separator = await peek()
+            position += 1
+            if separator == "]":
+                break
+            if separator != ",":
+                raise invalid
+
+    # Only whitespace may follow the array
+    if await peek() is not None:
+        raise invalid
+
+
+async def iter_upload_rows(request: Request) -> AsyncIterator[UploadRow]:
+    """
+    Parse the rows of a bulk upload according to its content type.
+
+    A JSON body is an array of prices, NDJSON bodies have one price object per line, and
+    CSV bodies use the format of the files in "csv_files". All of them are parsed while
+    the body is received.
+
+    :param request: The upload request.
+    :return: An async iterator of the validated rows.
+    """
+    content_type = request.headers.get("content-type", "application/json").split(";")[0].strip().lower()
+    if content_type not in UPLOAD_CONTENT_TYPES:
+        raise HTTPException(status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+                            detail=f"Unsupported content type, use one of: {', '.join(UPLOAD_CONTENT_TYPES)}")
+
+    if content_type == "application/json":
+        number = 0
+        async for item in iter_json_array(request):
+            number += 1
+            yield validate_price(number, item)
+
+    elif content_type == "application/x-ndjson":
+        number = 0
+        async for line in iter_lines(request):
+            if not line.strip():
+                continue
+            number += 1
+            try:
+                item = json.loads(line)
+            except ValueError:
+                yield number, None, "Invalid JSON"
+                continue
+            yield validate_price(number, item)
+
+    else:
+        lines = iter_lines(request)
+        header = next(csv.reader([await anext(lines, "")]))
+        missing = set(CSV_COLUMNS).difference(header)
+        if missing:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST,
+                                detail=f"CSV is missing columns: {', '.join(sorted(missing))}")
+        number = 0
+        async for line in lines:
+            if not line.strip():
+                continue
+            number += 1
+            values = dict(zip(header, next(csv.reader([line]))))
+            yield validate_price(number, {name: values.get(column) for column, name in CSV_COLUMNS.items()})
+
+
+async def iter_upload_batches(request: Request, batch_size: int = UPLOAD_BATCH_SIZE) -> AsyncIterator[List[UploadRow]]:
+    """
+    Group the parsed rows of a bulk upload into batches.
+
+    :param request: The upload request.
+    :param batch_size: The number of rows per batch.
+    :return: An async iterator of row lists.
+    """
+    batch = []
+    async for row in iter_upload_rows(request):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def upsert_prices(db: Session, stock_id: int, batch: List[UploadRow], seen: Set[date]) -> Tuple[List[Dict], Dict]:
+    """
+    Insert or update a batch of uploaded prices with one INSERT ... ON CONFLICT statement.
+
+    The statement runs in the session's transaction, the caller commits after the last batch.
+    Dates already in the database, or earlier in the same upload, are reported as updated.
+
+    :param db: The database session.
+    :param stock_id: The ID of the stock the prices belong to.
+    :param batch: The parsed rows.
+    :param seen: The dates written by the earlier batches of the upload, updated in place.
+    :return: The status of every row, and the written prices as NumPy columns (see `PRICE_COLUMNS`).
+    """
+    prices = {price.date: price for _, price, _ in batch if price is not None}
+    existing = set(db.scalars(
+        select(StockPrice.date).where(StockPrice.stock_id == stock_id).where(StockPrice.date.in_(list(prices)))
+    )) if prices else set()
+
+    # The status of every row, a later row of the same date overwrites the earlier one
+    statuses = []
+    for number, price, detail in batch:
+        if price is None:
+            statuses.append({"row": number, "status": "failed", "detail": detail})
+            continue
+        updated = price.date in existing or price.date in seen
+        seen.add(price.date)
+        statuses.append({"row": number, "date": price.date, "status": "updated" if updated else "inserted"})
+
+    if not prices:
+        return statuses, {}
+
+    # Upsert the last price of every date with one executemany call, SQLite would run
+    # an ordered RETURNING row by row, so the IDs are read afterwards with one query
+    statement = insert(StockPrice)
+    statement = statement.on_conflict_do_update(
+        index_elements=[StockPrice.stock_id, StockPrice.date],
+        set_={name: getattr(statement.excluded, name) for name in PRICE_COLUMNS if name not in ("id", "date")},
+    )
+    rows = [{"stock_id": stock_id, **price.model_dump()} for price in prices.values()]
+    db.execute(statement, rows)
+    ids = dict(db.execute(
+        select(StockPrice.date, StockPrice.id)
+        .where(StockPrice.stock_id == stock_id)
+        .where(StockPrice.date.in_(list(prices)))
+    ).all())
+    return statuses, price_columns({**row, "id": ids[row["date"]]} for row in rows)
+
+
+def upload_summary(statuses: Iterable[Dict]) -> Dict:
+    """
+    Build the response of a bulk upload.
+
+    :param statuses: The status of every row.
+    :return: The number of inserted, updated and failed rows, and the status of every row.
+    """
+    statuses = list(statuses)
+    summary = {name: sum(row["status"] == name for row in statuses) for name in ("inserted", "updated", "failed")}
+    summary["rows"] = statuses
+    return summary
+
+
+async def upload_prices(request: Request, stock_id: int,
+                        run_db: Callable[..., Awaitable[Any]]) -> Tuple[Dict, Dict[str, np.ndarray]]:
+    """
+    Upsert the prices of a bulk upload batch by batch while the body is received.
+
+    The database work runs through `run_db`, which calls a function with the session and the
+    given arguments: in a worker thread for a sync session, with `run_sync` for an async one.
+    The caller commits the transaction and then updates the price store.
+
+    :param request: The upload request.
+    :param stock_id: The ID of the stock the prices belong to.
+    :param run_db: Runs `function(session, *args)` and returns its result.
+    :return: The upload summary (see `upload_summary`) and the written prices as NumPy columns.
+    """
+    statuses, written, seen = [], [], set()
+    async for batch in iter_upload_batches(request):
+        batch_statuses, columns = await run_db(upsert_prices, stock_id, batch, seen)
+        statuses.extend(batch_statuses)
+        if columns:
+            written.append(columns)
+
+    prices = {name: np.concatenate([columns[name] for columns in written]) for name in COLUMN_DTYPES} if written else {}
+    return upload_summary(statuses), prices
@@ -0,0 +1,157 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# Size and lifetime of the cached profit results
+PROFIT_CACHE_SIZE = int(os.environ.get("PROFIT_CACHE_SIZE", 1024))
+PROFIT_CACHE_TTL = float(os.environ.get("PROFIT_CACHE_TTL", 300))
+
+
+class _Entry:
+    __slots__ = ("value", "generation", "expires")
+
+    def __init__(self, value: Any, generation: int, expires: float):
+        self.value = value
+        self.generation = generation
+        self.expires = expires
+
+
+class _Flight:
+    """
+    A computation in progress, other requests for the same key wait for its result.
+    """
+    __slots__ = ("done", "value", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class ProfitCache:
+    """
+    A bounded LRU cache with a time to live for profit results.
+
+    The result of a stock lists the other stocks with a better profit, so it depends on the
+    prices and names of every stock. Each write to a stock or its prices therefore increases
+    the cache generation: entries of the written stock are removed right away, all other
+    entries are dropped on their next lookup. Concurrent misses for the same key are
+    collapsed, so only one request computes the result while the others wait for it.
+    """
+
+    def __init__(self, max_entries: int = PROFIT_CACHE_SIZE, ttl: float = PROFIT_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, _Entry]" = OrderedDict()
+        self._inflight: Dict[Hashable, _Flight] = {}
+        self._lock = threading.Lock()
+        self._generation = 0
+        self._hits = 0
+        self._misses = 0
+        self._collapsed = 0
+        self._evictions = 0
+
+    def get_or_compute(self, key: Hashable, compute: Callable[[], Any]) -> Any:
+        """
+        Return the cached value of a key, computing and caching it on a miss.
+
+        Exceptions raised by `compute` are passed to every waiting caller and are not cached.
+
+        :param key: The cache key, its first element is the ticker the result belongs to.
+        :param compute: A function computing the value.
+        :return: The cached or computed value.
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                if entry.generation == self._generation and entry.expires > time.monotonic():
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return entry.value
+                del self._entries[key]
+
+            flight = self._inflight.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._inflight[key] = _Flight()
+                generation = self._generation
+                self._misses += 1
+            else:
+                self._collapsed += 1
+
+        # Wait for the computation already in progress
+        if not leader:
+            flight.done.wait()
+            if flight.error is not None:
+                raise flight.error
+            return flight.value
+
+        # Compute the value
+        try:
+            flight.value = compute()
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self._lock:
+                if self._inflight.get(key) is flight:
+                    del self._inflight[key]
+                if flight.error is None and generation == self._generation:
+                    self._store(key, flight.value, generation)
+            flight.done.set()
+        return flight.value
+
+    def invalidate(self, ticker: Optional[str] = None):
+        """
+        Invalidate the cached results after a write.
+
+        :param ticker: The ticker of the written stock, its entries are removed right away.
+        """
+        with self._lock:
+            self._generation += 1
+            self._inflight.clear()
+            if ticker is not None:
+                for key in [key for key in self._entries if key[0] == ticker]:
+                    del self._entries[key]
+
+    def clear(self):
+        """
+        Remove all entries and reset the statistics.
+        """
+        with self._lock:
+            self._generation += 1
+            self._entries.clear()
+            self._inflight.clear()
+            self._hits = self._misses = self._collapsed = self._evictions = 0
+
+    def stats(self) -> Dict[str, Any]:
+        """
+        Get the cache statistics for monitoring.
+
+        :return: A dictionary with the hit, miss, collapsed and eviction counts, the hit ratio and the size.
+        """
+        with self._lock:
+            lookups = self._hits + self._misses + self._collapsed
+            return {
+                "hits": self._hits,
+                "misses": self._misses,
+                "collapsed": self._collapsed,
+                "evictions": self._evictions,
+                "hit_ratio": (self._hits + self._collapsed) / lookups if lookups else .0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+            }
+
+    def _store(self, key: Hashable, value: Any, generation: int):
+        # Called with the lock held
+        self._entries[key] = _Entry(value, generation, time.monotonic() + self.ttl)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+
+# The cache shared by all routers
+profit_cache = ProfitCache()
@@ -0,0 +1,192 @@
+from typing import Dict, Optional, Tuple
+import numpy as np
+
+
+NO_PRICE_DATA = {"detail": "No price data available for the given range"}
+
+# Decimals of the stored prices, the CSV imports and the API round every price to them
+PRICE_DECIMALS = 6
+
+# Profits closer than half the smallest price step of the data are equal, this is far above the
+# rounding of sums in a different order and below any real difference of two profits
+PROFIT_TOLERANCE = 0.5 * 10 ** -PRICE_DECIMALS
+
+
+def best_single_trade(closes: np.ndarray) -> Optional[Tuple[int, int]]:
+    """
+    Find the most profitable single trade (buy once, sell once later) in one pass.
+
+    For every sell day the best buy is the lowest close seen before it, so the prefix minimum
+    of the close prices gives the best profit per sell day. Ties are resolved the same way
+    as the original nested loop: the earliest buy day wins, then the earliest sell day.
+
+    :param closes: A NumPy array of close prices sorted by date.
+    :return: A (buy_index, sell_index) tuple, or None if no trade makes a profit.
+    """
+    if len(closes) < 2:
+        return None
+
+    # Best profit for every sell day
+    prefix_min = np.minimum.accumulate(closes[:-1])
+    profits = closes[1:] - prefix_min
+    sell_index = int(np.argmax(profits))
+    if not profits[sell_index] > 0:
+        return None
+
+    # Earliest day with the lowest close before the sell day
+    sell_index += 1
+    buy_index = int(np.argmax(closes[:sell_index] == prefix_min[sell_index - 1]))
+    return buy_index, sell_index
+
+
+def calc_profit_multi_tread(closes: np.ndarray) -> float:
+    """
+    Calculate the maximum profit using a multi-trade strategy.
+
+    A stock is bought at the start of every rising run of close prices and sold at its peak,
+    unchanged closes are skipped. The trades are found with vectorized operations and their
+    profits are summed in date order, so the result matches the original loop to the last bit.
+
+    :param closes: A NumPy array of close prices sorted by date.
+    :return: The maximum multi-trade profit.
+    """
+    if len(closes) < 2:
+        return .0
+
+    # Direction of every price change, unchanged days are skipped
+    moves = np.diff(closes)
+    changed = np.flatnonzero(moves)
+    rising = moves[changed] > 0
+    if not rising.any():
+        return .0
+
+    # Buy at the start of a rising run, sell at the start of a falling run
+    previous = np.concatenate(([False], rising[:-1]))
+    buy_days = changed[rising & ~previous]
+    sell_days = changed[~rising & previous]
+
+    # Sell last day
+    sells = closes[sell_days]
+    if len(sells) < len(buy_days):
+        sells = np.append(sells, closes[-1])
+
+    return float(np.add.accumulate(sells - closes[buy_days])[-1])
+
+
+def gain_prefix(closes: np.ndarray) -> np.ndarray:
+    """
+    Build the prefix sums of the positive day over day close changes.
+
+    The multi-trade optimum of a window is the sum of its positive close changes, so with
+    these sums the profit of any window takes two lookups, see `window_multi_trade_profit`.
+
+    :param closes: A NumPy array of close prices sorted by date.
+    :return: An array where position k holds the sum of the positive changes up to day k.
+    """
+    gains = np.maximum(np.diff(closes), 0)
+    return np.concatenate(([.0], np.cumsum(gains)))[:len(closes)]
+
+
+def update_gain_prefix(prefix: np.ndarray, closes: np.ndarray, first_changed: int) -> np.ndarray:
+    """
+    Update the gain prefix sums after the closes changed from a position onwards.
+
+    The sums before the changed position stay the same, only the rest is recalculated,
+    so appending a day costs a single addition on top of the copy.
+
+    :param prefix: The prefix sums of the closes before the change.
+    :param closes: The changed close prices.
+    :param first_changed: The position of the first close that differs.
+    :return: The prefix sums of the changed closes.
+    """
+    if first_changed <= 0 or not len(closes):
+        return gain_prefix(closes)
+
+    first_changed = min(first_changed, len(closes), len(prefix))
+    gains = np.maximum(np.diff(closes[first_changed - 1:]), 0)
+    return np.concatenate((prefix[:first_changed - 1], np.cumsum(np.concatenate(([prefix[first_changed - 1]], gains)))))
+
+
+def window_multi_trade_profit(prefix: np.ndarray, start, stop) -> np.ndarray:
+    """
+    Calculate the multi-trade profit of windows from the gain prefix sums in constant time.
+
+    The result is not bit-identical to `calc_profit_multi_tread` of the window, because the
+    changes are summed in a different order, so compare the results with `exceeds` and never
+    with the engine's exact values. The bounds can be scalars or NumPy arrays.
+
+    :param prefix: The prefix sums built by `gain_prefix`.
+    :param start: The first position of the window.
+    :param stop: The position after the last one of the window, clipped to the series length.
+    :return: The multi-trade profits, zero for windows shorter than two days.
+    """
+    start, stop = np.asarray(start), np.minimum(stop, len(prefix))
+    valid = stop - start >= 2
+    if not len(prefix):
+        return np.zeros(valid.shape)
+
+    # The first day of a window only counts as the base of the next change
+    return np.where(valid, prefix[np.where(valid, stop - 1, 0)] - prefix[np.where(valid, start, 0)], .0)
+
+
+def exceeds(profits, threshold):
+    """
+    Check which profits are larger than a threshold by more than float rounding.
+
+    :param profits: A profit or a NumPy array of profits.
+    :param threshold: The profit to compare with.
+    :return: True where a profit exceeds the threshold by more than `PROFIT_TOLERANCE`.
+    """
+    return np.asarray(profits) - threshold > PROFIT_TOLERANCE
+
+
+def calc_profit(dates: np.ndarray, closes: np.ndarray) -> Dict:
+    """
+    Calculate the profit from a series of stock prices using both single and multi-trade strategies.
+
+    This function calculates the profit for both single trade (buy once, sell once) and multi-trade
+    strategies (buy and sell multiple times) for the given close prices. Both run in linear time.
+
+    :param dates: A NumPy `datetime64[D]` array of trading dates sorted ascending.
+    :param closes: A NumPy array of close prices matching `dates`.
+    :return: A dictionary with profit details for a single trade and multi-trade profit.
+    """
+    return build_profit_result(dates, closes, best_single_trade(closes))
+
+
+def build_profit_result(dates: np.ndarray, closes: np.ndarray, trade: Optional[Tuple[int, int]]) -> Dict:
+    """
+    Build the profit result of a series for an already known best single trade.
+
+    :param dates: A NumPy `datetime64[D]` array of trading dates sorted ascending.
+    :param closes: A NumPy array of close prices matching `dates`.
+    :param trade: The (buy_index, sell_index) of the best single trade, or None if no trade makes a profit.
+    :return: A dictionary with profit details for a single trade and multi-trade profit.
+    """
+    # Check if there is no prices for the given range
+    if not len(closes):
+        return dict(NO_PRICE_DATA)
+
+    result = {
+        "buy_date": dates[0].item(),
+        "sell_date": dates[0].item(),
+        "buy_close": float('inf'),
+        "sell_close": .0,
+        "profit": .0,
+        "max_multi_trade_profit": .0,
+        "stocks_with_better_profit": ""
+    }
+
+    # Single trade
+    if trade:
+        buy, sell = trade
+        result["buy_date"] = dates[buy].item()
+        result["sell_date"] = dates[sell].item()
+        result["buy_close"] = float(closes[buy])
+        result["sell_close"] = float(closes[sell])
+        result["profit"] = float(closes[sell] - closes[buy])
+
+    # Calculate profit with multi trade
+    result["max_multi_trade_profit"] = calc_profit_multi_tread(closes)
+
+    return result
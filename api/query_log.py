@@ -0,0 +1,229 @@
+import logging
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Iterator, List, Optional, Tuple
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+# Statements running longer are logged with their query plan, `STOCK_API_SLOW_QUERY_MS` sets the threshold
+SLOW_QUERY_SECONDS = float(os.environ.get("STOCK_API_SLOW_QUERY_MS", 100)) / 1000
+
+# Statements SQLite can explain, other statements are logged without a query plan
+_EXPLAINABLE = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+
+
+class RequestStats:
+    """
+    The database work of one request, collected by the engine events.
+
+    Attributes:
+        statements: The number of executed SQL statements.
+        statement_seconds: The time spent executing them.
+        checkout_seconds: The time database connections were checked out of the pool.
+    """
+    __slots__ = ("statements", "statement_seconds", "checkout_seconds")
+
+    def __init__(self):
+        self.statements = 0
+        self.statement_seconds = .0
+        self.checkout_seconds = .0
+
+
+class QueryLog:
+    """
+    The statements executed while recording, see `record_queries`.
+
+    Attributes:
+        queries: (statement, seconds) pairs in the order of execution.
+    """
+
+    def __init__(self):
+        self.queries: List[Tuple[str, float]] = []
+
+    def __len__(self) -> int:
+        return len(self.queries)
+
+    @property
+    def seconds(self) -> float:
+        return sum(seconds for _, seconds in self.queries)
+
+    def add(self, statement: str, seconds: float):
+        self.queries.append((statement, seconds))
+
+    def report(self) -> str:
+        # One line per statement with its duration
+        return "\n".join(f"{seconds * 1000:8.2f} ms  {' '.join(statement.split())}"
+                         for statement, seconds in self.queries)
+
+
+class QueryBudgetExceeded(AssertionError):
+    """
+    Raised by `query_budget` when a block executes more statements or takes more SQL time than allowed.
+    """
+
+
+# The statistics of the request being served, worker threads get a copy of the context
+_request_stats: ContextVar[Optional[RequestStats]] = ContextVar("request_stats", default=None)
+
+# Functions called with every executed statement and its duration in seconds
+_observers: List[Callable[[str, float], None]] = []
+
+
+def current_stats() -> Optional[RequestStats]:
+    """
+    Get the statistics of the request being served.
+
+    :return: The statistics, or None outside of `track_request`.
+    """
+    return _request_stats.get()
+
+
+@contextmanager
+def track_request() -> Iterator[RequestStats]:
+    """
+    Collect the statements executed by a request, including those in worker threads it starts with its context.
+
+    :return: The statistics of the request, complete when the block exits.
+    """
+    stats = RequestStats()
+    token = _request_stats.set(stats)
+    try:
+        yield stats
+    finally:
+        _request_stats.reset(token)
+
+
+def add_observer(observer: Callable[[str, float], None]):
+    """
+    Call a function with every statement executed by an instrumented engine and its duration in seconds.
+
+    :param observer: The function, added once.
+    """
+    if observer not in _observers:
+        _observers.append(observer)
+
+
+def remove_observer(observer: Callable[[str, float], None]):
+    if observer in _observers:
+        _observers.remove(observer)
+
+
+@contextmanager
+def record_queries() -> Iterator[QueryLog]:
+    """
+    Record every statement executed by any thread while the block runs, e.g. in tests.
+
+    :return: The log of the statements.
+    """
+    log = QueryLog()
+    add_observer(log.add)
+    try:
+        yield log
+    finally:
+        remove_observer(log.add)
+
+
+@contextmanager
+def query_budget(statements: int, seconds: Optional[float] = None) -> Iterator[QueryLog]:
+    """
+    Assert that a block executes at most a number of statements, to catch N+1 query patterns in tests.
+
+        with query_budget(2):
+            client.get("/stocks/AAPL")
+
+    :param statements: The maximum number of statements.
+    :param seconds: The maximum total SQL time in seconds, None for no limit.
+    :return: The log of the statements.
+    :raises QueryBudgetExceeded: If the block exceeds the budget, listing the statements.
+    """
+    with record_queries() as log:
+        yield log
+    if len(log) > statements:
+        raise QueryBudgetExceeded(f"{len(log)} statements executed, the budget is {statements}:\n{log.report()}")
+    if seconds is not None and log.seconds > seconds:
+        raise QueryBudgetExceeded(f"{log.seconds:.3f} s spent in SQL, the budget is {seconds:.3f} s:\n{log.report()}")
+
+
+def explain(connection, statement: str, parameters) -> Optional[str]:
+    """
+    Get the SQLite query plan of a statement, without running it.
+
+    :param connection: The DBAPI connection the statement ran on.
+    :param statement: The SQL statement.
+    :param parameters: Its parameters.
+    :return: The plan as indented lines, or None if the statement cannot be explained.
+    """
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return None
+    cursor = connection.cursor()
+    try:
+        cursor.execute(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        rows = cursor.fetchall()
+    finally:
+        cursor.close()
+
+    # Every row has a node id, its parent id and a description
+    depth = {0: 0}
+    lines = []
+    for node, parent, _, detail in rows:
+        depth[node] = depth.get(parent, 0) + 1
+        lines.append(f"{'  ' * depth[node]}{detail}")
+    return "\n".join(lines)
+
+
+def _log_slow_query(conn, statement: str, parameters, executemany: bool, elapsed: float):
+    if executemany:
+        parameters = parameters[0] if parameters else ()
+    try:
+        plan = explain(conn.connection, statement, parameters)
+    except Exception as error:
+        plan = f"not available: {error}"
+    logger.warning("Slow query took %.1f ms: %s\nParameters: %r%s", elapsed * 1000, " ".join(statement.split()),
+                   parameters, f"\nQuery plan:\n{plan}" if plan else "")
+
+
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    # Statements of one connection run one after another
+    conn.info["statement_started"] = time.perf_counter()
+
+
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info["statement_started"]
+    stats = _request_stats.get()
+    if stats is not None:
+        stats.statements += 1
+        stats.statement_seconds += elapsed
+    for observer in _observers:
+        observer(statement, elapsed)
+    if elapsed >= SLOW_QUERY_SECONDS:
+        _log_slow_query(conn, statement, parameters, executemany, elapsed)
+
+
+# Engine events of the statement tracking
+_ENGINE_EVENTS = (("before_cursor_execute", _before_cursor_execute), ("after_cursor_execute", _after_cursor_execute))
+
+
+def track_queries(engine: Engine):
+    """
+    Count and time the SQL statements of an engine and log the slow ones, once per engine.
+
+    :param engine: The engine, the `sync_engine` of an async engine.
+    """
+    for name, listener in _ENGINE_EVENTS:
+        if not event.contains(engine, name, listener):
+            event.listen(engine, name, listener)
+
+
+def untrack_queries(engine: Engine):
+    """
+    Remove the statement tracking of an engine, e.g. to measure its overhead.
+
+    :param engine: The engine passed to `track_queries`.
+    """
+    for name, listener in _ENGINE_EVENTS:
+        if event.contains(engine, name, listener):
+            event.remove(engine, name, listener)
@@ -0,0 +1,278 @@
+import hmac
+import json
+import linecache
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Dict, Optional, Tuple
+from urllib.parse import parse_qs
+
+# Profiling is only installed when an admin token is set, requests pass it in a header or a query parameter
+PROFILE_TOKEN = os.environ.get("STOCK_API_PROFILE_TOKEN") or None
+PROFILE_HEADER = "x-profile-token"
+PROFILE_PARAMETER = "profile"
+
+# Directory of the stored profiles
+PROFILE_DIRECTORY = os.environ.get("STOCK_API_PROFILE_DIR", os.path.join(tempfile.gettempdir(), "stock_api_profiles"))
+
+# Seconds between two samples of the thread stacks
+SAMPLE_INTERVAL = 0.001
+
+# IDs of the stored profiles, which are also their file names
+PROFILE_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# Categories of the time breakdown, the innermost frame of a sample that matches one decides
+CATEGORIES = (
+    ("sqlalchemy", ("sqlalchemy/", "aiosqlite/", "sqlite3/"), ()),
+    ("pydantic", ("pydantic/", "pydantic_core/", "fast_json.py", "json/"),
+     ("serialize_response", "jsonable_encoder", "_prepare_response_content")),
+    ("profit_engine", ("profit_engine.py", "trade_tree.py"), ()),
+)
+OTHER_CATEGORY = "other"
+
+# Frames of threads waiting for work, these samples are dropped
+_IDLE_FRAMES = {
+    ("threading.py", "wait"), ("threading.py", "_wait_for_tstate_lock"), ("queue.py", "get"),
+    ("selectors.py", "select"),
+}
+
+# Lines of worker loops blocked on a C queue, e.g. of the executor and aiosqlite threads
+_IDLE_LINE = re.compile(r"\.get\((block=True)?\)$")
+
+# Directory of the application, its frames are labelled relative to it
+_APP_DIRECTORY = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def frame_label(filename: str, function: str, line: int) -> str:
+    """
+    Label a frame as "function (path:line)", with the path relative to the application or the installed packages.
+
+    :param filename: The file of the code.
+    :param function: The function name.
+    :param line: The first line of the function.
+    :return: The label, without the ";" separators of collapsed stacks.
+    """
+    if filename.startswith(_APP_DIRECTORY):
+        filename = filename[len(_APP_DIRECTORY):]
+    elif "site-packages" + os.sep in filename:
+        filename = filename.split("site-packages" + os.sep, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{function} ({filename}:{line})".replace(";", ":")
+
+
+def is_idle(frame) -> bool:
+    """
+    Check if a thread is waiting for work.
+
+    :param frame: The innermost frame of the thread.
+    :return: True if it waits on a lock, a queue or the event loop selector.
+    """
+    code = frame.f_code
+    if (os.path.basename(code.co_filename), code.co_name) in _IDLE_FRAMES:
+        return True
+
+    # Frames that are just starting or finishing have no current line
+    if frame.f_lineno is None:
+        return False
+    return bool(_IDLE_LINE.search(linecache.getline(code.co_filename, frame.f_lineno).strip()))
+
+
+def categorize(frames: Tuple[Tuple[str, str], ...]) -> str:
+    """
+    Find the category of a sample.
+
+    :param frames: (file name, function name) pairs of the stack, the innermost one first.
+    :return: The category of the innermost frame that belongs to one, see `CATEGORIES`.
+    """
+    for filename, function in frames:
+        path = filename.replace(os.sep, "/")
+        for category, paths, functions in CATEGORIES:
+            if function in functions or any(part in path for part in paths):
+                return category
+    return OTHER_CATEGORY
+
+
+class Sampler(threading.Thread):
+    """
+    A sampling profiler of all threads of the process.
+
+    The stacks of the busy threads are read every `interval` seconds, every sample is
+    weighted with the time since the previous one. Threads waiting for work are skipped,
+    but the work of other requests served at the same time is included.
+
+    Attributes:
+        stacks: Microseconds per collapsed stack, "thread;outer frame;...;inner frame".
+        categories: Seconds per category, see `CATEGORIES`.
+        samples: The number of recorded stacks.
+        errors: The number of stacks that could not be read, they are skipped.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL):
+        super().__init__(name="request-profiler", daemon=True)
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.categories: Dict[str, float] = {name: .0 for name, _, _ in CATEGORIES + ((OTHER_CATEGORY, (), ()),)}
+        self.samples = 0
+        self.errors = 0
+        self._done = threading.Event()
+
+    def run(self):
+        names = {}
+        previous = time.perf_counter()
+        while not self._done.wait(self.interval):
+            now = time.perf_counter()
+            weight, previous = now - previous, now
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == self.ident:
+                    continue
+                # The other threads keep running while their frames are read, a sample that fails is skipped
+                try:
+                    self.sample(thread_id, frame, weight, names)
+                except Exception:
+                    self.errors += 1
+
+    def sample(self, thread_id: int, frame, weight: float, names: Dict[int, str]):
+        """
+        Record the stack of one thread, unless it is waiting for work.
+
+        :param thread_id: The ID of the thread.
+        :param frame: The innermost frame of the thread.
+        :param weight: The seconds since the previous sample.
+        :param names: The known thread names by ID, updated for new threads.
+        """
+        if is_idle(frame):
+            return
+        frames = []
+        while frame is not None:
+            code = frame.f_code
+            frames.append((code.co_filename, code.co_name, code.co_firstlineno))
+            frame = frame.f_back
+        if thread_id not in names:
+            names.update((thread.ident, thread.name) for thread in threading.enumerate())
+        labels = [frame_label(*frame) for frame in reversed(frames)]
+        self.stacks[";".join([names.get(thread_id, str(thread_id))] + labels)] += round(weight * 1e6)
+        self.categories[categorize(tuple(frame[:2] for frame in frames))] += weight
+        self.samples += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def collapsed(self) -> str:
+        """
+        Get the samples in the collapsed stack format of flamegraph.pl and speedscope.
+
+        :return: One "stack microseconds" line per distinct stack.
+        """
+        return "".join(f"{stack} {weight}\n" for stack, weight in sorted(self.stacks.items()))
+
+
+def is_authorized(token: Optional[str], given: Optional[str]) -> bool:
+    """
+    Check a profiling token in constant time.
+
+    :param token: The admin token, None if profiling is disabled.
+    :param given: The token of the request.
+    :return: True if both are set and equal.
+    """
+    return token is not None and given is not None and hmac.compare_digest(token.encode(), given.encode())
+
+
+def profile_path(profile_id: str, extension: str) -> Optional[str]:
+    """
+    Get the file of a stored profile.
+
+    :param profile_id: The ID returned in the `X-Profile-Id` header.
+    :param extension: "folded" for the collapsed stacks, "json" for the summary.
+    :return: The path, or None if the ID is malformed.
+    """
+    if not PROFILE_ID.match(profile_id):
+        return None
+    return os.path.join(PROFILE_DIRECTORY, f"{profile_id}.{extension}")
+
+
+class ProfilerMiddleware:
+    """
+    ASGI middleware profiling single requests that carry the admin token.
+
+    A profiled request runs next to a `Sampler`. Its response is held back until the request
+    is finished, then it is sent with an `X-Profile-Id` header and a `Server-Timing` header
+    with the time per category. The collapsed stacks and a JSON summary are stored in
+    `PROFILE_DIRECTORY`, e.g. for `flamegraph.pl` or speedscope.
+
+    Only installed when a token is set, so requests pay nothing when profiling is disabled.
+    """
+
+    def __init__(self, app, token: str, interval: float = SAMPLE_INTERVAL):
+        self.app = app
+        self.token = token
+        self.interval = interval
+
+    def requested(self, scope) -> bool:
+        # The token in the header, or in the query parameter
+        for name, value in scope["headers"]:
+            if name == PROFILE_HEADER.encode():
+                return is_authorized(self.token, value.decode("latin-1"))
+        values = parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_PARAMETER)
+        return bool(values) and is_authorized(self.token, values[0])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.requested(scope):
+            await self.app(scope, receive, send)
+            return
+
+        messages = []
+
+        async def hold(message):
+            messages.append(message)
+
+        sampler = Sampler(self.interval)
+        sampler.start()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, hold)
+        finally:
+            elapsed = time.perf_counter() - started
+            sampler.stop()
+
+        profile_id = uuid.uuid4().hex
+        status_code = next((message["status"] for message in messages if message["type"] == "http.response.start"), 500)
+        store_profile(profile_id, sampler, {
+            "method": scope["method"],
+            "path": scope["path"],
+            "status": status_code,
+            "seconds": elapsed,
+        })
+
+        # Server-Timing durations are in milliseconds
+        timings = [f"{name};dur={seconds * 1000:.1f}" for name, seconds in sampler.categories.items()]
+        timings.append(f"total;dur={elapsed * 1000:.1f}")
+        for message in messages:
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [
+                    (b"x-profile-id", profile_id.encode()),
+                    (b"server-timing", ", ".join(timings).encode()),
+                ]
+            await send(message)
+
+
+def store_profile(profile_id: str, sampler: Sampler, request: Dict):
+    """
+    Write the collapsed stacks and the summary of a profiled request.
+
+    :param profile_id: The ID of the profile.
+    :param sampler: The stopped sampler of the request.
+    :param request: The method, path, status and duration of the request.
+    """
+    os.makedirs(PROFILE_DIRECTORY, exist_ok=True)
+    with open(profile_path(profile_id, "folded"), "w") as file:
+        file.write(sampler.collapsed())
+    with open(profile_path(profile_id, "json"), "w") as file:
+        json.dump({"id": profile_id, **request, "samples": sampler.samples,
+                   "errors": sampler.errors, "categories": sampler.categories}, file)
@@ -0,0 +1,116 @@
+from dataclasses import dataclass
+from datetime import date
+from typing import Dict, List, Optional
+import numpy as np
+
+# Periods of the OHLCV bars
+ROLLUP_PERIODS = ("week", "month", "year")
+
+# Columns of a bar, in the order of `PriceBar`
+_BAR_COLUMNS = ("date", "open", "high", "low", "close", "volume")
+
+# Weekday of the first `datetime64[D]` day, 1970-01-01 was a Thursday (Monday is 0)
+_EPOCH_WEEKDAY = 3
+
+
+def period_keys(dates: np.ndarray, period: str) -> np.ndarray:
+    """
+    Find the first day of the period of every date.
+
+    :param dates: A `datetime64[D]` array.
+    :param period: One of `ROLLUP_PERIODS`, weeks start on Monday.
+    :return: A `datetime64[D]` array with the first day of every date's period.
+    """
+    if period == "week":
+        days = dates.astype(np.int64)
+        return (days - (days + _EPOCH_WEEKDAY) % 7).astype("datetime64[D]")
+    unit = "M" if period == "month" else "Y"
+    return dates.astype(f"datetime64[{unit}]").astype("datetime64[D]")
+
+
+@dataclass(frozen=True)
+class Rollup:
+    """
+    The OHLCV bars of one stock for one period, sorted by date.
+
+    Every bar aggregates the daily prices of one period: the open of the first day, the
+    highest high, the lowest low, the close of the last day and the summed volume. Periods
+    without prices have no bar.
+
+    Attributes:
+        period: One of `ROLLUP_PERIODS`.
+        date: The first day of every bar's period as a `datetime64[D]` array.
+        open, high, low, close: The price columns of the bars.
+        volume: The summed trading volume of the bars.
+    """
+    period: str
+    date: np.ndarray
+    open: np.ndarray
+    high: np.ndarray
+    low: np.ndarray
+    close: np.ndarray
+    volume: np.ndarray
+
+    @classmethod
+    def build(cls, period: str, columns: Dict[str, np.ndarray]) -> "Rollup":
+        """
+        Aggregate daily prices into bars with vectorized operations.
+
+        :param period: One of `ROLLUP_PERIODS`.
+        :param columns: The "date", "open", "high", "low", "close" and "volume" arrays, sorted by date.
+        :return: The bars of the prices.
+        """
+        keys = period_keys(columns["date"], period)
+        if not len(keys):
+            return cls(period, keys, *(np.array([], dtype=columns[name].dtype) for name in _BAR_COLUMNS[1:]))
+
+        # The prices of a period are neighbours, so a bar starts wherever the key changes
+        starts = np.concatenate(([0], np.flatnonzero(keys[1:] != keys[:-1]) + 1))
+        stops = np.concatenate((starts[1:], [len(keys)])) - 1
+        return cls(
+            period,
+            keys[starts],
+            columns["open"][starts],
+            np.maximum.reduceat(columns["high"], starts),
+            np.minimum.reduceat(columns["low"], starts),
+            columns["close"][stops],
+            np.add.reduceat(columns["volume"], starts),
+        )
+
+    def updated(self, columns: Dict[str, np.ndarray], first_changed: int) -> "Rollup":
+        """
+        Create the bars of a changed series, aggregating only the periods from the first changed day on.
+
+        :param columns: The columns of the changed series, see `build`.
+        :param first_changed: The first position of the changed series that differs from the old one.
+        :return: The bars of the changed series.
+        """
+        if first_changed <= 0:
+            return Rollup.build(self.period, columns)
+
+        # Bars before the period of the last unchanged day contain only unchanged prices
+        key = period_keys(columns["date"][first_changed - 1:first_changed], self.period)[0]
+        kept = int(np.searchsorted(self.date, key))
+        start = int(np.searchsorted(columns["date"], key))
+        tail = Rollup.build(self.period, {name: column[start:] for name, column in columns.items()})
+        return Rollup(self.period, *(np.concatenate((getattr(self, name)[:kept], getattr(tail, name)))
+                                     for name in _BAR_COLUMNS))
+
+    def bars(self, start: Optional[date] = None, end: Optional[date] = None) -> List[Dict]:
+        """
+        Build plain dictionaries with the bars whose periods overlap a date range, shaped like `PriceBar`.
+
+        :param start: The first date of the range, None for no lower bound.
+        :param end: The last date of the range, None for no upper bound.
+        :return: One dictionary per bar, the periods containing `start` and `end` are included whole.
+        """
+        lower, upper = 0, len(self.date)
+        if start is not None:
+            key = period_keys(np.array([start], dtype="datetime64[D]"), self.period)[0]
+            lower = int(np.searchsorted(self.date, key))
+        if end is not None:
+            upper = max(lower, int(np.searchsorted(self.date, np.datetime64(end, "D"), side="right")))
+
+        columns = [self.date[lower:upper].astype(str).tolist()]
+        columns += [getattr(self, name)[lower:upper].tolist() for name in _BAR_COLUMNS[1:]]
+        return [dict(zip(_BAR_COLUMNS, row)) for row in zip(*columns)]
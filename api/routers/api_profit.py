@@ -1,9 +1,17 @@
-from datetime import datetime, timedelta, date
-from typing import List, Dict
-from fastapi import Depends, APIRouter, status, HTTPException, Path, Body
-from database import get_db, Stock, StockPrice
+import copy
+from concurrent.futures import ThreadPoolExecutor
+from functools import cached_property
+from datetime import datetime, date
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from fastapi import Depends, APIRouter, status, HTTPException, Path, Body, Query
+from database import get_db, Stock
+from sqlalchemy import Row
 from sqlalchemy.orm import Session
 from schemas import ProfitInput
+from profit_engine import build_profit_result, exceeds
+from price_store import price_store, PriceUniverse
+from profit_cache import profit_cache
 
 
 router = APIRouter(
@@ -12,160 +20,206 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
+# Limits of the batch endpoint
+MAX_BATCH_SIZE = 1000
+MAX_BATCH_WORKERS = 8
 
-def calc_profit_multi_tread(prices: List[StockPrice]) -> float:
-    """
-    Calculate the maximum profit using a multi-trade strategy.
-
-    This function calculates the maximum profit that can be obtained by performing multiple
-    trades, where a stock is bought when its price is expected to rise, and sold when its price
-    decreases. It iterates through the prices and calculates the total profit from all successful trades.
 
-    :param prices: A list of stock price objects for a given period.
-    :return: The maximum multi-trade profit.
-    """
-    max_multi_trade_profit: float = 0
-    bought_price: float = 0
-    for i in range(len(prices) - 1):
-        if prices[i].close == prices[i + 1].close:
-            continue
-
-        # Buy
-        if bought_price == 0:
-            if prices[i].close < prices[i + 1].close:
-                bought_price = prices[i].close
-        # Sell
-        elif prices[i].close > prices[i + 1].close:
-            max_multi_trade_profit += float(prices[i].close) - bought_price
-            bought_price = 0
-    # Sell last day
-    if bought_price != 0 and bought_price < prices[-1].close:
-        max_multi_trade_profit += prices[-1].close - bought_price
-
-    return max_multi_trade_profit
-
-
-def calc_profit(prices: List[StockPrice]) -> Dict:
+def shift_trade(trade: Optional[Tuple[int, int]], offset: int) -> Optional[Tuple[int, int]]:
     """
-    Calculate the profit from a series of stock prices using both single and multi-trade strategies.
+    Make the positions of a trade relative to the start of its period.
 
-    This function calculates the profit for both single trade (buy once, sell once) and multi-trade
-    strategies (buy and sell multiple times) for the given list of stock prices.
-
-    :param prices: A list of StockPrice objects sorted by date.
-    :return: A dictionary with profit details for a single trade and multi-trade profit.
+    :param trade: The (buy_index, sell_index) positions in the whole series, or None.
+    :param offset: The position where the period starts.
+    :return: The positions inside the period, or None.
     """
-    # Check if there is no prices for the given range
-    if not prices:
-        return {"detail": "No price data available for the given range"}
-
-    result = {
-        "buy_date": prices[0].date,
-        "sell_date": prices[0].date,
-        "buy_close": float('inf'),
-        "sell_close": .0,
-        "profit": .0,
-        "max_multi_trade_profit": .0,
-        "stocks_with_better_profit": ""
-    }
-
-    # Calculate profit with single trade
-    counter: int = 0
-    for price_buy in prices[:-1]:
-        counter += 1
-        if price_buy.close < result["buy_close"]:
-            # Find max profit
-            for price_sell in prices[counter:]:
-                new_profit = price_sell.close - price_buy.close
-                if new_profit > result["profit"]:
-                    # Save if new profit is better
-                    result["buy_date"] = price_buy.date
-                    result["sell_date"] = price_sell.date
-                    result["buy_close"] = price_buy.close
-                    result["sell_close"] = price_sell.close
-                    result["profit"] = new_profit
-
-    # Calculate profit with multi trade
-    result["max_multi_trade_profit"] = calc_profit_multi_tread(prices)
-
-    return result
+    if trade is None:
+        return None
+    return trade[0] - offset, trade[1] - offset
 
 
 def get_profit_result(stock_id: int, start_date: date, end_date: date,
                       db: Session, multi_trade_only: bool = False) -> Dict[str, Dict]:
     """
-    Fetch prices for the main, pre, and post periods, and calculate the profit for each period.
+    Slice the prices for the main, pre, and post periods, and calculate the profit for each period.
 
-    The function retrieves stock prices for three periods: main, pre, and post. It
-    calculates both single trade and multi-trade profits for each period and returns
-    the results.
+    The function takes the stock prices for three periods from the in-memory price store: main,
+    pre, and post. The pre and post periods have as many trading days as the main period. It
+    calculates both single trade and multi-trade profits for each period and returns the results.
 
     :param stock_id: The ID of the stock.
     :param start_date: The start date for the profit calculation.
     :param end_date: The end date for the profit calculation.
-    :param db: The database session used to query stock prices.
-    :param multi_trade_only: If True, only returns multi-trade profits. Default is False.
+    :param db: The database session used if the price store is not loaded yet.
+    :param multi_trade_only: If True, only returns multi-trade profits from the prefix sums, which are not
+        bit-identical to the full results. Default is False.
     :return: A dictionary with profit results for the main, pre, and post periods.
     """
-    # Get the prices for the Main Period
-    prices = db.query(StockPrice).filter(
-        StockPrice.stock_id == stock_id,
-        StockPrice.date >= start_date,
-        StockPrice.date <= end_date
-    ).order_by(StockPrice.date).all()
-
-    # Get the prices for the Pre Period
-    delta_days = len(prices)
-    prices_pre = db.query(StockPrice).filter(
-        StockPrice.stock_id == stock_id,
-        StockPrice.date <= start_date - timedelta(days=1)
-    ).order_by(StockPrice.date.desc()).limit(delta_days).all()
-    prices_pre = sorted(prices_pre, key=lambda x: x.date)
-
-    # Get the prices for the Post Period
-    prices_post = db.query(StockPrice).filter(
-        StockPrice.stock_id == stock_id,
-        StockPrice.date >= end_date + timedelta(days=1),
-    ).order_by(StockPrice.date).limit(delta_days).all()
+    series = price_store.get(db, stock_id)
+
+    # Get the bounds of the Main, Pre and Post Periods
+    start, stop = series.window(start_date, end_date)
+    delta_days = stop - start
+    periods = {
+        "main_period": slice(start, stop),
+        "pre_period": slice(max(0, start - delta_days), start),
+        "post_period": slice(stop, stop + delta_days)
+    }
 
     if not multi_trade_only:
-        return {
-            "main_period": calc_profit(prices),
-            "pre_period": calc_profit(prices_pre),
-            "post_period": calc_profit(prices_post)
-        }
+        # The best single trade of every period comes from the segment tree of the stock
+        return {period: build_profit_result(series.date[bounds], series.close[bounds],
+                                            shift_trade(series.trade_tree.best_trade(bounds.start, bounds.stop),
+                                                        bounds.start))
+                for period, bounds in periods.items()}
     else:
-        return {
-            "main_period": {"max_multi_trade_profit": calc_profit_multi_tread(prices)},
-            "pre_period": {"max_multi_trade_profit": calc_profit_multi_tread(prices_pre)},
-            "post_period": {"max_multi_trade_profit": calc_profit_multi_tread(prices_post)}
-        }
+        # Two prefix sum lookups per period, equal to the full results up to float rounding, see `exceeds`
+        return {period: {"max_multi_trade_profit": series.multi_trade_profit(bounds.start, bounds.stop)}
+                for period, bounds in periods.items()}
+
+
+class ProfitCalculator:
+    """
+    Calculate profits for the items of one request, sharing work between them.
+
+    The stocks are read from the database once, when the first item is not in the profit
+    cache. Every (stock, start date, end date) combination is calculated at most once, and
+    the multi-trade profits of all stocks are calculated once per date range, so repeated
+    items and items sharing a date range reuse the earlier results.
+
+    The async handlers read the stocks beforehand and pass them in, because they cannot
+    query through the async session from inside the calculation.
+    """
+
+    def __init__(self, db: Optional[Session], stocks: Optional[List[Row]] = None):
+        self.db = db
+        if stocks is not None:
+            self.stocks = stocks
+        self._results: Dict[Tuple[int, date, date], Dict[str, Dict]] = {}
+        self._universe_profits: Dict[Tuple[date, date], Tuple[PriceUniverse, Dict[str, np.ndarray]]] = {}
+
+    @cached_property
+    def stocks(self) -> List[Row]:
+        return self.db.query(Stock.id, Stock.ticker, Stock.name).order_by(Stock.id).all()
+
+    @cached_property
+    def _stocks_by_ticker(self) -> Dict[str, Row]:
+        return {stock.ticker: stock for stock in self.stocks}
+
+    @cached_property
+    def _names(self) -> Dict[int, str]:
+        return {stock.id: stock.name for stock in self.stocks}
+
+    def get_universe_profits(self, start_date: date, end_date: date) -> Tuple[PriceUniverse, Dict[str, np.ndarray]]:
+        """
+        Get the multi-trade profits of all stocks for the periods of a date range, calculating them only once.
+
+        :return: A tuple with the price universe and one profit array per period, aligned with its stock IDs.
+        """
+        key = (start_date, end_date)
+        if key not in self._universe_profits:
+            universe = price_store.universe(self.db)
+            self._universe_profits[key] = universe, universe.multi_trade_profits(start_date, end_date)
+        return self._universe_profits[key]
+
+    def get_result(self, stock_id: int, start_date: date, end_date: date) -> Dict[str, Dict]:
+        """
+        Get the results of `get_profit_result`, calculating them only the first time.
+
+        :return: A dictionary with profit results for the main, pre, and post periods.
+        """
+        key = (stock_id, start_date, end_date)
+        if key not in self._results:
+            self._results[key] = get_profit_result(stock_id, start_date, end_date, self.db)
+        return self._results[key]
+
+    def calculate(self, profit_input: ProfitInput) -> Dict[str, Dict]:
+        """
+        Calculate the profit of a stock and find the stocks with a better multi-trade profit.
+
+        The results are served from the profit cache when possible.
+
+        :param profit_input: The ticker and the date range.
+        :return: A dictionary with profit results for the main, pre, and post periods.
+        """
+        key = (profit_input.ticker, profit_input.start_date, profit_input.end_date)
+        return profit_cache.get_or_compute(key, lambda: self._calculate(profit_input))
+
+    def _calculate(self, profit_input: ProfitInput) -> Dict[str, Dict]:
+        stock = self._stocks_by_ticker.get(profit_input.ticker)
+        if not stock:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+        # Parse the start and end date
+        try:
+            start_date = datetime.strptime(profit_input.start_date, "%m/%d/%Y").date()
+            end_date = datetime.strptime(profit_input.end_date, "%m/%d/%Y").date()
+        except:
+            raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date has wrong format")
+
+        # Get the results of specified stock, a copy keeps the shared results unchanged
+        result = copy.deepcopy(self.get_result(stock.id, start_date, end_date))
+
+        # Get the stocks with better profit in same periods, all stocks are compared at once. The
+        # prefix sums round differently than the profit engine, so the stock's own universe profit is
+        # the threshold, and stocks within float rounding of it tie
+        universe, profits = self.get_universe_profits(start_date, end_date)
+        own = int(np.searchsorted(universe.stock_ids, stock.id))
+        if own == len(universe.stock_ids) or universe.stock_ids[own] != stock.id:
+            return result
+        others = universe.stock_ids != stock.id
+        for period in ['main_period', 'pre_period', 'post_period']:
+            if result[period].get("max_multi_trade_profit"):
+                better = others & exceeds(profits[period], profits[period][own])
+                result[period]["stocks_with_better_profit"] = "".join(
+                    self._names[stock_id] + ", " for stock_id in universe.stock_ids[better].tolist()
+                    if stock_id in self._names
+                )
+
+        return result
+
+    def calculate_batch(self, profit_inputs: List[ProfitInput], workers: int = 1) -> List[Dict]:
+        """
+        Calculate the profits of many items, an invalid item gets an error detail instead of results.
+
+        :param profit_inputs: The tickers and date ranges.
+        :param workers: The number of threads calculating the items.
+        :return: The results in the order of the items.
+        """
+        def calculate_item(profit_input: ProfitInput) -> Dict:
+            try:
+                return self.calculate(profit_input)
+            except HTTPException as error:
+                return {"detail": error.detail}
+
+        # Calculate each distinct item once
+        unique_inputs = {(item.ticker, item.start_date, item.end_date): item for item in profit_inputs}
+        if workers > 1 and len(unique_inputs) > 1:
+            # Load the price store and the stocks first, so the threads never use the shared session
+            price_store.load(self.db)
+            self._stocks_by_ticker, self._names
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                results = dict(zip(unique_inputs, executor.map(calculate_item, unique_inputs.values())))
+        else:
+            results = {key: calculate_item(item) for key, item in unique_inputs.items()}
+
+        return [results[(item.ticker, item.start_date, item.end_date)] for item in profit_inputs]
 
 
 @router.post("/", status_code=status.HTTP_200_OK)
 def calculate_profit(profit_input: ProfitInput = Body(...),
                      db: Session = Depends(get_db)):
-    stock = db.query(Stock).filter(Stock.ticker == profit_input.ticker).first()
-    if not stock:
-        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
-
-    # Parse the start and end date
-    try:
-        start_date = datetime.strptime(profit_input.start_date, "%m/%d/%Y").date()
-        end_date = datetime.strptime(profit_input.end_date, "%m/%d/%Y").date()
-    except:
-        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date has wrong format")
-
-    # Get the results of specified stock
-    result = get_profit_result(stock.id, start_date, end_date, db)
-
-    # Get the stocks with better profit in same periods
-    all_other_stocks = db.query(Stock).filter(Stock.ticker != profit_input.ticker).all()
-    for other_stock in all_other_stocks:
-        other_res = get_profit_result(other_stock.id, start_date, end_date, db, True)
-        for period in ['main_period', 'pre_period', 'post_period']:
-            if (result[period].get("max_multi_trade_profit") and
-                    result[period]["max_multi_trade_profit"] < other_res[period]["max_multi_trade_profit"]):
-                result[period]["stocks_with_better_profit"] += other_stock.name + ", "
+    return ProfitCalculator(db).calculate(profit_input)
+
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+def get_profit_cache_stats():
+    return profit_cache.stats()
+
 
-    return result
+@router.post("/batch", status_code=status.HTTP_200_OK)
+def calculate_profit_batch(profit_inputs: List[ProfitInput] = Body(..., max_length=MAX_BATCH_SIZE),
+                           workers: int = Query(1, ge=1, le=MAX_BATCH_WORKERS,
+                                                description="Threads calculating the items in parallel"),
+                           db: Session = Depends(get_db)):
+    return ProfitCalculator(db).calculate_batch(profit_inputs, workers)
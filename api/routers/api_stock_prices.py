@@ -1,9 +1,24 @@
-from datetime import datetime
-from fastapi import Depends, APIRouter, status, HTTPException, Path, Body
-from typing import List
-from database import get_db, Stock, StockPrice
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, date
+from fastapi import Depends, APIRouter, status, HTTPException, Path, Body, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from typing import List, Dict, Iterator, Optional, Tuple
+import numpy as np
+from database import get_db, SessionLocal, Stock, StockPrice
+from sqlalchemy import select, Select, delete, update, bindparam, Delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from schemas import StockPriceCreate, StockPriceResponse
+from schemas import StockPriceCreate, StockPriceResponse, StockPriceUpdate, PriceBar
+from price_store import price_store, price_columns, PRICE_COLUMNS, PriceSeries
+from price_upload import UPLOAD_REQUEST_BODY, upload_prices
+from profit_cache import profit_cache
+from rollups import ROLLUP_PERIODS
+from indicators import INDICATORS, indicator_params
+from fast_json import FastJSONResponse, dumps, row_dicts
+from price_export import EXPORT_MEDIA_TYPES, EXPORT_RESPONSES, COLUMNAR_FORMATS, negotiate_format, select_tickers, \
+    series_columns, concat_columns, export_response
 
 router = APIRouter(
     prefix="/prices",
@@ -12,17 +27,317 @@ router = APIRouter(
 )
 
 
+# Columns of a price row, in the order of `StockPriceResponse`
+PRICE_FIELDS = ("date", "open", "high", "low", "close", "adj_close", "volume", "id", "stock_id")
+
+# Rows read from the database per query when streaming
+STREAM_BATCH_SIZE = 1000
+
+# Maximum number of items of a bulk update
+MAX_BULK_UPDATES = 10000
+
+
+@dataclass(frozen=True)
+class PriceQuery:
+    """
+    The prices of one stock requested from the list endpoint.
+
+    Attributes:
+        stock_id: The ID of the stock.
+        start: The first date of the range, None for no lower bound.
+        end: The last date of the range, None for no upper bound.
+        fields: The columns to return, always starting with "date".
+    """
+    stock_id: int
+    start: Optional[date] = None
+    end: Optional[date] = None
+    fields: Tuple[str, ...] = PRICE_FIELDS
+
+
+def parse_fields(fields: Optional[str]) -> Tuple[str, ...]:
+    """
+    Parse the comma separated `fields` query parameter.
+
+    :param fields: The requested columns, e.g. "close,volume", None for all of them.
+    :return: The requested columns in `PRICE_FIELDS` order, "date" is always included.
+    """
+    if not fields:
+        return PRICE_FIELDS
+
+    requested = {field.strip() for field in fields.split(",") if field.strip()}
+    unknown = requested.difference(PRICE_FIELDS)
+    if unknown:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"Unknown fields: {', '.join(sorted(unknown))}")
+    requested.add("date")
+    return tuple(field for field in PRICE_FIELDS if field in requested)
+
+
+def build_price_select(price_query: PriceQuery, after: Optional[date], limit: Optional[int]) -> Select:
+    """
+    Build the query of one page of a stock's prices sorted by date.
+
+    The date range and the column projection are part of the SQL query, so only the
+    requested rows and columns are read.
+
+    :param price_query: The stock, date range and columns to read.
+    :param after: Only prices after this date are returned (the keyset cursor), None for the first page.
+    :param limit: The maximum number of prices, None for all of them.
+    :return: The select statement.
+    """
+    query = (
+        select(*(getattr(StockPrice, field) for field in price_query.fields))
+        .where(StockPrice.stock_id == price_query.stock_id)
+        .order_by(StockPrice.date)
+        .limit(limit)
+    )
+    if price_query.start is not None:
+        query = query.where(StockPrice.date >= price_query.start)
+    if price_query.end is not None:
+        query = query.where(StockPrice.date <= price_query.end)
+    if after is not None:
+        query = query.where(StockPrice.date > after)
+    return query
+
+
+def select_prices(db: Session, price_query: PriceQuery, after: Optional[date], limit: Optional[int]) -> List[Dict]:
+    """
+    Read one page of a stock's prices sorted by date as plain tuples, without building ORM objects.
+
+    :param db: The database session used to query the prices.
+    :param price_query: The stock, date range and columns to read.
+    :param after: Only prices after this date are returned (the keyset cursor), None for the first page.
+    :param limit: The maximum number of prices, None for all of them.
+    :return: A list of price dictionaries with the requested fields.
+    """
+    rows = db.execute(build_price_select(price_query, after, limit))
+    return row_dicts(price_query.fields, rows)
+
+
+def stream_prices(price_query: PriceQuery, after: Optional[date], limit: Optional[int]) -> Iterator[str]:
+    """
+    Yield a stock's prices as NDJSON lines, reading them from the database in batches.
+
+    The generator uses its own session, because it keeps running after the request
+    handler has returned.
+
+    :param price_query: The stock, date range and columns to read.
+    :param after: Only prices after this date are returned, None to start at the first price.
+    :param limit: The maximum number of prices, None for all of them.
+    :return: An iterator of encoded JSON lines, one price per line.
+    """
+    remaining = limit
+    with SessionLocal() as db:
+        while remaining is None or remaining > 0:
+            batch_size = STREAM_BATCH_SIZE if remaining is None else min(STREAM_BATCH_SIZE, remaining)
+            rows = select_prices(db, price_query, after, batch_size)
+            if not rows:
+                return
+            yield b"".join(dumps(row) + b"\n" for row in rows)
+
+            after = rows[-1]["date"]
+            if remaining is not None:
+                remaining -= len(rows)
+            if len(rows) < batch_size:
+                return
+
+
+def price_page(prices: List[Dict], limit: Optional[int]) -> FastJSONResponse:
+    """
+    Turn the prices read for a page into the response of the list endpoint.
+
+    The rows come from the database, so they are encoded without validating them
+    against `StockPriceResponse`, which would cost more than the query itself.
+
+    :param prices: The prices read with one row more than the limit.
+    :param limit: The maximum number of prices, None for all of them.
+    :return: The JSON response of the page, with the cursor of the next page in the X-Next-Cursor header.
+    """
+    headers = {}
+    if limit and len(prices) > limit:
+        prices = prices[:limit]
+        headers["X-Next-Cursor"] = prices[-1]["date"].isoformat()
+    return FastJSONResponse(content=prices, headers=headers)
+
+
+def export_prices(series: PriceSeries, price_query: PriceQuery, after: Optional[date], limit: Optional[int],
+                  export_format: str, ticker: str) -> Response:
+    """
+    Export one page of a stock's prices as a columnar file, built from the price store columns.
+
+    :param series: The price series of the stock.
+    :param price_query: The date range and columns to export.
+    :param after: Only prices after this date are exported (the keyset cursor), None for the first page.
+    :param limit: The maximum number of prices, None for all of them.
+    :param export_format: One of `COLUMNAR_FORMATS`.
+    :param ticker: The ticker of the stock, used as the file name.
+    :return: The response with the file, with the cursor of the next page in the X-Next-Cursor header.
+    """
+    columns, more = series_columns(series, price_query.fields, price_query.start, price_query.end, after, limit)
+    headers = {"X-Next-Cursor": str(columns["date"][-1])} if more else None
+    return export_response(columns, export_format, ticker, headers)
+
+
+def parse_period(period: str) -> str:
+    """
+    Check the `period` query parameter of the bars endpoint.
+
+    :param period: The requested period, e.g. "month".
+    :return: The period, a 406 error is raised if it is not one of `ROLLUP_PERIODS`.
+    """
+    if period not in ROLLUP_PERIODS:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"Unknown period, use one of: {', '.join(ROLLUP_PERIODS)}")
+    return period
+
+
+def indicator_page(series: PriceSeries, indicator: str, start: Optional[date], end: Optional[date],
+                   **params) -> FastJSONResponse:
+    """
+    Build the response of the indicators endpoint from the indicator cached on the price series.
+
+    :param series: The price series of the stock.
+    :param indicator: The name of the indicator, a 406 error is raised if it is not one of `INDICATORS`.
+    :param start: The first date of the range, None for no lower bound.
+    :param end: The last date of the range, None for no upper bound.
+    :param params: The parameters of the indicator, None values take the default.
+    :return: The JSON response with the date and the indicator values of every price in the range.
+    """
+    if indicator not in INDICATORS:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE,
+                            detail=f"Unknown indicator, use one of: {', '.join(INDICATORS)}")
+
+    # The indicator covers the full history, the range only selects the returned rows
+    values = series.indicator(indicator, indicator_params(indicator, **params))
+    lower = 0 if start is None else int(np.searchsorted(series.date, np.datetime64(start, "D"), side="left"))
+    upper = len(series) if end is None else int(np.searchsorted(series.date, np.datetime64(end, "D"), side="right"))
+    upper = max(lower, upper)
+    columns = {"date": series.date[lower:upper].astype(str).tolist(), **values.values(lower, upper)}
+    return FastJSONResponse(content=row_dicts(tuple(columns), zip(*columns.values())))
+
+
+def build_range_delete(stock_id: int, start: date, end: date) -> Delete:
+    """
+    Build the statement deleting all prices of a stock between two dates, both included.
+
+    :param stock_id: The ID of the stock.
+    :param start: The first date of the range.
+    :param end: The last date of the range.
+    :return: The delete statement.
+    """
+    return (
+        delete(StockPrice.__table__)
+        .where(StockPrice.stock_id == stock_id)
+        .where(StockPrice.date.between(start, end))
+    )
+
+
+def update_prices(db: Session, stock_id: int,
+                  updates: List[StockPriceUpdate]) -> Tuple[List[date], Dict[str, np.ndarray]]:
+    """
+    Apply partial updates to the prices of a stock in the session's transaction.
+
+    Updates changing the same columns are applied with one executemany UPDATE statement,
+    later updates of a date override earlier ones. The caller commits.
+
+    :param db: The database session.
+    :param stock_id: The ID of the stock.
+    :param updates: The date and the changed columns of every price.
+    :return: The dates without a price, and the updated prices as NumPy columns (see `PRICE_COLUMNS`).
+    """
+    changes: Dict[date, Dict] = {}
+    for item in updates:
+        changes.setdefault(item.date, {}).update(item.model_dump(exclude_none=True, exclude={"date"}))
+
+    # Find the dates that have a price
+    existing = set(db.scalars(
+        select(StockPrice.date).where(StockPrice.stock_id == stock_id).where(StockPrice.date.in_(list(changes)))
+    )) if changes else set()
+    missing = sorted(set(changes) - existing)
+
+    # One statement per set of changed columns
+    groups = defaultdict(list)
+    for day, values in changes.items():
+        if day in existing and values:
+            groups[tuple(sorted(values))].append({"match_date": day, **values})
+    for names, params in groups.items():
+        db.execute(
+            update(StockPrice.__table__)
+            .where(StockPrice.stock_id == stock_id)
+            .where(StockPrice.date == bindparam("match_date"))
+            .values({name: bindparam(name) for name in names}),
+            params
+        )
+
+    # Read the updated prices back for the price store
+    updated = sorted(day for day, values in changes.items() if day in existing and values)
+    rows = db.execute(
+        select(*(getattr(StockPrice, name) for name in PRICE_COLUMNS))
+        .where(StockPrice.stock_id == stock_id)
+        .where(StockPrice.date.in_(updated))
+    ) if updated else []
+    return missing, price_columns(row._mapping for row in rows)
+
+
+# Export the Prices of many Stocks as one file, registered before "/{ticker}" which would match "/export"
+@router.get("/export", status_code=status.HTTP_200_OK, response_class=Response, responses=EXPORT_RESPONSES)
+def export_stock_prices(request: Request,
+                        tickers: Optional[str] = Query(None, example="AAPL,AMZN",
+                                                       description="Comma separated tickers, all stocks if empty"),
+                        start: Optional[date] = Query(None, description="First date of the range"),
+                        end: Optional[date] = Query(None, description="Last date of the range"),
+                        fields: Optional[str] = Query(None, example="close,volume",
+                                                      description="Comma separated columns to return, "
+                                                                  "the date is always included"),
+                        format: Optional[str] = Query(None, description="File format: csv, arrow or parquet, "
+                                                                        "overrides the Accept header"),
+                        db: Session = Depends(get_db)):
+    export_format = negotiate_format(format, request.headers.get("accept"), COLUMNAR_FORMATS, "csv")
+    fields = parse_fields(fields)
+
+    # Join the columns of the stocks, read from the price store
+    stocks = select_tickers(tickers, dict(db.query(Stock.ticker, Stock.id).all()))
+    columns = concat_columns([
+        (ticker, series_columns(price_store.get(db, stock_id), fields, start, end)[0]) for ticker, stock_id in stocks
+    ])
+    return export_response(columns, export_format, "prices")
+
+
 # Get all Prices for one Stock
-@router.get("/{ticker}", response_model=List[StockPriceResponse], status_code=status.HTTP_200_OK)
-def get_all_stock_prices(ticker: str = Path(..., example="AAPL"),
+@router.get("/{ticker}", response_model=List[StockPriceResponse], status_code=status.HTTP_200_OK,
+            responses=EXPORT_RESPONSES)
+def get_all_stock_prices(request: Request,
+                         ticker: str = Path(..., example="AAPL"),
+                         start: Optional[date] = Query(None, description="First date of the range"),
+                         end: Optional[date] = Query(None, description="Last date of the range"),
+                         fields: Optional[str] = Query(None, example="close,volume",
+                                                       description="Comma separated columns to return, "
+                                                                   "the date is always included"),
+                         after: Optional[date] = Query(None, description="Return prices after this date, "
+                                                                         "use the X-Next-Cursor header of a page"),
+                         limit: Optional[int] = Query(None, ge=1, description="Maximum number of prices"),
+                         stream: bool = Query(False, description="Stream the prices as NDJSON"),
+                         format: Optional[str] = Query(None, description="Response format: json, csv, arrow or "
+                                                                         "parquet, overrides the Accept header"),
                          db: Session = Depends(get_db)):
     # Find Stock
-    stock = db.query(Stock).filter(Stock.ticker == ticker).first()
-    if not stock:
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+    price_query = PriceQuery(stock_id, start, end, parse_fields(fields))
+
+    # Export prices for specified Stock as a columnar file, read from the price store
+    export_format = negotiate_format(format, request.headers.get("accept"), tuple(EXPORT_MEDIA_TYPES), "json")
+    if export_format != "json":
+        return export_prices(price_store.get(db, stock_id), price_query, after, limit, export_format, ticker)
 
-    # Get prices for specified Stock
-    return stock.prices
+    # Stream prices for specified Stock
+    if stream:
+        return StreamingResponse(stream_prices(price_query, after, limit), media_type="application/x-ndjson")
+
+    # Get prices for specified Stock, one extra row tells if there is a next page
+    prices = select_prices(db, price_query, after, limit + 1 if limit else None)
+    return price_page(prices, limit)
 
 
 # Add Stock Prices
@@ -35,16 +350,6 @@ def add_stock_price(ticker: str = Path(..., example="AAPL"),
     if not stock:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
 
-    # Check if date already exists
-    stock_price = (
-        db.query(StockPrice)
-        .filter(StockPrice.stock_id == stock.id)
-        .filter(StockPrice.date == price.date)
-        .first()
-    )
-    if stock_price:
-        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date already exists")
-
     # Add Stock Price
     db_price = StockPrice(
         stock_id=stock.id,
@@ -57,7 +362,117 @@ def add_stock_price(ticker: str = Path(..., example="AAPL"),
         volume=price.volume
     )
     db.add(db_price)
+
+    # Commit the changes, the unique (stock_id, date) index rejects existing dates
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date already exists")
+    price_store.upsert(stock.id, db_price)
+    profit_cache.invalidate(ticker)
+
+
+# Add or update many Stock Prices
+@router.post("/{ticker}/bulk", status_code=status.HTTP_200_OK, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upsert_stock_prices(request: Request,
+                              ticker: str = Path(..., example="AAPL"),
+                              db: Session = Depends(get_db)):
+    # Check if stock exists
+    stock_id = await run_in_threadpool(lambda: db.query(Stock.id).filter(Stock.ticker == ticker).scalar())
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+    # Upsert the prices while the body arrives, the database work runs in the threadpool
+    def run_db(function, *args):
+        return run_in_threadpool(function, db, *args)
+
+    summary, prices = await upload_prices(request, stock_id, run_db)
+
+    # Commit all batches at once
+    await run_in_threadpool(db.commit)
+    if prices:
+        price_store.upsert_many(stock_id, prices)
+        profit_cache.invalidate(ticker)
+    return summary
+
+
+# Update many Stock Prices
+@router.patch("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+def update_stock_prices(ticker: str = Path(..., example="AAPL"),
+                        updates: List[StockPriceUpdate] = Body(..., max_length=MAX_BULK_UPDATES),
+                        db: Session = Depends(get_db)):
+    # Check if stock exists
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+    # Update the prices in one transaction
+    missing, prices = update_prices(db, stock_id, updates)
     db.commit()
+    if len(prices["date"]):
+        price_store.upsert_many(stock_id, prices)
+        profit_cache.invalidate(ticker)
+    return {"updated": len(prices["date"]), "not_found": missing}
+
+
+# Delete Stock Prices in a date range
+@router.delete("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+def delete_stock_prices(ticker: str = Path(..., example="AAPL"),
+                        start: date = Query(..., description="First date of the range"),
+                        end: date = Query(..., description="Last date of the range"),
+                        db: Session = Depends(get_db)):
+    # Check if stock exists
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+    # Delete the prices with one statement
+    deleted = db.execute(build_range_delete(stock_id, start, end)).rowcount
+    db.commit()
+    if deleted:
+        price_store.delete_range(stock_id, start, end)
+        profit_cache.invalidate(ticker)
+    return {"deleted": deleted}
+
+
+# Get weekly, monthly or yearly bars of a Stock
+@router.get("/{ticker}/bars", response_model=List[PriceBar], status_code=status.HTTP_200_OK)
+def get_stock_price_bars(ticker: str = Path(..., example="AAPL"),
+                         period: str = Query("month", description="Period of the bars: week, month or year"),
+                         start: Optional[date] = Query(None, description="First date of the range"),
+                         end: Optional[date] = Query(None, description="Last date of the range"),
+                         db: Session = Depends(get_db)):
+    period = parse_period(period)
+
+    # Find Stock
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+    # Get the bars materialized in the price store
+    rollup = price_store.get(db, stock_id).rollups[period]
+    return FastJSONResponse(content=rollup.bars(start, end))
+
+
+# Get a technical indicator of a Stock
+@router.get("/{ticker}/indicators/{indicator}", status_code=status.HTTP_200_OK)
+def get_stock_price_indicator(ticker: str = Path(..., example="AAPL"),
+                              indicator: str = Path(..., example="sma",
+                                                    description="sma, ema, rsi, bollinger, volatility or vwap"),
+                              window: Optional[int] = Query(None, ge=2, le=1000, description="Window length in days"),
+                              width: Optional[float] = Query(None, gt=0, description="Width of the Bollinger bands "
+                                                                                     "in standard deviations"),
+                              start: Optional[date] = Query(None, description="First date of the range"),
+                              end: Optional[date] = Query(None, description="Last date of the range"),
+                              db: Session = Depends(get_db)):
+    # Find Stock
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+
+    # Get the indicator over the full history, computed once per parameters and updated after writes
+    return indicator_page(price_store.get(db, stock_id), indicator, start, end, window=window, width=width)
 
 
 # Get Stock Price
@@ -73,21 +488,19 @@ def get_stock_price(ticker: str = Path(..., example="AAPL"),
     except:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date has wrong format")
 
-    # Find Stock Price
-    stock_price = (
-        db.query(StockPrice)
-        .join(Stock, Stock.id == StockPrice.stock_id)
-        .filter(Stock.ticker == ticker)
-        .filter(StockPrice.date == parsed_date)
-        .first()
-    )
+    # Find Stock
+    stock_id = db.query(Stock.id).filter(Stock.ticker == ticker).scalar()
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock or date not found")
 
-    # Check if stock and price exist on specified date
-    if not stock_price:
+    # Check if price exists on specified date
+    series = price_store.get(db, stock_id)
+    index = series.index_of(parsed_date)
+    if index is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock or date not found")
 
     # Get price for specified Stock
-    return stock_price
+    return series.row(index)
 
 
 # Update Stock data
@@ -119,12 +532,6 @@ def update_stock_price(ticker: str = Path(..., example="AAPL"),
     if not stock_price:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Date not found")
 
-    # Check if new date already exists
-    if (stock_price.date != stock_price_updated.date and
-        db.query(StockPrice).filter(StockPrice.stock_id == stock.id)
-                .filter(StockPrice.date == stock_price_updated.date).first()):
-        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="New date already exists")
-
     # Update the stock price
     stock_price.date = stock_price_updated.date
     stock_price.open = stock_price_updated.open
@@ -134,9 +541,15 @@ def update_stock_price(ticker: str = Path(..., example="AAPL"),
     stock_price.adj_close = stock_price_updated.adj_close
     stock_price.volume = stock_price_updated.volume
 
-    # Commit the changes
+    # Commit the changes, the unique (stock_id, date) index rejects existing dates
     db.add(stock_price)
-    db.commit()
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="New date already exists")
+    price_store.move(stock.id, parsed_date, stock_price)
+    profit_cache.invalidate(ticker)
 
 
 # Delete Stock data
@@ -170,4 +583,6 @@ def delete_stock_price(ticker: str = Path(..., example="AAPL"),
     # Delete Stock price
     db.query(StockPrice).filter(StockPrice.stock_id == stock.id).filter(StockPrice.date == parsed_date).delete()
     db.commit()
+    price_store.delete(stock.id, parsed_date)
+    profit_cache.invalidate(ticker)
 
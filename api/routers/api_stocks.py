@@ -1,8 +1,12 @@
 from fastapi import Depends, APIRouter, status, HTTPException, Body, Path
 from typing import List
 from database import get_db, Stock, StockPrice
+from sqlalchemy import select
 from sqlalchemy.orm import Session
 from schemas import StockCreate, StockResponse
+from price_store import price_store
+from profit_cache import profit_cache
+from fast_json import FastJSONResponse, row_dicts
 
 router = APIRouter(
     prefix="/stocks",
@@ -10,11 +14,17 @@ router = APIRouter(
     responses={404: {"description": "Not found"}}
 )
 
+# Columns of a stock row, in the order of `StockResponse`
+STOCK_FIELDS = ("name", "ticker", "inception_date", "id")
+
+# Query of the stock list, selecting plain tuples instead of ORM objects
+STOCK_LIST_SELECT = select(*(getattr(Stock, field) for field in STOCK_FIELDS))
+
 
 # Get all Stocks
 @router.get("/", response_model=List[StockResponse], status_code=status.HTTP_200_OK)
 def get_all_stocks(db: Session = Depends(get_db)):
-    return db.query(Stock).all()
+    return FastJSONResponse(content=row_dicts(STOCK_FIELDS, db.execute(STOCK_LIST_SELECT)))
 
 
 # Create new Stock
@@ -34,6 +44,7 @@ def create_stock(stock: StockCreate = Body(...),
         db.commit()
     except:
         raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail='Stock already exists')
+    profit_cache.invalidate(stock.ticker)
 
 
 # Get Stock data
@@ -70,6 +81,7 @@ def update_stock(ticker: str = Path(..., example="AAPL"),
     # Commit the changes
     db.add(stock)
     db.commit()
+    profit_cache.invalidate(ticker)
 
 
 # Delete Stock data
@@ -85,3 +97,5 @@ def delete_stock(ticker: str = Path(..., example="AAPL"),
     db.query(StockPrice).filter(StockPrice.stock_id == stock.id).delete()
     db.query(Stock).filter(Stock.ticker == ticker).delete()
     db.commit()
+    price_store.drop(stock.id)
+    profit_cache.invalidate(ticker)
@@ -0,0 +1,55 @@
+import asyncio
+from typing import List
+from fastapi import Depends, APIRouter, status, Body, Query
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from async_database import get_async_db
+from database import Stock
+from routers.api_profit import ProfitCalculator, MAX_BATCH_SIZE, MAX_BATCH_WORKERS
+from schemas import ProfitInput
+from profit_cache import profit_cache
+
+# The routes of `api_profit` for the async database mode
+router = APIRouter(
+    prefix="/profit",
+    tags=["Profit"],
+    responses={404: {"description": "Not found"}}
+)
+
+
+async def create_calculator(db: AsyncSession) -> ProfitCalculator:
+    """
+    Create a profit calculator with the stocks read through the async session.
+
+    The price store is loaded by `get_async_db`, so the calculation itself runs without
+    database access. It still has to run in a worker thread: a cache miss does the CPU
+    work of the profit engine, and waits for another request computing the same item.
+
+    :param db: The async database session.
+    :return: The calculator.
+    """
+    stocks = (await db.execute(select(Stock.id, Stock.ticker, Stock.name).order_by(Stock.id))).all()
+    return ProfitCalculator(None, stocks)
+
+
+@router.post("/", status_code=status.HTTP_200_OK)
+async def calculate_profit(profit_input: ProfitInput = Body(...),
+                           db: AsyncSession = Depends(get_async_db)):
+    # The calculation and the single-flight wait of the profit cache block, so they run in a worker thread
+    calculator = await create_calculator(db)
+    return await asyncio.to_thread(calculator.calculate, profit_input)
+
+
+@router.get("/cache", status_code=status.HTTP_200_OK)
+async def get_profit_cache_stats():
+    return profit_cache.stats()
+
+
+@router.post("/batch", status_code=status.HTTP_200_OK)
+async def calculate_profit_batch(profit_inputs: List[ProfitInput] = Body(..., max_length=MAX_BATCH_SIZE),
+                                 workers: int = Query(1, ge=1, le=MAX_BATCH_WORKERS,
+                                                      description="Threads calculating the items in parallel"),
+                                 db: AsyncSession = Depends(get_async_db)):
+    # A batch can take a while, it is calculated in a worker thread to keep the event loop free
+    calculator = await create_calculator(db)
+    return await asyncio.to_thread(calculator.calculate_batch, profit_inputs, workers)
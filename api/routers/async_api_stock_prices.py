@@ -0,0 +1,298 @@
+import asyncio
+from datetime import datetime, date
+from fastapi import Depends, APIRouter, status, HTTPException, Path, Body, Query, Request, Response
+from fastapi.responses import StreamingResponse
+from typing import List, Optional
+from sqlalchemy import select, delete
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+from async_database import get_async_db
+from database import Stock, StockPrice
+from routers.api_stock_prices import PriceQuery, parse_fields, build_price_select, stream_prices, price_page, \
+    export_prices, parse_period, indicator_page, build_range_delete, update_prices, MAX_BULK_UPDATES
+from schemas import StockPriceCreate, StockPriceResponse, StockPriceUpdate, PriceBar
+from price_store import price_store
+from price_upload import UPLOAD_REQUEST_BODY, upload_prices
+from profit_cache import profit_cache
+from fast_json import FastJSONResponse, row_dicts
+from price_export import EXPORT_MEDIA_TYPES, EXPORT_RESPONSES, COLUMNAR_FORMATS, negotiate_format, select_tickers, \
+    series_columns, concat_columns, export_response
+
+# The routes of `api_stock_prices` for the async database mode
+router = APIRouter(
+    prefix="/prices",
+    tags=["Stock Prices"],
+    responses={404: {"description": "Not found"}}
+)
+
+
+async def find_stock_id(db: AsyncSession, ticker: str, detail: str = "Stock not found") -> int:
+    """
+    Find the ID of a stock by its ticker.
+
+    :param db: The async database session.
+    :param ticker: The ticker of the stock.
+    :param detail: The detail of the 404 error raised if the stock does not exist.
+    :return: The ID of the stock.
+    """
+    stock_id = await db.scalar(select(Stock.id).where(Stock.ticker == ticker).limit(1))
+    if stock_id is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=detail)
+    return stock_id
+
+
+def parse_date(month: str, day: str, year: str) -> date:
+    """
+    Parse the date of the path parameters.
+
+    :return: The date, a 406 error is raised if it has a wrong format.
+    """
+    try:
+        return datetime.strptime(f"{month}/{day}/{year}", "%m/%d/%Y").date()
+    except:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date has wrong format")
+
+
+async def find_price(db: AsyncSession, stock_id: int, day: date) -> StockPrice:
+    """
+    Find the price of a stock on a date.
+
+    :return: The price, a 404 error is raised if the stock has no price on that date.
+    """
+    stock_price = await db.scalar(
+        select(StockPrice)
+        .where(StockPrice.stock_id == stock_id)
+        .where(StockPrice.date == day)
+        .limit(1)
+    )
+    if not stock_price:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Date not found")
+    return stock_price
+
+
+# Export the Prices of many Stocks as one file, registered before "/{ticker}" which would match "/export"
+@router.get("/export", status_code=status.HTTP_200_OK, response_class=Response, responses=EXPORT_RESPONSES)
+async def export_stock_prices(request: Request,
+                              tickers: Optional[str] = Query(
+                                  None, example="AAPL,AMZN", description="Comma separated tickers, all stocks if empty"
+                              ),
+                              start: Optional[date] = Query(None, description="First date of the range"),
+                              end: Optional[date] = Query(None, description="Last date of the range"),
+                              fields: Optional[str] = Query(None, example="close,volume",
+                                                            description="Comma separated columns to return, "
+                                                                        "the date is always included"),
+                              format: Optional[str] = Query(None, description="File format: csv, arrow or parquet, "
+                                                                              "overrides the Accept header"),
+                              db: AsyncSession = Depends(get_async_db)):
+    export_format = negotiate_format(format, request.headers.get("accept"), COLUMNAR_FORMATS, "csv")
+    fields = parse_fields(fields)
+
+    # Join the columns of the stocks, read from the price store loaded by `get_async_db`
+    stocks = select_tickers(tickers, dict((await db.execute(select(Stock.ticker, Stock.id))).all()))
+    columns = concat_columns([
+        (ticker, series_columns(price_store.get(None, stock_id), fields, start, end)[0]) for ticker, stock_id in stocks
+    ])
+    return await asyncio.to_thread(export_response, columns, export_format, "prices")
+
+
+# Get all Prices for one Stock
+@router.get("/{ticker}", response_model=List[StockPriceResponse], status_code=status.HTTP_200_OK,
+            responses=EXPORT_RESPONSES)
+async def get_all_stock_prices(request: Request,
+                               ticker: str = Path(..., example="AAPL"),
+                               start: Optional[date] = Query(None, description="First date of the range"),
+                               end: Optional[date] = Query(None, description="Last date of the range"),
+                               fields: Optional[str] = Query(None, example="close,volume",
+                                                             description="Comma separated columns to return, "
+                                                                         "the date is always included"),
+                               after: Optional[date] = Query(None, description="Return prices after this date, use "
+                                                                               "the X-Next-Cursor header of a page"),
+                               limit: Optional[int] = Query(None, ge=1, description="Maximum number of prices"),
+                               stream: bool = Query(False, description="Stream the prices as NDJSON"),
+                               format: Optional[str] = Query(None, description="Response format: json, csv, arrow or "
+                                                                               "parquet, overrides the Accept header"),
+                               db: AsyncSession = Depends(get_async_db)):
+    price_query = PriceQuery(await find_stock_id(db, ticker), start, end, parse_fields(fields))
+
+    # Export prices for specified Stock as a columnar file, encoded in a worker thread
+    export_format = negotiate_format(format, request.headers.get("accept"), tuple(EXPORT_MEDIA_TYPES), "json")
+    if export_format != "json":
+        series = price_store.get(None, price_query.stock_id)
+        return await asyncio.to_thread(export_prices, series, price_query, after, limit, export_format, ticker)
+
+    # Stream prices for specified Stock, the sync generator runs in the threadpool
+    if stream:
+        return StreamingResponse(stream_prices(price_query, after, limit), media_type="application/x-ndjson")
+
+    # Get prices for specified Stock, one extra row tells if there is a next page
+    rows = await db.execute(build_price_select(price_query, after, limit + 1 if limit else None))
+    return price_page(row_dicts(price_query.fields, rows), limit)
+
+
+# Add Stock Prices
+@router.post("/{ticker}", status_code=status.HTTP_201_CREATED)
+async def add_stock_price(ticker: str = Path(..., example="AAPL"),
+                          price: StockPriceCreate = Body(...),
+                          db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+
+    # Add Stock Price
+    db_price = StockPrice(stock_id=stock_id, **price.model_dump())
+    db.add(db_price)
+
+    # Commit the changes, the unique (stock_id, date) index rejects existing dates
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="Date already exists")
+    price_store.upsert(stock_id, db_price)
+    profit_cache.invalidate(ticker)
+
+
+# Add or update many Stock Prices
+@router.post("/{ticker}/bulk", status_code=status.HTTP_200_OK, openapi_extra={"requestBody": UPLOAD_REQUEST_BODY})
+async def upsert_stock_prices(request: Request,
+                              ticker: str = Path(..., example="AAPL"),
+                              db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+
+    # Upsert the prices while the body arrives, then commit all batches at once
+    summary, prices = await upload_prices(request, stock_id, db.run_sync)
+    await db.commit()
+    if prices:
+        price_store.upsert_many(stock_id, prices)
+        profit_cache.invalidate(ticker)
+    return summary
+
+
+# Update many Stock Prices
+@router.patch("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+async def update_stock_prices(ticker: str = Path(..., example="AAPL"),
+                              updates: List[StockPriceUpdate] = Body(..., max_length=MAX_BULK_UPDATES),
+                              db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+
+    # Update the prices in one transaction
+    missing, prices = await db.run_sync(update_prices, stock_id, updates)
+    await db.commit()
+    if len(prices["date"]):
+        price_store.upsert_many(stock_id, prices)
+        profit_cache.invalidate(ticker)
+    return {"updated": len(prices["date"]), "not_found": missing}
+
+
+# Delete Stock Prices in a date range
+@router.delete("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_stock_prices(ticker: str = Path(..., example="AAPL"),
+                              start: date = Query(..., description="First date of the range"),
+                              end: date = Query(..., description="Last date of the range"),
+                              db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+
+    # Delete the prices with one statement
+    deleted = (await db.execute(build_range_delete(stock_id, start, end))).rowcount
+    await db.commit()
+    if deleted:
+        price_store.delete_range(stock_id, start, end)
+        profit_cache.invalidate(ticker)
+    return {"deleted": deleted}
+
+
+# Get weekly, monthly or yearly bars of a Stock
+@router.get("/{ticker}/bars", response_model=List[PriceBar], status_code=status.HTTP_200_OK)
+async def get_stock_price_bars(ticker: str = Path(..., example="AAPL"),
+                               period: str = Query("month", description="Period of the bars: week, month or year"),
+                               start: Optional[date] = Query(None, description="First date of the range"),
+                               end: Optional[date] = Query(None, description="Last date of the range"),
+                               db: AsyncSession = Depends(get_async_db)):
+    period = parse_period(period)
+    stock_id = await find_stock_id(db, ticker)
+
+    # Get the bars materialized in the price store, which is loaded by `get_async_db`
+    rollup = price_store.get(None, stock_id).rollups[period]
+    return FastJSONResponse(content=rollup.bars(start, end))
+
+
+# Get a technical indicator of a Stock
+@router.get("/{ticker}/indicators/{indicator}", status_code=status.HTTP_200_OK)
+async def get_stock_price_indicator(ticker: str = Path(..., example="AAPL"),
+                                    indicator: str = Path(..., example="sma",
+                                                          description="sma, ema, rsi, bollinger, volatility or vwap"),
+                                    window: Optional[int] = Query(None, ge=2, le=1000,
+                                                                  description="Window length in days"),
+                                    width: Optional[float] = Query(None, gt=0, description="Width of the Bollinger "
+                                                                                           "bands in standard "
+                                                                                           "deviations"),
+                                    start: Optional[date] = Query(None, description="First date of the range"),
+                                    end: Optional[date] = Query(None, description="Last date of the range"),
+                                    db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+
+    # Compute or read the cached indicator in a worker thread, the store is loaded by `get_async_db`
+    series = price_store.get(None, stock_id)
+    return await asyncio.to_thread(indicator_page, series, indicator, start, end, window=window, width=width)
+
+
+# Get Stock Price
+@router.get("/{ticker}/{month}/{day}/{year}", response_model=StockPriceResponse, status_code=status.HTTP_200_OK)
+async def get_stock_price(ticker: str = Path(..., example="AAPL"),
+                          month: str = Path(..., example="7"),
+                          day: str = Path(..., example="24"),
+                          year: str = Path(..., example="2000"),
+                          db: AsyncSession = Depends(get_async_db)):
+    parsed_date = parse_date(month, day, year)
+    stock_id = await find_stock_id(db, ticker, "Stock or date not found")
+
+    # Check if price exists on specified date, the store is loaded by `get_async_db`
+    series = price_store.get(None, stock_id)
+    index = series.index_of(parsed_date)
+    if index is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock or date not found")
+
+    # Get price for specified Stock
+    return series.row(index)
+
+
+# Update Stock data
+@router.put("/{ticker}/{month}/{day}/{year}", status_code=status.HTTP_202_ACCEPTED)
+async def update_stock_price(ticker: str = Path(..., example="AAPL"),
+                             month: str = Path(..., example="6"),
+                             day: str = Path(..., example="24"),
+                             year: str = Path(..., example="2000"),
+                             stock_price_updated: StockPriceCreate = Body(...),
+                             db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+    parsed_date = parse_date(month, day, year)
+    stock_price = await find_price(db, stock_id, parsed_date)
+
+    # Update the stock price
+    for name, value in stock_price_updated.model_dump().items():
+        setattr(stock_price, name, value)
+
+    # Commit the changes, the unique (stock_id, date) index rejects existing dates
+    try:
+        await db.commit()
+    except IntegrityError:
+        await db.rollback()
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="New date already exists")
+    price_store.move(stock_id, parsed_date, stock_price)
+    profit_cache.invalidate(ticker)
+
+
+# Delete Stock data
+@router.delete("/{ticker}/{month}/{day}/{year}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_stock_price(ticker: str = Path(..., example="AAPL"),
+                             month: str = Path(..., example="6"),
+                             day: str = Path(..., example="24"),
+                             year: str = Path(..., example="2000"),
+                             db: AsyncSession = Depends(get_async_db)):
+    stock_id = await find_stock_id(db, ticker)
+    parsed_date = parse_date(month, day, year)
+    await find_price(db, stock_id, parsed_date)
+
+    # Delete Stock price
+    await db.execute(delete(StockPrice).where(StockPrice.stock_id == stock_id).where(StockPrice.date == parsed_date))
+    await db.commit()
+    price_store.delete(stock_id, parsed_date)
+    profit_cache.invalidate(ticker)
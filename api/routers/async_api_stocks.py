@@ -0,0 +1,101 @@
+from fastapi import Depends, APIRouter, status, HTTPException, Body, Path
+from typing import List
+from sqlalchemy import select, delete
+from sqlalchemy.ext.asyncio import AsyncSession
+from async_database import get_async_db
+from database import Stock, StockPrice
+from schemas import StockCreate, StockResponse
+from price_store import price_store
+from profit_cache import profit_cache
+from fast_json import FastJSONResponse, row_dicts
+from routers.api_stocks import STOCK_FIELDS, STOCK_LIST_SELECT
+
+# The routes of `api_stocks` for the async database mode
+router = APIRouter(
+    prefix="/stocks",
+    tags=["Stocks"],
+    responses={404: {"description": "Not found"}}
+)
+
+
+async def find_stock(db: AsyncSession, ticker: str) -> Stock:
+    """
+    Find a stock by its ticker.
+
+    :param db: The async database session.
+    :param ticker: The ticker of the stock.
+    :return: The stock, a 404 error is raised if it does not exist.
+    """
+    stock = await db.scalar(select(Stock).where(Stock.ticker == ticker).limit(1))
+    if not stock:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Stock not found")
+    return stock
+
+
+# Get all Stocks
+@router.get("/", response_model=List[StockResponse], status_code=status.HTTP_200_OK)
+async def get_all_stocks(db: AsyncSession = Depends(get_async_db)):
+    rows = await db.execute(STOCK_LIST_SELECT)
+    return FastJSONResponse(content=row_dicts(STOCK_FIELDS, rows))
+
+
+# Create new Stock
+@router.post("/", status_code=status.HTTP_201_CREATED)
+async def create_stock(stock: StockCreate = Body(...),
+                       db: AsyncSession = Depends(get_async_db)):
+    # Add the Stock
+    db.add(Stock(
+        name=stock.name,
+        ticker=stock.ticker,
+        inception_date=stock.inception_date
+    ))
+
+    # Commit the changes
+    try:
+        await db.commit()
+    except:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail='Stock already exists')
+    profit_cache.invalidate(stock.ticker)
+
+
+# Get Stock data
+@router.get("/{ticker}", response_model=StockResponse, status_code=status.HTTP_200_OK)
+async def get_stock(ticker: str = Path(..., example="AAPL"),
+                    db: AsyncSession = Depends(get_async_db)):
+    return await find_stock(db, ticker)
+
+
+# Update Stock data
+@router.put("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+async def update_stock(ticker: str = Path(..., example="AAPL"),
+                       stock_updated: StockCreate = Body(...),
+                       db: AsyncSession = Depends(get_async_db)):
+    stock = await find_stock(db, ticker)
+
+    # Check if new ticker already exists
+    if stock.ticker != stock_updated.ticker and \
+            await db.scalar(select(Stock.id).where(Stock.ticker == stock_updated.ticker).limit(1)) is not None:
+        raise HTTPException(status_code=status.HTTP_406_NOT_ACCEPTABLE, detail="New ticker already exists")
+
+    # Update the stock
+    stock.name = stock_updated.name
+    stock.ticker = stock_updated.ticker
+    stock.inception_date = stock_updated.inception_date
+
+    # Commit the changes
+    await db.commit()
+    profit_cache.invalidate(ticker)
+
+
+# Delete Stock data
+@router.delete("/{ticker}", status_code=status.HTTP_202_ACCEPTED)
+async def delete_stock(ticker: str = Path(..., example="AAPL"),
+                       db: AsyncSession = Depends(get_async_db)):
+    stock = await find_stock(db, ticker)
+
+    # Delete Stock and stock prices
+    await db.execute(delete(StockPrice).where(StockPrice.stock_id == stock.id))
+    await db.execute(delete(Stock).where(Stock.ticker == ticker))
+    await db.commit()
+    price_store.drop(stock.id)
+    profit_cache.invalidate(ticker)
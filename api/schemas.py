@@ -1,5 +1,10 @@
-from pydantic import BaseModel
+from pydantic import AfterValidator, BaseModel
 from datetime import date
+from typing import Annotated, Optional
+from profit_engine import PRICE_DECIMALS
+
+# A price rounded to the stored decimals, so the profits of uploaded prices compare like the imported ones
+Price = Annotated[float, AfterValidator(lambda value: round(value, PRICE_DECIMALS))]
 
 
 class StockCreate(BaseModel):
@@ -24,11 +29,11 @@ class StockResponse(StockCreate):
 
 class StockPriceCreate(BaseModel):
     date: date
-    open: float
-    high: float
-    low: float
-    close: float
-    adj_close: float
+    open: Price
+    high: Price
+    low: Price
+    close: Price
+    adj_close: Price
     volume: int
 
     class Config:
@@ -51,6 +56,34 @@ class StockPriceResponse(StockPriceCreate):
     stock_id: int
 
 
+class StockPriceUpdate(BaseModel):
+    date: date
+    open: Optional[Price] = None
+    high: Optional[Price] = None
+    low: Optional[Price] = None
+    close: Optional[Price] = None
+    adj_close: Optional[Price] = None
+    volume: Optional[int] = None
+
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "date": "2000-12-08",
+                "close": 0.268973,
+                "adj_close": 0.229353
+            }
+        }
+
+
+class PriceBar(BaseModel):
+    date: date
+    open: float
+    high: float
+    low: float
+    close: float
+    volume: int
+
+
 class ProfitInput(BaseModel):
     ticker: str
     start_date: str
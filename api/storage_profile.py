@@ -0,0 +1,127 @@
+import os
+from dataclasses import dataclass, fields, replace
+from typing import Dict
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Accepted values of the PRAGMAs that take a keyword, the PRAGMA statements cannot use bound parameters
+PRAGMA_KEYWORDS = {
+    "journal_mode": ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF"),
+    "synchronous": ("OFF", "NORMAL", "FULL", "EXTRA"),
+    "temp_store": ("DEFAULT", "FILE", "MEMORY"),
+}
+
+@dataclass(frozen=True)
+class StorageProfile:
+    """
+    The SQLite settings applied to every new database connection, and the connection pool size.
+
+    With WAL and `synchronous=NORMAL` (the "tuned" and "wal" presets) a commit is durable once it
+    is in the WAL file, but the WAL is only synced to disk at checkpoints: a power loss or an OS
+    crash can lose the last commits, although the database is never corrupted. An application crash
+    loses nothing. The "durable" preset syncs every commit (`synchronous=FULL`).
+
+    Attributes:
+        journal_mode: "WAL" lets readers run next to a writer, "DELETE" is the SQLite default.
+        synchronous: "NORMAL" only syncs at WAL checkpoints, "FULL" syncs every commit.
+        mmap_size: Bytes of the database file read through memory mapping instead of read calls.
+        cache_size: Page cache per connection, negative values are in KiB.
+        temp_store: "MEMORY" keeps temporary tables and indices for sorting in memory.
+        pool_size: Connections kept open in the pool.
+        max_overflow: Connections opened on top of the pool under load.
+        pool_timeout: Seconds a request waits for a free connection.
+    """
+    journal_mode: str = "WAL"
+    synchronous: str = "NORMAL"
+    mmap_size: int = 256 * 1024 * 1024
+    cache_size: int = -64 * 1024
+    temp_store: str = "MEMORY"
+    pool_size: int = 40
+    max_overflow: int = 10
+    pool_timeout: float = 30
+
+    def __post_init__(self):
+        # The PRAGMA values are written into the statements, so only known keywords and numbers are accepted
+        for name, keywords in PRAGMA_KEYWORDS.items():
+            value = str(getattr(self, name)).upper()
+            if value not in keywords:
+                raise ValueError(f"Invalid SQLite {name} {getattr(self, name)!r}, "
+                                 f"expected one of {', '.join(keywords)}")
+            object.__setattr__(self, name, value)
+        for name in ("mmap_size", "cache_size"):
+            value = getattr(self, name)
+            if isinstance(value, bool) or not isinstance(value, int):
+                raise ValueError(f"Invalid SQLite {name} {value!r}, expected an integer")
+
+    @classmethod
+    def from_env(cls) -> "StorageProfile":
+        """
+        Read the profile from the environment.
+
+        `SQLITE_PROFILE` selects one of the `PROFILES` presets (default "tuned"), and every
+        attribute can be overridden by an upper case `SQLITE_` variable, e.g. `SQLITE_MMAP_SIZE`.
+
+        :return: The configured profile.
+        """
+        name = os.environ.get("SQLITE_PROFILE", "tuned")
+        if name not in PROFILES:
+            raise ValueError(f"Unknown SQLite profile {name!r}, expected one of {', '.join(PROFILES)}")
+
+        overrides = {}
+        for field in fields(cls):
+            value = os.environ.get(f"SQLITE_{field.name.upper()}")
+            if value is not None:
+                overrides[field.name] = type(getattr(PROFILES[name], field.name))(value)
+        return replace(PROFILES[name], **overrides)
+
+    def pragmas(self) -> Dict[str, object]:
+        """
+        Get the PRAGMA statements of the profile.
+
+        :return: The PRAGMA values by name, in the order they are applied.
+        """
+        return {
+            "journal_mode": self.journal_mode,
+            "synchronous": self.synchronous,
+            "mmap_size": self.mmap_size,
+            "cache_size": self.cache_size,
+            "temp_store": self.temp_store,
+        }
+
+    def engine_options(self) -> Dict[str, object]:
+        """
+        Get the pool options of the profile for `create_engine`.
+
+        The pool should hold at least as many connections as the server has threads for the
+        sync handlers (40 by default), otherwise requests queue for a free connection.
+
+        :return: The keyword arguments for `create_engine`.
+        """
+        return {"pool_size": self.pool_size, "max_overflow": self.max_overflow, "pool_timeout": self.pool_timeout}
+
+    def apply(self, engine: Engine):
+        """
+        Run the PRAGMA statements of the profile on every new connection of an engine.
+
+        :param engine: The engine, for an async engine its `sync_engine`.
+        """
+        @event.listens_for(engine, "connect")
+        def set_pragmas(dbapi_connection, connection_record):
+            cursor = dbapi_connection.cursor()
+            for name, value in self.pragmas().items():
+                cursor.execute(f"PRAGMA {name} = {value}")
+            cursor.close()
+
+
+# Presets selected with `SQLITE_PROFILE`
+PROFILES = {
+    # SQLite's own defaults with the original pool, for comparison
+    "default": StorageProfile(journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size=-2000,
+                              temp_store="DEFAULT", pool_size=5, max_overflow=10),
+    # Readers do not block behind writers, commits only sync at checkpoints
+    "wal": StorageProfile(mmap_size=0, cache_size=-2000, temp_store="DEFAULT"),
+    # WAL with memory mapped reads and a larger page cache
+    "tuned": StorageProfile(),
+    # Durable WAL, every commit is synced to disk
+    "durable": StorageProfile(synchronous="FULL"),
+}
@@ -0,0 +1,88 @@
+import threading
+from main import app, create_app
+from fastapi.testclient import TestClient
+from fastapi import status
+from routers.api_profit import ProfitCalculator
+
+client = TestClient(app)
+async_client = TestClient(create_app("async"))
+
+
+# Tests that the async database mode answers the read endpoints exactly like the sync mode
+def test_async_mode_reads_match_sync_mode():
+    requests = [
+        ("GET", "/stocks/", None),
+        ("GET", "/stocks/AAPL", None),
+        ("GET", "/stocks/XXXX", None),
+        ("GET", "/prices/AAPL?start=2000-12-08&end=2000-12-18&limit=3", None),
+        ("GET", "/prices/AAPL?start=2000-12-08&end=2000-12-11&fields=close", None),
+        ("GET", "/prices/AAPL?start=2000-12-08&end=2000-12-11&stream=true", None),
+        ("GET", "/prices/AAPL?start=2000-12-08&end=2000-12-18&limit=3&format=arrow", None),
+        ("GET", "/prices/export?tickers=AAPL,AMZN&start=2000-12-08&end=2000-12-11&format=csv", None),
+        ("GET", "/prices/AAPL/bars?period=week&start=2000-12-08&end=2000-12-18", None),
+        ("GET", "/prices/AAPL/indicators/bollinger?window=5&start=2000-12-08&end=2000-12-18", None),
+        ("GET", "/prices/AAPL/07/24/2000", None),
+        ("GET", "/prices/AAPL/07/23/2000", None),
+        ("POST", "/profit/", {"ticker": "AAPL", "start_date": "12/08/2000", "end_date": "12/18/2000"}),
+        ("POST", "/profit/", {"ticker": "AAPL", "start_date": "12-08-2000", "end_date": "12/18/2000"}),
+        ("POST", "/profit/batch?workers=2", [{"ticker": "AMZN", "start_date": "12/08/2000", "end_date": "12/18/2000"},
+                                             {"ticker": "XXXX", "start_date": "12/08/2000", "end_date": "12/18/2000"}]),
+    ]
+    for method, url, body in requests:
+        expected = client.request(method, url, json=body)
+        response = async_client.request(method, url, json=body)
+        assert response.status_code == expected.status_code, url
+        assert response.content == expected.content, url
+        assert response.headers.get("X-Next-Cursor") == expected.headers.get("X-Next-Cursor"), url
+
+
+# Tests creating, updating and deleting a stock and its prices in the async database mode
+def test_async_mode_writes():
+    stock = {"name": "Async", "ticker": "ASYN", "inception_date": "2020-01-01"}
+    price = {"date": "2023-01-02", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adj_close": 1.5, "volume": 10}
+
+    assert async_client.post("/stocks/", json=stock).status_code == status.HTTP_201_CREATED
+    assert async_client.post("/stocks/", json=stock).status_code == status.HTTP_406_NOT_ACCEPTABLE
+    assert async_client.post("/prices/ASYN", json=price).status_code == status.HTTP_201_CREATED
+    assert async_client.post("/prices/ASYN", json=price).status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+    # The sync mode sees the writes of the async mode
+    response = client.get("/prices/ASYN/01/02/2023")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["close"] == 1.5
+
+    price["close"] = 1.75
+    assert async_client.put("/prices/ASYN/01/02/2023", json=price).status_code == status.HTTP_202_ACCEPTED
+    assert async_client.get("/prices/ASYN/01/02/2023").json()["close"] == 1.75
+    assert async_client.put("/stocks/ASYN", json={**stock, "name": "Async 2"}).status_code == status.HTTP_202_ACCEPTED
+    assert async_client.get("/stocks/ASYN").json()["name"] == "Async 2"
+
+    response = async_client.post("/prices/ASYN/bulk", json=[price, {**price, "date": "2023-01-03"}])
+    assert [row["status"] for row in response.json()["rows"]] == ["updated", "inserted"]
+    assert client.get("/prices/ASYN/01/03/2023").status_code == status.HTTP_200_OK
+
+    response = async_client.patch("/prices/ASYN", json=[{"date": "2023-01-03", "close": 2.5}, {"date": "2023-01-09"}])
+    assert response.json() == {"updated": 1, "not_found": ["2023-01-09"]}
+    assert client.get("/prices/ASYN/01/03/2023").json()["close"] == 2.5
+    assert async_client.delete("/prices/ASYN?start=2023-01-03&end=2023-01-31").json() == {"deleted": 1}
+
+    assert async_client.delete("/prices/ASYN/01/02/2023").status_code == status.HTTP_202_ACCEPTED
+    assert async_client.delete("/prices/ASYN/01/02/2023").status_code == status.HTTP_404_NOT_FOUND
+    assert async_client.delete("/stocks/ASYN").status_code == status.HTTP_202_ACCEPTED
+    assert async_client.get("/stocks/ASYN").status_code == status.HTTP_404_NOT_FOUND
+
+
+# Tests that the profit calculation of the async mode runs in a worker thread, not on the event loop thread
+def test_async_mode_profit_off_the_event_loop(monkeypatch):
+    threads = []
+
+    def calculate(self, profit_input):
+        threads.append(threading.current_thread())
+        return {}
+
+    monkeypatch.setattr(ProfitCalculator, "calculate", calculate)
+    profit_input = {"ticker": "AAPL", "start_date": "12/08/2000", "end_date": "12/18/2000"}
+    assert async_client.post("/profit/", json=profit_input).status_code == status.HTTP_200_OK
+
+    # The TestClient runs the event loop in its portal thread
+    assert threads and not threads[0].name.startswith("asyncio-portal")
@@ -0,0 +1,39 @@
+import json
+from typing import List
+from datetime import date
+from pydantic import TypeAdapter
+from main import app
+from fastapi.testclient import TestClient
+import fast_json
+from schemas import StockPriceResponse, StockResponse
+
+client = TestClient(app)
+
+
+# Tests that the list endpoints return exactly what validating against the response models returns
+def test_list_endpoints_match_response_models():
+    requests = [("/prices/AAPL?start=2000-12-01&end=2000-12-31", StockPriceResponse), ("/stocks/", StockResponse)]
+    for url, model in requests:
+        response = client.get(url)
+        adapter = TypeAdapter(List[model])
+        assert response.headers["content-type"] == "application/json"
+        assert response.json() == adapter.dump_python(adapter.validate_python(response.json()), mode="json")
+
+
+# Tests that the standard library fallback encodes like orjson
+def test_dumps_without_orjson(monkeypatch):
+    content = [{"date": date(2000, 12, 8), "close": 1.0 / 3, "volume": 123, "name": "Äpple"}, None]
+    encoded = fast_json.dumps(content)
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert fast_json.dumps(content) == encoded
+    assert json.loads(encoded)[0]["date"] == "2000-12-08"
+
+
+# Tests that both encoders write NaN and infinity as null, which is valid JSON
+def test_dumps_non_finite_values(monkeypatch):
+    content = {"sma": [float("nan"), 1.5], "rsi": (float("inf"), -float("inf")), "date": date(2000, 12, 8)}
+    expected = b'{"sma":[null,1.5],"rsi":[null,null],"date":"2000-12-08"}'
+    if fast_json.orjson is not None:
+        assert fast_json.dumps(content) == expected
+    monkeypatch.setattr(fast_json, "orjson", None)
+    assert fast_json.dumps(content) == expected
@@ -0,0 +1,86 @@
+from datetime import timedelta
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from indicators import INDICATORS, IndicatorSeries, indicator_params, MAX_CACHED_INDICATORS, TRADING_DAYS
+from price_store import PriceSeries
+
+
+def random_series(rng, length):
+    days = np.arange(np.datetime64("2020-01-01"), np.datetime64("2020-01-01") + length)
+    closes = rng.random(length) * 10 + 50
+    return PriceSeries(1, id=np.arange(length), date=days, open=closes, high=closes + rng.random(length),
+                       low=closes - rng.random(length), close=closes, adj_close=closes,
+                       volume=rng.integers(1, 1000, size=length))
+
+
+def compute(series, name, **params):
+    return IndicatorSeries.compute(name, indicator_params(name, **params), series.columns()).columns
+
+
+# Tests the indicators against pandas rolling and exponential window calculations
+def test_indicators_match_pandas():
+    series = random_series(np.random.default_rng(1), 200)
+    close = pd.Series(series.close)
+    assert np.allclose(compute(series, "sma", window=10)["sma"], close.rolling(10).mean(), equal_nan=True)
+    expected = close.ewm(span=10, adjust=False).mean().where(close.index >= 9)
+    assert np.allclose(compute(series, "ema", window=10)["ema"], expected, equal_nan=True)
+
+    bands = compute(series, "bollinger", window=10, width=1.5)
+    deviation = close.rolling(10).std(ddof=0)
+    assert np.allclose(bands["upper"], close.rolling(10).mean() + 1.5 * deviation, equal_nan=True)
+    assert np.allclose(bands["lower"], close.rolling(10).mean() - 1.5 * deviation, equal_nan=True)
+
+    returns = np.log(close / close.shift())
+    expected = returns.rolling(10).std() * np.sqrt(TRADING_DAYS)
+    assert np.allclose(compute(series, "volatility", window=10)["volatility"], expected, equal_nan=True)
+
+    volume = pd.Series(series.volume, dtype=float)
+    typical = (pd.Series(series.high) + pd.Series(series.low) + close) / 3
+    expected = (typical * volume).rolling(10).sum() / volume.rolling(10).sum()
+    assert np.allclose(compute(series, "vwap", window=10)["vwap"], expected, equal_nan=True)
+
+    change = close.diff()
+    gains = change.clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+    losses = (-change).clip(lower=0).ewm(alpha=1 / 14, adjust=False).mean()
+    expected = (100 - 100 / (1 + gains / losses)).where(close.index >= 14)
+    assert np.allclose(compute(series, "rsi")["rsi"], expected, equal_nan=True)
+
+
+# Tests that cached indicators are extended after appends and updated after other writes, equal to a recomputation
+def test_indicators_follow_writes():
+    rng = np.random.default_rng(2)
+    series = random_series(rng, 100)
+    keys = [(name, indicator_params(name, window=5)) for name in INDICATORS]
+    for key in keys:
+        series.indicator(*key)
+
+    for _ in range(60):
+        close = float(rng.random() * 10 + 50)
+        action = rng.integers(0, 3)
+        if action == 0:
+            day = series.date[-1].item() + timedelta(days=1)
+        else:
+            day = series.date[int(rng.integers(0, len(series)))].item()
+        if action == 2:
+            series = series.without_date(day)
+        else:
+            series = series.with_price(SimpleNamespace(id=0, date=day, open=close, high=close + 1, low=close - 1,
+                                                       close=close, adj_close=close, volume=7))
+        for key in keys:
+            cached = series.indicators[key].columns
+            for name, column in IndicatorSeries.compute(*key, series.columns()).columns.items():
+                assert np.array_equal(cached[name], column, equal_nan=True), (key, name)
+
+
+# Tests the defaults and the bounded number of cached indicators
+def test_indicator_params_and_cache_size():
+    assert indicator_params("bollinger") == (("width", 2.0), ("window", 20))
+    assert indicator_params("sma", window=5, width=3) == (("window", 5),)
+    series = random_series(np.random.default_rng(3), 50)
+    for window in range(2, 50):
+        series.indicator("sma", indicator_params("sma", window=window))
+    assert len(series.indicators) == MAX_CACHED_INDICATORS
+    with pytest.raises(KeyError):
+        indicator_params("macd")
@@ -0,0 +1,44 @@
+import logging
+import time
+import main
+from main import app, create_app
+from fastapi.testclient import TestClient
+from fastapi import status
+
+
+# Tests that the readiness probe reports "ready" once the startup warm-up has finished
+def test_readiness_after_startup():
+    with TestClient(app) as client:
+        for _ in range(100):
+            response = client.get("/ready")
+            if response.status_code == status.HTTP_200_OK:
+                break
+            assert response.json() == {"status": "warming_up"}
+            time.sleep(0.1)
+        assert response.status_code == status.HTTP_200_OK
+        assert response.json() == {"status": "ready"}
+
+
+# Tests that a failed warm-up is logged, reported by the readiness probe and started again by it
+def test_readiness_after_failed_warm_up(monkeypatch, caplog):
+    calls = []
+
+    def init_db():
+        calls.append(1)
+        if len(calls) == 1:
+            raise OSError("CSV directory not found")
+
+    monkeypatch.setattr(main, "init_db", init_db)
+    with caplog.at_level(logging.ERROR, logger="main"), TestClient(create_app()) as client:
+        states = []
+        for _ in range(100):
+            response = client.get("/ready")
+            states.append(response.json()["status"])
+            if response.status_code == status.HTTP_200_OK:
+                break
+            assert response.status_code == status.HTTP_503_SERVICE_UNAVAILABLE
+            time.sleep(0.05)
+        assert "failed" in states and states[-1] == "ready"
+    assert len(calls) == 2
+    assert caplog.records[0].getMessage().startswith("Warm-up failed")
+    assert "CSV directory not found" in caplog.text
@@ -0,0 +1,63 @@
+import re
+from fastapi import status
+from fastapi.testclient import TestClient
+from main import app, create_app
+from metrics import CONTENT_TYPE, Counter, Histogram
+
+client = TestClient(app)
+
+
+def sample(text, name, **labels):
+    # The value of a series on the metrics page, labels in any order
+    for line in text.splitlines():
+        series, _, value = line.rpartition(" ")
+        if series.split("{")[0] == name and all(f'{key}="{label}"' in series for key, label in labels.items()):
+            return float(value)
+    return None
+
+
+# Tests the text format of histograms and counters, with cumulative buckets and escaped labels
+def test_histogram_and_counter_text_format():
+    histogram = Histogram("latency_seconds", "Latency.", (0.1, 1), ("route",))
+    for value in (0.05, 0.1, 0.5, 3):
+        histogram.observe(value, ("/a",))
+    assert histogram.render() == [
+        "# HELP latency_seconds Latency.",
+        "# TYPE latency_seconds histogram",
+        'latency_seconds_bucket{route="/a",le="0.1"} 2',
+        'latency_seconds_bucket{route="/a",le="1"} 3',
+        'latency_seconds_bucket{route="/a",le="+Inf"} 4',
+        'latency_seconds_sum{route="/a"} 3.65',
+        'latency_seconds_count{route="/a"} 4',
+    ]
+
+    counter = Counter("requests_total", "Requests.", ("path",))
+    counter.inc(('say "hi"\\',), 2)
+    assert counter.render()[-1] == 'requests_total{path="say \\"hi\\"\\\\"} 2'
+
+
+# Tests that requests are counted by route template with their latency and SQL statements
+def test_metrics_endpoint():
+    before = client.get("/metrics").text
+    client.get("/stocks/AAPL")
+    client.get("/stocks/NFLX")
+    client.get("/no/such/route")
+    response = client.get("/metrics")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == CONTENT_TYPE
+
+    labels = {"method": "GET", "route": "/stocks/{ticker}"}
+    count = sample(response.text, "stock_api_requests_total", status="200", **labels)
+    assert count - (sample(before, "stock_api_requests_total", status="200", **labels) or 0) == 2
+    assert sample(response.text, "stock_api_request_duration_seconds_count", **labels) >= 2
+    assert sample(response.text, "stock_api_request_db_statements_sum", **labels) >= 2
+    assert sample(response.text, "stock_api_requests_total", route="unmatched", status="404") >= 1
+    assert sample(response.text, "stock_api_requests_in_flight") == 1
+    assert sample(response.text, "stock_api_db_checkout_duration_seconds_count") > 0
+    assert sample(response.text, "stock_api_profit_cache_hit_ratio") is not None
+    assert "AAPL" not in response.text and not re.search(r"\bnan\b", response.text)
+
+
+# Tests that an application without metrics has no metrics endpoint
+def test_metrics_disabled():
+    assert TestClient(create_app(metrics=False)).get("/metrics").status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,32 @@
+import logging
+from sqlalchemy import create_engine, text
+from migrations import migrate, get_version, LATEST_VERSION
+
+
+# Tests that a database created before migrations existed gets the unique index and keeps one row per date,
+# the deleted rows are kept in a backup table
+def test_migrate_legacy_database(tmp_path, caplog):
+    engine = create_engine(f"sqlite:///{tmp_path / 'legacy.db'}")
+    with engine.begin() as connection:
+        connection.execute(text(
+            "CREATE TABLE stock_prices (id INTEGER PRIMARY KEY, stock_id INTEGER, date DATE, close FLOAT)"
+        ))
+        connection.execute(text(
+            "INSERT INTO stock_prices (stock_id, date, close) VALUES "
+            "(1, '2000-01-03', 1.0), (1, '2000-01-03', 2.0), (1, '2000-01-04', 3.0)"
+        ))
+    assert get_version(engine) == 0
+
+    with caplog.at_level(logging.WARNING, logger="migrations"):
+        migrate(engine)
+    assert caplog.records[-1].getMessage().startswith(
+        "Migration to version 1 deleted 1 rows, backed up in stock_prices_duplicates_v1: DELETE FROM stock_prices"
+    )
+
+    assert get_version(engine) == LATEST_VERSION
+    with engine.connect() as connection:
+        indexes = connection.execute(text("PRAGMA index_list(stock_prices)")).all()
+        assert ("ix_stock_prices_stock_id_date", 1) in [(index.name, index.unique) for index in indexes]
+        assert connection.execute(text("SELECT id, close FROM stock_prices ORDER BY id")).all() == [(1, 1.0), (3, 3.0)]
+        backup = connection.execute(text("SELECT id, stock_id, date, close FROM stock_prices_duplicates_v1")).all()
+        assert backup == [(2, 1, "2000-01-03", 2.0)]
@@ -0,0 +1,77 @@
+import io
+import pandas as pd
+import pyarrow
+import pyarrow.parquet
+from main import app
+from fastapi.testclient import TestClient
+from fastapi import status
+import price_export
+
+client = TestClient(app)
+
+PARAMS = {"start": "2000-12-08", "end": "2000-12-18"}
+
+
+def json_frame(params: dict) -> pd.DataFrame:
+    frame = pd.DataFrame(client.get("/prices/AAPL", params=params).json())
+    frame["date"] = pd.to_datetime(frame["date"]).dt.date
+    return frame
+
+
+# Tests exporting the prices of a stock as CSV, chosen by the format parameter or the Accept header
+def test_export_stock_prices_csv():
+    response = client.get("/prices/AAPL", params={**PARAMS, "format": "csv"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.headers["content-disposition"] == 'attachment; filename="AAPL.csv"'
+    assert response.text.splitlines()[:2] == [
+        "date,open,high,low,close,adj_close,volume,id,stock_id",
+        "2000-12-08,0.264509,0.273438,0.257813,0.268973,0.23243,435624000,10905,2",
+    ]
+    assert client.get("/prices/AAPL", params=PARAMS, headers={"Accept": "text/csv"}).content == response.content
+
+
+# Tests exporting the prices of a stock as Arrow and Parquet with the same values as JSON
+def test_export_stock_prices_columnar():
+    expected = json_frame({**PARAMS, "fields": "close,volume"})
+    response = client.get("/prices/AAPL", params={**PARAMS, "fields": "close,volume", "format": "arrow"})
+    table = pyarrow.ipc.open_stream(response.content).read_all()
+    assert table.schema.field("date").type == pyarrow.date32()
+    pd.testing.assert_frame_equal(table.to_pandas(), expected)
+
+    response = client.get("/prices/AAPL", params={**PARAMS, "limit": 3},
+                          headers={"Accept": "application/vnd.apache.parquet"})
+    assert response.headers["X-Next-Cursor"] == "2000-12-12"
+    pd.testing.assert_frame_equal(pyarrow.parquet.read_table(io.BytesIO(response.content)).to_pandas(),
+                                  json_frame({**PARAMS, "limit": 3}))
+
+
+# Tests exporting the prices of many stocks as one file
+def test_export_many_stock_prices():
+    response = client.get("/prices/export", params={**PARAMS, "tickers": "AMZN,AAPL", "format": "parquet"})
+    assert response.status_code == status.HTTP_200_OK
+    frame = pyarrow.parquet.read_table(io.BytesIO(response.content)).to_pandas()
+    assert list(frame.columns[:3]) == ["ticker", "date", "open"]
+    assert frame["ticker"].drop_duplicates().tolist() == ["AMZN", "AAPL"]
+    pd.testing.assert_frame_equal(frame[frame["ticker"] == "AAPL"].drop(columns="ticker").reset_index(drop=True),
+                                  json_frame(PARAMS))
+
+    # CSV is the default format, all stocks are exported if no tickers are given
+    response = client.get("/prices/export", params={"start": "2019-12-31", "end": "2019-12-31", "fields": "close"})
+    assert response.text.splitlines()[0] == "ticker,date,close"
+    tickers = [line.split(",")[0] for line in response.text.splitlines()[1:]]
+    assert tickers == sorted(tickers) and {"AAPL", "AMZN", "GOOGL", "META", "NFLX"}.issubset(tickers)
+
+
+# Tests export errors for unknown stocks and formats, and for Arrow without pyarrow
+def test_export_stock_prices_errors(monkeypatch):
+    response = client.get("/prices/export", params={"tickers": "AAPL,XXXX"})
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {"detail": "Stock not found: XXXX"}
+    assert client.get("/prices/AAPL", params={"format": "xml"}).status_code == status.HTTP_406_NOT_ACCEPTABLE
+    assert client.get("/prices/export", params={"format": "json"}).status_code == status.HTTP_406_NOT_ACCEPTABLE
+
+    monkeypatch.setattr(price_export, "pyarrow", None)
+    response = client.get("/prices/AAPL", params={**PARAMS, "format": "arrow"})
+    assert response.status_code == status.HTTP_501_NOT_IMPLEMENTED
+    assert client.get("/prices/AAPL", params={**PARAMS, "format": "csv"}).status_code == status.HTTP_200_OK
@@ -0,0 +1,83 @@
+from datetime import date
+from types import SimpleNamespace
+import pytest
+from database import SessionLocal, init_db
+from price_store import price_store, PRICE_COLUMNS
+from profit_engine import best_single_trade, gain_prefix
+from routers.api_profit import get_profit_result
+
+
+# Tests that the multi-trade profits of all stocks at once match the per-stock calculation
+@pytest.mark.parametrize("start_date, end_date", [
+    (date(2000, 12, 8), date(2000, 12, 18)),
+    (date(1000, 12, 8), date(2000, 12, 18)),
+    (date(2000, 12, 8), date(1000, 12, 18)),
+    (date(2012, 5, 18), date(2012, 5, 18)),
+    (date(2010, 1, 1), date(2030, 1, 1)),
+])
+def test_universe_matches_per_stock_profits(start_date, end_date):
+    init_db()
+    with SessionLocal() as db:
+        universe = price_store.universe(db)
+        profits = universe.multi_trade_profits(start_date, end_date)
+        for position, stock_id in enumerate(universe.stock_ids.tolist()):
+            expected = get_profit_result(stock_id, start_date, end_date, db, multi_trade_only=True)
+            for period, values in profits.items():
+                assert values[position] == pytest.approx(expected[period]["max_multi_trade_profit"], abs=1e-9)
+
+
+# Tests that the universe is rebuilt after the store changes
+def test_universe_follows_store_generation():
+    init_db()
+    with SessionLocal() as db:
+        universe = price_store.universe(db)
+        assert price_store.universe(db) is universe
+
+        # Add and remove a price directly in the store
+        price = SimpleNamespace(id=0, date=date(2100, 1, 4), open=1.0, high=1.0, low=1.0, close=1.0,
+                                adj_close=1.0, volume=1)
+        price_store.upsert(2, price)
+        assert price_store.universe(db).offsets[-1] == universe.offsets[-1] + 1
+        price_store.delete(2, price.date)
+        assert price_store.universe(db).offsets[-1] == universe.offsets[-1]
+
+
+# Tests that a built segment tree is updated for the new series after a write
+def test_trade_tree_follows_writes():
+    init_db()
+    with SessionLocal() as db:
+        series = price_store.get(db, 2)
+        assert series.trade_tree.best_trade(0, len(series)) == best_single_trade(series.close)
+
+        price = SimpleNamespace(id=0, date=date(2100, 1, 4), open=1.0, high=1.0, low=1.0, close=1000.0,
+                                adj_close=1.0, volume=1)
+        price_store.upsert(2, price)
+        updated = price_store.get(db, 2)
+        assert "trade_tree" in updated.__dict__
+        assert updated.trade_tree.best_trade(0, len(updated)) == best_single_trade(updated.close)
+        assert updated.trade_tree.best_trade(0, len(updated))[1] == len(updated) - 1
+
+        price_store.delete(2, price.date)
+        restored = price_store.get(db, 2)
+        assert restored.trade_tree.best_trade(0, len(restored)) == best_single_trade(restored.close)
+
+
+# Tests that merging many prices equals inserting them one by one, including the derived structures
+def test_with_prices_matches_with_price():
+    init_db()
+    with SessionLocal() as db:
+        series = price_store.get(db, 2)
+        series.trade_tree, series.gain_prefix
+        days = [date(2100, 1, 5), date(2000, 12, 8), date(2100, 1, 4), date(2100, 1, 5)]
+        prices = [SimpleNamespace(id=i, date=day, open=1.0, high=1.0, low=1.0, close=float(i + 1),
+                                  adj_close=1.0, volume=1) for i, day in enumerate(days)]
+
+        expected = series
+        for price in prices:
+            expected = expected.with_price(price)
+        merged = series.with_prices({name: [getattr(price, name) for price in prices] for name in PRICE_COLUMNS})
+
+        for name in PRICE_COLUMNS:
+            assert (getattr(merged, name) == getattr(expected, name)).all()
+        assert (merged.gain_prefix == gain_prefix(merged.close)).all()
+        assert merged.trade_tree.best_trade(0, len(merged)) == best_single_trade(merged.close)
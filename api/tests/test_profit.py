@@ -1,6 +1,9 @@
+import threading
 from main import app
 from fastapi.testclient import TestClient
 from fastapi import status
+from profit_cache import profit_cache
+from query_log import add_observer, remove_observer
 
 client = TestClient(app)
 
@@ -113,3 +116,123 @@ def test_calculate_profit_invalid_date_format():
     assert response.json() == {
       "detail": "Date has wrong format"
     }
+
+
+# Tests calculating the profits of several items in one batch, invalid items get an error detail
+def test_calculate_profit_batch():
+    request_data = [
+      {"ticker": "AAPL", "start_date": "12/08/2000", "end_date": "12/18/2000"},
+      {"ticker": "AAPL65", "start_date": "12/08/2000", "end_date": "12/18/2000"},
+      {"ticker": "NFLX", "start_date": "12/08/2000", "end_date": "12/181000"},
+      {"ticker": "AMZN", "start_date": "12/08/2000", "end_date": "12/18/2000"},
+      {"ticker": "AAPL", "start_date": "12/08/2000", "end_date": "12/18/2000"}
+    ]
+    response = client.post('/profit/batch', json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    results = response.json()
+    assert len(results) == 5
+    assert results[0] == client.post('/profit/', json=request_data[0]).json()
+    assert results[1] == {"detail": "Stock not found"}
+    assert results[2] == {"detail": "Date has wrong format"}
+    assert results[3] == client.post('/profit/', json=request_data[3]).json()
+    assert results[4] == results[0]
+
+
+# Tests that a batch calculated by several workers gives the same results
+def test_calculate_profit_batch_workers():
+    request_data = [
+      {"ticker": ticker, "start_date": "01/01/2010", "end_date": "06/30/2010"}
+      for ticker in ["AAPL", "AMZN", "GOOGL", "META", "NFLX"]
+    ]
+    response = client.post('/profit/batch', params={"workers": 4}, json=request_data)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == client.post('/profit/batch', json=request_data).json()
+
+
+# Tests that the workers of a batch never query through the request's session, even with a cold profit cache
+def test_calculate_profit_batch_workers_share_no_session():
+    request_data = [
+      {"ticker": ticker, "start_date": "01/01/2011", "end_date": "06/30/2011"}
+      for ticker in ["AAPL", "AMZN", "GOOGL", "META", "NFLX"]
+    ]
+    threads = []
+
+    def observe(statement, seconds):
+        threads.append(threading.current_thread().name)
+
+    profit_cache.clear()
+    add_observer(observe)
+    try:
+        response = client.post('/profit/batch', params={"workers": 4}, json=request_data)
+    finally:
+        remove_observer(observe)
+    assert response.status_code == status.HTTP_200_OK
+    assert threads and not any(name.startswith("ThreadPoolExecutor") for name in threads)
+
+
+# Tests that a repeated profit request is served from the cache
+def test_calculate_profit_cache_hit():
+    request_data = {
+      "ticker": "GOOGL",
+      "start_date": "01/04/2010",
+      "end_date": "03/31/2010"
+    }
+    first = client.post('/profit/', json=request_data).json()
+    hits = client.get('/profit/cache').json()["hits"]
+    assert client.post('/profit/', json=request_data).json() == first
+    assert client.get('/profit/cache').json()["hits"] == hits + 1
+
+
+# Tests that adding and deleting a price invalidates the cached profit results
+def test_calculate_profit_cache_invalidation():
+    request_data = {
+      "ticker": "AAPL",
+      "start_date": "08/03/2020",
+      "end_date": "12/31/2020"
+    }
+    price_data = {
+      "date": "2020-12-31",
+      "open": 1000,
+      "high": 1000,
+      "low": 1000,
+      "close": 1000,
+      "adj_close": 1000,
+      "volume": 1
+    }
+    original = client.post('/profit/', json=request_data).json()
+    assert original["main_period"]["sell_date"] != "2020-12-31"
+
+    client.post('/prices/AAPL', json=price_data)
+    updated = client.post('/profit/', json=request_data).json()
+    assert updated["main_period"]["sell_date"] == "2020-12-31"
+    assert updated["main_period"]["sell_close"] == 1000
+
+    client.delete('/prices/AAPL/12/31/2020')
+    assert client.post('/profit/', json=request_data).json() == original
+
+
+def add_stock_with_closes(ticker, name, closes):
+    # A new stock with one price per day of January 2090
+    client.post('/stocks/', json={"inception_date": "2090-01-01", "name": name, "ticker": ticker})
+    prices = [{"date": f"2090-01-{day:02}", "open": close, "high": close, "low": close, "close": close,
+               "adj_close": close, "volume": 1} for day, close in enumerate(closes, start=1)]
+    assert client.post(f'/prices/{ticker}/bulk', json=prices).status_code == status.HTTP_200_OK
+
+
+# Tests that stocks tying the requested stock, and the requested stock itself, are never reported as better
+def test_calculate_profit_ties_and_best_stock():
+    closes = [10.75, 19.8, 10.12, 10.91, 17.73, 18.03]
+    add_stock_with_closes("TIEA", "Tie A", closes)
+    add_stock_with_closes("TIEB", "Tie B", closes)
+    add_stock_with_closes("TIEC", "Tie C", [10.0, 10.1, 10.0, 10.1, 10.0, 10.1])
+    try:
+        def better(ticker):
+            request_data = {"ticker": ticker, "start_date": "01/01/2090", "end_date": "01/06/2090"}
+            return client.post('/profit/', json=request_data).json()["main_period"]["stocks_with_better_profit"]
+
+        assert better("TIEA") == ""
+        assert better("TIEB") == ""
+        assert better("TIEC") == "Tie A, Tie B, "
+    finally:
+        for ticker in ("TIEA", "TIEB", "TIEC"):
+            client.delete(f'/stocks/{ticker}')
@@ -0,0 +1,77 @@
+import threading
+import time
+import pytest
+from profit_cache import ProfitCache
+
+
+# Tests that the least recently used entry is evicted when the cache is full
+def test_cache_evicts_least_recently_used():
+    cache = ProfitCache(max_entries=2, ttl=60)
+    cache.get_or_compute(("A",), lambda: 1)
+    cache.get_or_compute(("B",), lambda: 2)
+    cache.get_or_compute(("A",), lambda: 0)
+    cache.get_or_compute(("C",), lambda: 3)
+    assert cache.get_or_compute(("A",), lambda: 0) == 1
+    assert cache.get_or_compute(("B",), lambda: 0) == 0
+    assert cache.stats()["evictions"] == 2
+
+
+# Tests that entries expire after their time to live
+def test_cache_entries_expire():
+    cache = ProfitCache(max_entries=2, ttl=0.01)
+    cache.get_or_compute(("A",), lambda: 1)
+    time.sleep(0.02)
+    assert cache.get_or_compute(("A",), lambda: 2) == 2
+
+
+# Tests that an invalidation drops the entries of every ticker
+def test_cache_invalidation():
+    cache = ProfitCache()
+    cache.get_or_compute(("A",), lambda: 1)
+    cache.get_or_compute(("B",), lambda: 1)
+    cache.invalidate("A")
+    assert cache.stats()["entries"] == 1
+    assert cache.get_or_compute(("B",), lambda: 2) == 2
+
+
+# Tests that concurrent misses for the same key run the computation only once
+def test_cache_collapses_concurrent_misses():
+    cache = ProfitCache()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def compute():
+        calls.append(1)
+        started.set()
+        release.wait(5)
+        return 42
+
+    results = []
+    leader = threading.Thread(target=lambda: results.append(cache.get_or_compute(("A",), compute)))
+    leader.start()
+    started.wait(5)
+    followers = [threading.Thread(target=lambda: results.append(cache.get_or_compute(("A",), compute)))
+                 for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    while cache.stats()["collapsed"] < 3:
+        time.sleep(0.001)
+    release.set()
+    for thread in [leader, *followers]:
+        thread.join(5)
+
+    assert results == [42, 42, 42, 42]
+    assert len(calls) == 1
+    assert cache.stats()["misses"] == 1
+
+
+# Tests that errors are passed to the caller and not cached
+def test_cache_does_not_store_errors():
+    def fail():
+        raise ValueError()
+
+    cache = ProfitCache()
+    with pytest.raises(ValueError):
+        cache.get_or_compute(("A",), fail)
+    assert cache.get_or_compute(("A",), lambda: 1) == 1
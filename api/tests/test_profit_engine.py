@@ -0,0 +1,138 @@
+import os
+import numpy as np
+import pandas as pd
+import pytest
+from profit_engine import calc_profit, calc_profit_multi_tread, exceeds, gain_prefix, update_gain_prefix, \
+    window_multi_trade_profit
+from benchmarks import reference
+
+CSV_DIRECTORY = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "csv_files")
+
+
+def load_csv(file_name):
+    df = pd.read_csv(os.path.join(CSV_DIRECTORY, file_name)).dropna()
+    dates = pd.to_datetime(df["Date"], format="%Y-%m-%d").to_numpy().astype("datetime64[D]")
+    return dates, df["Close"].to_numpy(dtype="float64")
+
+
+def to_rows(dates, closes):
+    return [reference.PriceRow(d, c) for d, c in zip(dates.astype(object), closes.tolist())]
+
+
+# Tests that the engine matches the original implementation on random windows of every bundled CSV
+@pytest.mark.parametrize("file_name", ["Amazon.csv", "Apple.csv", "Facebook.csv", "Google.csv", "Netflix.csv"])
+def test_engine_matches_original_on_csv_windows(file_name):
+    dates, closes = load_csv(file_name)
+    rng = np.random.default_rng(42)
+    for _ in range(50):
+        start, end = sorted(rng.integers(0, len(closes), size=2))
+        window_dates, window_closes = dates[start:end + 1], closes[start:end + 1]
+        assert calc_profit(window_dates, window_closes) == reference.calc_profit(to_rows(window_dates, window_closes))
+
+
+# Tests equal closes, single day, falling prices and repeated minimums against the original implementation
+@pytest.mark.parametrize("closes", [
+    [1.0],
+    [2.0, 2.0, 2.0],
+    [5.0, 4.0, 3.0, 1.0],
+    [1.0, 1.0, 2.0, 2.0, 1.0, 1.0, 3.0],
+    [3.0, 1.0, 4.0, 1.0, 4.0, 2.0, 2.0, 4.0],
+    [1.0, 2.0, 2.0, 3.0],
+])
+def test_engine_matches_original_on_edge_cases(closes):
+    closes = np.array(closes, dtype="float64")
+    dates = np.datetime64("2000-01-03") + np.arange(len(closes))
+    rows = to_rows(dates, closes)
+    assert calc_profit(dates, closes) == reference.calc_profit(rows)
+    assert calc_profit_multi_tread(closes) == reference.calc_profit_multi_tread(rows)
+
+
+# Tests that an empty range returns the "no data" detail
+def test_engine_empty_range():
+    empty = np.array([], dtype="float64")
+    assert calc_profit(empty.astype("datetime64[D]"), empty) == {
+        "detail": "No price data available for the given range"
+    }
+
+
+# Tests that the prefix sum lookups match the multi-trade profit on random windows of every bundled CSV
+@pytest.mark.parametrize("file_name", ["Amazon.csv", "Apple.csv", "Facebook.csv", "Google.csv", "Netflix.csv"])
+def test_gain_prefix_matches_multi_trade_on_csv_windows(file_name):
+    dates, closes = load_csv(file_name)
+    prefix = gain_prefix(closes)
+    rng = np.random.default_rng(7)
+    for _ in range(200):
+        start, stop = sorted(rng.integers(0, len(closes) + 1, size=2))
+        expected = reference.calc_profit_multi_tread(to_rows(dates[start:stop], closes[start:stop])) if stop > start else 0
+        assert window_multi_trade_profit(prefix, start, stop) == pytest.approx(expected, rel=1e-9, abs=1e-9)
+        assert window_multi_trade_profit(prefix, start, stop) == pytest.approx(
+            calc_profit_multi_tread(closes[start:stop]), rel=1e-9, abs=1e-9)
+
+
+# Tests that prefix sum profits compared with `exceeds` order windows like the exact profits, equal windows tie
+@pytest.mark.parametrize("file_name", ["Apple.csv", "Netflix.csv"])
+def test_gain_prefix_ordering_on_csv_windows(file_name):
+    _, closes = load_csv(file_name)
+    rng = np.random.default_rng(11)
+
+    # A copy behind a different history, so the same window is summed from other prefix sums
+    history = len(closes)
+    copied = np.concatenate((rng.uniform(100, 900, history).round(2), closes))
+    prefix, copied_prefix = gain_prefix(closes), gain_prefix(copied)
+    for _ in range(500):
+        first = sorted(rng.integers(0, len(closes) + 1, size=2))
+        second = first if rng.random() < .5 else sorted(rng.integers(0, len(closes) + 1, size=2))
+        approximate = (window_multi_trade_profit(prefix, *first),
+                       window_multi_trade_profit(copied_prefix, second[0] + history, second[1] + history))
+        exact = (calc_profit_multi_tread(closes[first[0]:first[1]]),
+                 calc_profit_multi_tread(closes[second[0]:second[1]]))
+        assert exceeds(approximate[0], approximate[1]) == exceeds(exact[0], exact[1])
+        assert exceeds(approximate[1], approximate[0]) == exceeds(exact[1], exact[0])
+        if first == second:
+            assert not exceeds(approximate[0], approximate[1]) and not exceeds(approximate[1], approximate[0])
+
+
+# Tests the prefix sum lookups on equal closes, single days, empty and falling windows
+@pytest.mark.parametrize("closes", [
+    [],
+    [1.0],
+    [2.0, 2.0, 2.0],
+    [5.0, 4.0, 3.0, 1.0],
+    [1.0, 1.0, 2.0, 2.0, 1.0, 1.0, 3.0],
+    [1.0, 2.0, 2.0, 3.0],
+])
+def test_gain_prefix_edge_cases(closes):
+    closes = np.array(closes, dtype="float64")
+    prefix = gain_prefix(closes)
+    for start in range(len(closes) + 1):
+        for stop in range(start, len(closes) + 2):
+            window = closes[start:stop]
+            expected = reference.calc_profit_multi_tread(to_rows(np.arange(len(window)), window)) if len(window) else 0
+            assert window_multi_trade_profit(prefix, start, stop) == pytest.approx(expected)
+
+
+# Tests that many windows are answered at once
+def test_gain_prefix_vectorized_windows():
+    closes = np.array([1.0, 3.0, 2.0, 5.0, 5.0, 4.0, 6.0])
+    prefix = gain_prefix(closes)
+    starts, stops = np.array([0, 1, 3, 6, 2]), np.array([7, 4, 5, 7, 2])
+    assert window_multi_trade_profit(prefix, starts, stops).tolist() == [7.0, 3.0, .0, .0, .0]
+
+
+# Tests that updating the prefix sums after inserts, deletes and changes matches a rebuild
+def test_update_gain_prefix():
+    rng = np.random.default_rng(3)
+    closes = rng.integers(1, 8, size=30).astype("float64")
+    prefix = gain_prefix(closes)
+    for _ in range(200):
+        position = int(rng.integers(0, len(closes) + 1))
+        action = rng.integers(0, 3)
+        if action == 0:
+            closes = np.insert(closes, position, float(rng.integers(1, 8)))
+        elif action == 1 and position < len(closes):
+            closes = np.delete(closes, position)
+        elif position < len(closes):
+            closes = closes.copy()
+            closes[position] = float(rng.integers(1, 8))
+        prefix = update_gain_prefix(prefix, closes, position)
+        assert prefix.tolist() == gain_prefix(closes).tolist()
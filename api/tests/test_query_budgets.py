@@ -0,0 +1,65 @@
+import logging
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+import query_log
+from main import app
+from query_log import QueryBudgetExceeded, query_budget, record_queries
+
+client = TestClient(app)
+
+
+def price(day):
+    return {"date": day, "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adj_close": 1.5, "volume": 10}
+
+
+# Tests the SQL statement budgets of the read endpoints, which are served from the price store
+@pytest.mark.parametrize("url, budget", [
+    ("/stocks/", 1),
+    ("/stocks/AAPL", 1),
+    ("/prices/AAPL?start=2019-01-01&limit=100", 2),
+    ("/prices/AAPL/07/24/2000", 2),
+    ("/prices/AAPL/bars?period=month", 1),
+    ("/prices/AAPL/indicators/sma", 1),
+    ("/prices/export?start=2019-01-01", 1),
+])
+def test_read_query_budgets(url, budget):
+    client.get("/stocks/")
+    with query_budget(budget):
+        assert client.get(url).status_code == status.HTTP_200_OK
+
+
+# Tests that the statements of batch requests do not grow with the number of stocks or rows
+def test_batch_query_budgets():
+    profits = [{"ticker": ticker, "start_date": "01/01/2015", "end_date": "12/31/2015"}
+               for ticker in ("AAPL", "AMZN", "META", "GOOGL", "NFLX")]
+    with query_budget(1):
+        assert client.post("/profit/batch", json=profits).status_code == status.HTTP_200_OK
+
+    for count in (1, 50):
+        with query_budget(4):
+            response = client.post("/prices/NFLX/bulk", json=[price(f"2042-{month:02}-{day:02}")
+                                                              for month in range(1, 11) for day in range(1, 6)][:count])
+            assert response.status_code == status.HTTP_200_OK
+    client.delete("/prices/NFLX?start=2042-01-01&end=2042-12-31")
+
+
+# Tests that an exceeded budget fails with the executed statements
+def test_query_budget_exceeded():
+    with pytest.raises(QueryBudgetExceeded, match="2 statements executed, the budget is 1:\n.*SELECT"):
+        with query_budget(1):
+            client.get("/prices/AAPL?limit=1")
+    with record_queries() as log:
+        client.get("/stocks/AAPL")
+    assert len(log) == 1 and log.seconds > 0
+
+
+# Tests that slow statements are logged with their query plan
+def test_slow_query_log(monkeypatch, caplog):
+    monkeypatch.setattr(query_log, "SLOW_QUERY_SECONDS", 0)
+    with caplog.at_level(logging.WARNING, logger="query_log"):
+        client.get("/stocks/AAPL")
+    record = caplog.records[-1]
+    assert record.getMessage().startswith("Slow query took")
+    assert "FROM stocks" in record.getMessage() and "Query plan:\n" in record.getMessage()
+    assert "stocks" in record.getMessage().split("Query plan:")[1]
@@ -0,0 +1,79 @@
+import json
+import time
+from types import SimpleNamespace
+import pytest
+from fastapi import status
+from fastapi.testclient import TestClient
+import request_profiler
+from main import app, create_app
+from request_profiler import ProfilerMiddleware, Sampler, categorize, is_idle
+
+TOKEN = "secret"
+
+# A crash of the sampler thread would silently cut the profiles short, so it fails the tests
+pytestmark = pytest.mark.filterwarnings("error::pytest.PytestUnhandledThreadExceptionWarning")
+
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(request_profiler, "PROFILE_DIRECTORY", str(tmp_path))
+    return TestClient(create_app(profile_token=TOKEN))
+
+
+# Tests that samples are attributed to the innermost frame with a category
+def test_categorize():
+    engine = ("/api/profit_engine.py", "calc_profit")
+    assert categorize((("/site-packages/sqlalchemy/engine/default.py", "do_execute"), engine)) == "sqlalchemy"
+    assert categorize((("/site-packages/numpy/core/fromnumeric.py", "argmin"), engine)) == "profit_engine"
+    assert categorize((("/site-packages/fastapi/routing.py", "serialize_response"),)) == "pydantic"
+    assert categorize((("/api/main.py", "readiness"),)) == "other"
+
+
+# Tests that a request with the token is profiled and its stored profile can be fetched
+def test_profiled_request(client, tmp_path):
+    response = client.get("/prices/AAPL", headers={"X-Profile-Token": TOKEN})
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) > 1000
+    timings = dict(timing.split(";dur=") for timing in response.headers["server-timing"].split(", "))
+    assert set(timings) == {"sqlalchemy", "pydantic", "profit_engine", "other", "total"}
+
+    profile_id = response.headers["x-profile-id"]
+    summary = json.loads((tmp_path / f"{profile_id}.json").read_text())
+    assert summary["path"] == "/prices/AAPL" and summary["status"] == 200 and summary["seconds"] > 0
+
+    headers = {"X-Profile-Token": TOKEN}
+    folded = client.get(f"/profiles/{profile_id}", headers=headers)
+    assert folded.status_code == status.HTTP_200_OK
+    for line in folded.text.splitlines():
+        stack, weight = line.rsplit(" ", 1)
+        assert ";" in stack and int(weight) > 0
+    assert client.get(f"/profiles/{profile_id}?format=json", headers=headers).json() == summary
+
+    assert client.get(f"/profiles/{profile_id}").status_code == status.HTTP_403_FORBIDDEN
+    assert client.get("/profiles/..%2Fsecret", headers=headers).status_code == status.HTTP_404_NOT_FOUND
+
+
+# Tests that requests without the right token are served without profiling
+def test_unprofiled_requests(client, tmp_path):
+    for response in (client.get("/stocks/AAPL"), client.get("/stocks/AAPL?profile=wrong"),
+                     client.get("/stocks/AAPL", headers={"X-Profile-Token": "wrong"})):
+        assert response.status_code == status.HTTP_200_OK and "x-profile-id" not in response.headers
+    assert "x-profile-id" in client.get(f"/stocks/AAPL?profile={TOKEN}").headers
+    assert not any(middleware.cls is ProfilerMiddleware for middleware in app.user_middleware)
+
+
+# Tests that frames without a current line are busy, and that a failing sample does not stop the sampler
+def test_sampler_survives_bad_frames(monkeypatch):
+    code = SimpleNamespace(co_filename=request_profiler.__file__, co_name="run")
+    assert not is_idle(SimpleNamespace(f_code=code, f_lineno=None))
+
+    def fail(frame):
+        raise TypeError("frame is finishing")
+
+    monkeypatch.setattr(request_profiler, "is_idle", fail)
+    sampler = Sampler(interval=0.001)
+    sampler.start()
+    time.sleep(0.05)
+    assert sampler.is_alive()
+    sampler.stop()
+    assert sampler.errors > 0 and sampler.samples == 0
@@ -0,0 +1,71 @@
+from datetime import date
+from types import SimpleNamespace
+import numpy as np
+import pandas as pd
+import pytest
+from price_store import PriceSeries, COLUMN_DTYPES
+from rollups import Rollup, ROLLUP_PERIODS
+
+# Pandas frequencies of the periods, labelled with the first day of the period
+FREQUENCIES = {"week": "W-MON", "month": "MS", "year": "YS"}
+
+
+def random_series(rng, length):
+    # Trading days with gaps, so some weeks and months have no prices
+    days = np.sort(rng.choice(np.arange(np.datetime64("2019-12-20"), np.datetime64("2021-03-01")), length,
+                              replace=False))
+    closes = rng.integers(1, 100, size=length).astype("float64")
+    return PriceSeries(1, id=np.arange(length), date=days, open=closes + 0.5, high=closes + 1, low=closes - 1,
+                       close=closes, adj_close=closes, volume=rng.integers(1, 1000, size=length))
+
+
+def assert_same_bars(rollup, series):
+    assert rollup.bars() == Rollup.build(rollup.period, series.columns()).bars()
+
+
+# Tests that the bars match a pandas resample of the daily prices
+@pytest.mark.parametrize("period", ROLLUP_PERIODS)
+def test_rollup_matches_pandas_resample(period):
+    series = random_series(np.random.default_rng(3), 150)
+    frame = pd.DataFrame(series.columns()).set_index("date")
+    expected = frame.resample(FREQUENCIES[period], label="left", closed="left").agg(
+        {"open": "first", "high": "max", "low": "min", "close": "last", "volume": "sum"}
+    ).dropna()
+    bars = pd.DataFrame(series.rollups[period].bars())
+    assert bars["date"].tolist() == [day.strftime("%Y-%m-%d") for day in expected.index]
+    for name in ("open", "high", "low", "close", "volume"):
+        assert bars[name].tolist() == expected[name].tolist()
+
+
+# Tests that the bars of the date range include the periods of both ends
+def test_rollup_bars_in_range():
+    series = random_series(np.random.default_rng(5), 150)
+    bars = series.rollups["month"].bars(date(2020, 3, 15), date(2020, 5, 2))
+    assert [bar["date"] for bar in bars] == ["2020-03-01", "2020-04-01", "2020-05-01"]
+    assert series.rollups["year"].bars(date(2022, 1, 1)) == []
+
+
+# Tests that materialized bars are updated incrementally after inserts, updates and deletes
+def test_rollups_follow_writes():
+    rng = np.random.default_rng(11)
+    series = random_series(rng, 60)
+    series.rollups
+    for _ in range(100):
+        day = np.datetime64("2019-12-20") + int(rng.integers(0, 450))
+        action = rng.integers(0, 3)
+        if action == 0:
+            close = float(rng.integers(1, 100))
+            series = series.with_price(SimpleNamespace(id=0, date=day.item(), open=close, high=close + 1,
+                                                       low=close - 1, close=close, adj_close=close, volume=5))
+        elif action == 1:
+            series = series.without_date(day.item())
+        else:
+            series = series.without_window(day.item(), (day + int(rng.integers(0, 20))).item())
+        assert "rollups" in series.__dict__
+        for rollup in series.rollups.values():
+            assert_same_bars(rollup, series)
+
+    # A series without prices has no bars
+    empty = series.without_window(date(2000, 1, 1), date(2030, 1, 1))
+    assert all(len(rollup.date) == 0 for rollup in empty.rollups.values())
+    assert PriceSeries.empty(1).rollups["week"].date.dtype == COLUMN_DTYPES["date"]
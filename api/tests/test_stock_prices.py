@@ -1,3 +1,5 @@
+import json
+import pytest
 from main import app
 from fastapi.testclient import TestClient
 from fastapi import status
@@ -56,6 +58,75 @@ def test_create_stock_price_date_already_exists():
     }
 
 
+# Tests retrieving all stock prices for a stock
+def test_get_all_stock_prices():
+    response = client.get("/prices/NFLX")
+    assert response.status_code == status.HTTP_200_OK
+    assert len(response.json()) == 4581
+    assert "X-Next-Cursor" not in response.headers
+
+
+# Tests paging through stock prices with the keyset cursor
+def test_get_stock_prices_pages():
+    response = client.get("/prices/AAPL", params={"limit": 2})
+    assert response.status_code == status.HTTP_200_OK
+    assert [price["date"] for price in response.json()] == ["1980-12-12", "1980-12-15"]
+    assert response.headers["X-Next-Cursor"] == "1980-12-15"
+
+    response = client.get("/prices/AAPL", params={"limit": 2, "after": response.headers["X-Next-Cursor"]})
+    assert [price["date"] for price in response.json()] == ["1980-12-16", "1980-12-17"]
+
+
+# Tests streaming stock prices as NDJSON
+def test_stream_stock_prices():
+    response = client.get("/prices/NFLX", params={"stream": True})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.headers["content-type"] == "application/x-ndjson"
+    lines = response.text.splitlines()
+    assert len(lines) == 4581
+    assert json.loads(lines[0]) == client.get("/prices/NFLX", params={"limit": 1}).json()[0]
+
+
+# Tests retrieving stock prices in a date range with a subset of the columns
+def test_get_stock_prices_range_and_fields():
+    response = client.get("/prices/AAPL", params={"start": "2000-12-08", "end": "2000-12-12", "fields": "close"})
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"date": "2000-12-08", "close": 0.268973},
+        {"date": "2000-12-11", "close": 0.271205},
+        {"date": "2000-12-12", "close": 0.274554}
+    ]
+
+
+# Tests paging through a date range, the cursor stays inside the range
+def test_get_stock_prices_range_pages():
+    params = {"start": "2000-12-08", "end": "2000-12-12", "limit": 2}
+    response = client.get("/prices/AAPL", params=params)
+    assert [price["date"] for price in response.json()] == ["2000-12-08", "2000-12-11"]
+
+    response = client.get("/prices/AAPL", params={**params, "after": response.headers["X-Next-Cursor"]})
+    assert [price["date"] for price in response.json()] == ["2000-12-12"]
+    assert "X-Next-Cursor" not in response.headers
+
+
+# Tests returning an error for unknown fields
+def test_get_stock_prices_unknown_fields():
+    response = client.get("/prices/AAPL", params={"fields": "close,price"})
+    assert response.status_code == status.HTTP_406_NOT_ACCEPTABLE
+    assert response.json() == {
+      "detail": "Unknown fields: price"
+    }
+
+
+# Tests retrieving stock prices for a non-existent stock
+def test_get_all_stock_prices_stock_not_found():
+    response = client.get("/prices/AAPL65")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {
+      "detail": "Stock not found"
+    }
+
+
 # Tests retrieving stock price data for a specific date
 def test_get_stock_price_by_date():
     response = client.get("/prices/AAPL/07/24/2000")
@@ -104,6 +175,14 @@ def test_update_stock_price_success():
     assert response.status_code == status.HTTP_202_ACCEPTED
 
 
+# Tests that an updated stock price is returned by the date lookup
+def test_get_stock_price_after_update():
+    response = client.get("/prices/AAPL/01/01/2023")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["close"] == 146.2
+    assert response.json()["volume"] == 1
+
+
 # Tests attempting to update stock price data for a non-existent stock
 def test_update_stock_price_stock_not_found():
     request_data = {
@@ -165,6 +244,15 @@ def test_delete_stock_price_success():
     assert response.status_code == status.HTTP_202_ACCEPTED
 
 
+# Tests that a deleted stock price is no longer returned by the date lookup
+def test_get_stock_price_after_delete():
+    response = client.get("/prices/AAPL/01/01/2023")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    assert response.json() == {
+      "detail": "Stock or date not found"
+    }
+
+
 # Tests attempting to delete stock price data for a non-existent stock
 def test_delete_stock_price_stock_not_found():
     response = client.delete("/prices/AAPL65/01/01/2023")
@@ -190,3 +278,181 @@ def test_delete_stock_price_date_not_found():
     assert response.json() == {
       "detail": "Date not found"
     }
+
+
+# Tests upserting prices from a CSV upload in the format of the bundled files
+def test_bulk_upsert_stock_prices_csv():
+    body = (
+        "Date,Open,High,Low,Close,Adj Close,Volume\n"
+        "2030-01-02,1.0,2.0,0.5,1.5,1.5,100\n"
+        "2030-01-03,null,null,null,null,null,null\n"
+        "2030-01-04,1.0,2.0,0.5,1.75,1.75,200\n"
+    )
+    response = client.post("/prices/AAPL/bulk", content=body, headers={"Content-Type": "text/csv"})
+    assert response.status_code == status.HTTP_200_OK
+    result = response.json()
+    assert (result["inserted"], result["updated"], result["failed"]) == (2, 0, 1)
+    assert result["rows"][0] == {"row": 1, "date": "2030-01-02", "status": "inserted"}
+    assert result["rows"][1]["status"] == "failed"
+    assert client.get("/prices/AAPL/01/04/2030").json()["close"] == 1.75
+
+
+# Tests upserting prices from JSON and NDJSON uploads, existing dates are updated
+def test_bulk_upsert_stock_prices_json():
+    price = {"date": "2030-01-04", "open": 1.0, "high": 2.0, "low": 0.5, "close": 2.5, "adj_close": 2.5, "volume": 1}
+    response = client.post("/prices/AAPL/bulk", json=[price, {**price, "date": "2030-01-05"}, {"date": "x"}])
+    assert response.status_code == status.HTTP_200_OK
+    assert [row["status"] for row in response.json()["rows"]] == ["updated", "inserted", "failed"]
+    assert client.get("/prices/AAPL/01/04/2030").json()["close"] == 2.5
+
+    body = json.dumps({**price, "close": 3.5}) + "\n" + json.dumps({**price, "date": "2030-01-06"}) + "\n"
+    response = client.post("/prices/AAPL/bulk", content=body, headers={"Content-Type": "application/x-ndjson"})
+    assert [row["status"] for row in response.json()["rows"]] == ["updated", "inserted"]
+    assert client.get("/prices/AAPL?start=2030-01-01&fields=close").json() == [
+        {"date": "2030-01-02", "close": 1.5},
+        {"date": "2030-01-04", "close": 3.5},
+        {"date": "2030-01-05", "close": 2.5},
+        {"date": "2030-01-06", "close": 2.5},
+    ]
+
+
+# Tests that a JSON array upload is parsed while it arrives in small chunks, and invalid arrays are rejected
+def test_bulk_upsert_stock_prices_json_stream():
+    price = {"date": "2031-01-02", "open": 1.0, "high": 2.0, "low": 0.5, "close": 12345.678, "adj_close": 1.5,
+             "volume": 1000}
+    items = ", ".join(json.dumps({**price, "date": f"2031-01-{day:02}"}) for day in range(2, 9))
+    body = f" [ {items} ]\n".encode()
+
+    def chunks(data, size=7):
+        for start in range(0, len(data), size):
+            yield data[start:start + size]
+
+    headers = {"Content-Type": "application/json"}
+    response = client.post("/prices/AAPL/bulk", content=chunks(body), headers=headers)
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json()["inserted"] == 7
+    last = client.get("/prices/AAPL?start=2031-01-01&fields=close").json()[-1]
+    assert last == {"date": "2031-01-08", "close": 12345.678}
+
+    for invalid, detail in [(b'[{"date": "2031-02-02"} {}]', "Invalid JSON"), (b"[1, 2", "Invalid JSON"),
+                            (b"[1] 2", "Invalid JSON"), (b"", "Invalid JSON"),
+                            (b'{"date": "2031-02-02"}', "Expected a JSON array of prices")]:
+        response = client.post("/prices/AAPL/bulk", content=chunks(invalid, 3), headers=headers)
+        assert (response.status_code, response.json()) == (status.HTTP_400_BAD_REQUEST, {"detail": detail})
+    assert client.post("/prices/AAPL/bulk", content=b" [ ] ", headers=headers).json()["rows"] == []
+    assert client.delete("/prices/AAPL?start=2031-01-01&end=2031-12-31").json() == {"deleted": 7}
+
+
+# Tests bulk upload errors for a non-existent stock and an unsupported content type
+def test_bulk_upsert_stock_prices_errors():
+    response = client.post("/prices/AAPL65/bulk", json=[])
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+    response = client.post("/prices/AAPL/bulk", content="x", headers={"Content-Type": "text/plain"})
+    assert response.status_code == status.HTTP_415_UNSUPPORTED_MEDIA_TYPE
+    response = client.post("/prices/AAPL/bulk", content="Date,Close\n", headers={"Content-Type": "text/csv"})
+    assert response.status_code == status.HTTP_400_BAD_REQUEST
+
+
+# Tests that uploaded and updated prices are rounded to the decimals of the stored prices
+def test_stock_prices_rounded():
+    price = {"date": "2032-01-02", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.23456789, "adj_close": 1.2345674,
+             "volume": 1}
+    assert client.post("/prices/AAPL/bulk", json=[price]).json()["inserted"] == 1
+    body = "Date,Open,High,Low,Close,Adj Close,Volume\n2032-01-03,1.0,2.0,0.5,0.0000006,1.5,1\n"
+    assert client.post("/prices/AAPL/bulk", content=body, headers={"Content-Type": "text/csv"}).json()["inserted"] == 1
+    assert client.patch("/prices/AAPL", json=[{"date": "2032-01-03", "open": 1.00000049}]).json()["updated"] == 1
+    assert client.get("/prices/AAPL?start=2032-01-01&fields=open,close,adj_close").json() == [
+        {"date": "2032-01-02", "open": 1.0, "close": 1.234568, "adj_close": 1.234567},
+        {"date": "2032-01-03", "open": 1.0, "close": 0.000001, "adj_close": 1.5},
+    ]
+    assert client.delete("/prices/AAPL?start=2032-01-01&end=2032-12-31").json() == {"deleted": 2}
+
+
+# Tests updating many prices at once, dates without a price are reported
+def test_bulk_update_stock_prices():
+    updates = [
+        {"date": "2030-01-02", "close": 4.5},
+        {"date": "2030-01-04", "close": 5.5, "volume": 7},
+        {"date": "2030-01-03", "close": 1.0},
+        {"date": "2030-01-02", "open": 0.5},
+    ]
+    response = client.patch("/prices/AAPL", json=updates)
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json() == {"updated": 2, "not_found": ["2030-01-03"]}
+    response = client.get("/prices/AAPL?start=2030-01-02&end=2030-01-04&fields=open,close,volume")
+    assert response.json() == [
+        {"date": "2030-01-02", "open": 0.5, "close": 4.5, "volume": 100},
+        {"date": "2030-01-04", "open": 1.0, "close": 5.5, "volume": 7},
+    ]
+    assert client.get("/prices/AAPL/01/04/2030").json()["volume"] == 7
+
+
+# Tests deleting all prices of a stock in a date range
+def test_delete_stock_prices_range():
+    response = client.delete("/prices/AAPL?start=2030-01-03&end=2030-01-05")
+    assert response.status_code == status.HTTP_202_ACCEPTED
+    assert response.json() == {"deleted": 2}
+    assert client.get("/prices/AAPL/01/04/2030").status_code == status.HTTP_404_NOT_FOUND
+    assert client.get("/prices/AAPL?start=2030-01-01&fields=close").json() == [
+        {"date": "2030-01-02", "close": 4.5},
+        {"date": "2030-01-06", "close": 2.5},
+    ]
+
+    response = client.delete("/prices/AAPL?start=2030-01-01&end=2030-12-31")
+    assert response.json() == {"deleted": 2}
+    response = client.delete("/prices/AAPL65?start=2030-01-01&end=2030-12-31")
+    assert response.status_code == status.HTTP_404_NOT_FOUND
+
+
+# Tests the weekly, monthly and yearly bars of a stock, which follow added, updated and deleted prices
+def test_get_stock_price_bars():
+    response = client.get("/prices/AAPL/bars?period=week&start=2000-12-08&end=2000-12-12")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"date": "2000-12-04", "open": 0.30692, "high": 0.311384, "low": 0.25, "close": 0.268973,
+         "volume": 3204504800},
+        {"date": "2000-12-11", "open": 0.271205, "high": 0.285714, "low": 0.25, "close": 0.251116,
+         "volume": 1840921600},
+    ]
+
+    price = {"date": "2031-01-06", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adj_close": 1.5, "volume": 10}
+    client.post("/prices/AAPL", json=price)
+    client.post("/prices/AAPL", json={**price, "date": "2031-01-31", "high": 3.0, "close": 2.5})
+    client.put("/prices/AAPL/01/06/2031", json={**price, "low": 0.25})
+    assert client.get("/prices/AAPL/bars?period=month&start=2031-01-01").json() == [
+        {"date": "2031-01-01", "open": 1.0, "high": 3.0, "low": 0.25, "close": 2.5, "volume": 20},
+    ]
+    client.delete("/prices/AAPL/01/31/2031")
+    assert client.get("/prices/AAPL/bars?period=year&start=2031-01-01").json() == [
+        {"date": "2031-01-01", "open": 1.0, "high": 2.0, "low": 0.25, "close": 1.5, "volume": 10},
+    ]
+    client.delete("/prices/AAPL?start=2031-01-01&end=2031-12-31")
+    assert client.get("/prices/AAPL/bars?period=year&start=2031-01-01").json() == []
+
+    assert client.get("/prices/AAPL/bars?period=day").status_code == status.HTTP_406_NOT_ACCEPTABLE
+    assert client.get("/prices/AAPL65/bars").status_code == status.HTTP_404_NOT_FOUND
+
+
+# Tests a technical indicator of a stock, which is extended when a new latest price is added
+def test_get_stock_price_indicator():
+    closes = [price["close"] for price in client.get("/prices/AAPL?start=2000-12-06&end=2000-12-11").json()]
+    response = client.get("/prices/AAPL/indicators/sma?window=3&start=2000-12-08&end=2000-12-11")
+    assert response.status_code == status.HTTP_200_OK
+    assert response.json() == [
+        {"date": "2000-12-08", "sma": pytest.approx(sum(closes[:3]) / 3)},
+        {"date": "2000-12-11", "sma": pytest.approx(sum(closes[1:]) / 3)},
+    ]
+
+    last_close = client.get("/prices/AAPL?start=2020-01-01").json()[-1]["close"]
+    price = {"date": "2031-01-06", "open": 1.0, "high": 2.0, "low": 0.5, "close": 1.5, "adj_close": 1.5, "volume": 10}
+    client.post("/prices/AAPL", json=price)
+    client.post("/prices/AAPL", json={**price, "date": "2031-01-07", "close": 4.5})
+    assert client.get("/prices/AAPL/indicators/sma?window=2&start=2031-01-01").json() == [
+        {"date": "2031-01-06", "sma": pytest.approx((last_close + 1.5) / 2)},
+        {"date": "2031-01-07", "sma": 3.0},
+    ]
+    client.delete("/prices/AAPL?start=2031-01-01&end=2031-12-31")
+
+    assert client.get("/prices/AAPL/indicators/macd").status_code == status.HTTP_406_NOT_ACCEPTABLE
+    assert client.get("/prices/AAPL/indicators/sma?window=1").status_code == status.HTTP_422_UNPROCESSABLE_ENTITY
+    assert client.get("/prices/AAPL65/indicators/sma").status_code == status.HTTP_404_NOT_FOUND
@@ -0,0 +1,62 @@
+import pytest
+from sqlalchemy import create_engine, text
+from database import engine
+from storage_profile import StorageProfile, PROFILES
+
+
+# Tests that the API engine runs with the default "tuned" profile
+def test_engine_uses_tuned_profile():
+    with engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == PROFILES["tuned"].cache_size
+        assert connection.execute(text("PRAGMA temp_store")).scalar() == 2
+    assert engine.pool.size() == PROFILES["tuned"].pool_size
+
+
+# Tests that a profile applies its PRAGMAs to every new connection
+def test_profile_applies_pragmas(tmp_path):
+    profile = StorageProfile(journal_mode="DELETE", synchronous="FULL", mmap_size=0, cache_size=-1000,
+                             temp_store="MEMORY", pool_size=2)
+    test_engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}", **profile.engine_options())
+    profile.apply(test_engine)
+    with test_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "delete"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 2
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -1000
+        assert connection.execute(text("PRAGMA temp_store")).scalar() == 2
+    test_engine.dispose()
+
+
+# Tests selecting a preset and overriding its settings with environment variables
+def test_profile_from_env(monkeypatch):
+    monkeypatch.setenv("SQLITE_PROFILE", "default")
+    monkeypatch.setenv("SQLITE_MMAP_SIZE", "1048576")
+    monkeypatch.setenv("SQLITE_POOL_SIZE", "20")
+    profile = StorageProfile.from_env()
+    assert profile.journal_mode == "DELETE"
+    assert profile.mmap_size == 1048576
+    assert profile.pool_size == 20
+
+    monkeypatch.setenv("SQLITE_PROFILE", "unknown")
+    with pytest.raises(ValueError):
+        StorageProfile.from_env()
+
+
+# Tests that PRAGMA values that are not known keywords or integers are rejected
+def test_profile_rejects_invalid_values(monkeypatch):
+    assert StorageProfile(journal_mode="wal").journal_mode == "WAL"
+    with pytest.raises(ValueError):
+        StorageProfile(journal_mode="WAL; DROP TABLE stocks")
+    with pytest.raises(ValueError):
+        StorageProfile(cache_size="-2000")
+
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "NORMAL; PRAGMA foreign_keys = OFF")
+    with pytest.raises(ValueError):
+        StorageProfile.from_env()
+    monkeypatch.setenv("SQLITE_SYNCHRONOUS", "full")
+    monkeypatch.setenv("SQLITE_MMAP_SIZE", "0; DROP TABLE stocks")
+    with pytest.raises(ValueError):
+        StorageProfile.from_env()
+    monkeypatch.delenv("SQLITE_MMAP_SIZE")
+    assert StorageProfile.from_env().synchronous == "FULL"
@@ -0,0 +1,59 @@
+import filecmp
+import os
+import numpy as np
+import pandas as pd
+from sqlalchemy import create_engine
+from sqlalchemy.orm import Session
+from benchmarks.synthetic_data import plan_stock, generate_prices, trading_days, write_dataset
+from database import Base, Stock, StockPrice, STOCKS, STOCK_REGISTRY_FILE, populate_db, read_price_csv
+from migrations import stamp
+
+
+# Tests that the prices are valid OHLCV rows on trading days only, with gaps
+def test_generated_prices_are_valid():
+    calendar = trading_days("2015-01-01", "2019-12-31")
+    days = set(calendar.astype(str).tolist())
+    assert "2019-12-25" not in days and "2019-07-04" not in days and "2019-04-19" not in days
+    assert (pd.DatetimeIndex(calendar).weekday < 5).all()
+
+    gaps = 0
+    for index in range(20):
+        rng, positions, inception_date = plan_stock(index, calendar, 7)
+        gaps += positions[-1] - positions[0] + 1 - len(positions)
+        df = generate_prices(rng, calendar, positions)
+        assert len(df) == len(positions) and inception_date <= str(df["Date"].iloc[0])
+        assert (np.diff(df["Date"].to_numpy()) > np.timedelta64(0)).all()
+        assert (df["High"] >= df[["Open", "Close"]].max(axis=1)).all()
+        assert (df["Low"] <= df[["Open", "Close"]].min(axis=1)).all()
+        assert (df["Low"] > 0).all() and (df["Volume"] > 0).all()
+    assert gaps > 0
+
+
+# Tests that data sets only depend on the seed, not on the number of stocks or workers
+def test_dataset_is_deterministic(tmp_path):
+    write_dataset(str(tmp_path / "a"), tickers=3, start="2018-01-01", seed=1, workers=1)
+    write_dataset(str(tmp_path / "b"), tickers=4, start="2018-01-01", seed=1, workers=2)
+    names = sorted(os.listdir(tmp_path / "a"))
+    _, mismatch, errors = filecmp.cmpfiles(tmp_path / "a", tmp_path / "b", names[:-1], shallow=False)
+    assert len(names) == 9 and mismatch == errors == []
+
+    write_dataset(str(tmp_path / "c"), tickers=1, start="2018-01-01", seed=2, workers=1)
+    assert not filecmp.cmp(tmp_path / "a" / "Synthetic XAAAA.csv", tmp_path / "c" / "Synthetic XAAAA.csv", False)
+
+
+# Tests that a scaled data set fills a database through the stock registry
+def test_scaled_dataset_fills_database(tmp_path):
+    registry = write_dataset(str(tmp_path / "csv"), scale=1.2, seed=3, workers=1)
+    bundled = sum(len(read_price_csv(str(tmp_path / "csv" / f"{name}.csv"))) for name in STOCKS)
+    assert os.path.exists(tmp_path / "csv" / STOCK_REGISTRY_FILE)
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'stock_data.db'}")
+    Base.metadata.create_all(bind=engine)
+    stamp(engine)
+    with Session(engine) as db:
+        populate_db(db, str(tmp_path / "csv"), workers=1)
+        tickers = {ticker for ticker, in db.query(Stock.ticker)}
+        rows = db.query(StockPrice).count()
+    engine.dispose()
+    assert tickers == {info["ticker"] for info in registry.values()} and {"AAPL", "XAAAA"} <= tickers
+    assert rows >= 1.2 * bundled
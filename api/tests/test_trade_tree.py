@@ -0,0 +1,53 @@
+import numpy as np
+import pytest
+from profit_engine import best_single_trade
+from trade_tree import TradeTree
+
+
+def random_closes(rng, length):
+    # Few distinct values, so there are many equal closes and tied profits
+    return rng.integers(1, 8, size=length).astype("float64")
+
+
+# Tests that window queries match the linear scan, including its tie-breaking
+@pytest.mark.parametrize("length", [1, 2, 3, 17, 64, 100])
+def test_tree_matches_linear_scan(length):
+    rng = np.random.default_rng(length)
+    closes = random_closes(rng, length)
+    tree = TradeTree(closes)
+    for start in range(length + 1):
+        for stop in range(start, length + 1):
+            expected = best_single_trade(closes[start:stop])
+            if expected is not None:
+                expected = (expected[0] + start, expected[1] + start)
+            assert tree.best_trade(start, stop) == expected
+
+
+# Tests that incremental updates after inserts, deletes and changes match a rebuilt tree
+def test_tree_incremental_updates():
+    rng = np.random.default_rng(7)
+    closes = random_closes(rng, 40)
+    tree = TradeTree(closes)
+    for _ in range(200):
+        position = int(rng.integers(0, len(closes) + 1))
+        action = rng.integers(0, 3)
+        if action == 0:
+            closes = np.insert(closes, position, float(rng.integers(1, 8)))
+        elif action == 1 and position < len(closes):
+            closes = np.delete(closes, position)
+        elif position < len(closes):
+            closes = closes.copy()
+            closes[position] = float(rng.integers(1, 8))
+        tree = tree.updated(closes, position)
+
+        start, stop = sorted(rng.integers(0, len(closes) + 1, size=2))
+        assert tree.best_trade(start, stop) == TradeTree(closes).best_trade(start, stop)
+        assert tree.best_trade(0, len(closes)) == best_single_trade(closes)
+
+
+# Tests that windows reaching past the end of the series, like a post period, are clamped to the series
+def test_tree_window_past_the_end():
+    closes = random_closes(np.random.default_rng(3), 60)
+    tree = TradeTree(closes)
+    assert tree.best_trade(50, 200) == tree.best_trade(50, 60)
+    assert tree.best_trade(70, 90) is None
@@ -0,0 +1,153 @@
+from typing import Optional, Tuple
+import numpy as np
+
+# Index stored in padding leaves, larger than any real position
+_NO_INDEX = np.iinfo(np.int64).max
+
+
+class TradeTree:
+    """
+    A segment tree answering "best single trade in a window" queries in logarithmic time.
+
+    Every node covers a range of days and stores the lowest close, the highest close and the
+    most profitable (buy, sell) pair inside its range. Two neighbouring ranges combine in
+    constant time: the best trade is the best one of the left range, of the right range, or
+    buying at the lowest close on the left and selling at the highest close on the right.
+    Ties resolve to the earliest buy day and then the earliest sell day, like the profit engine.
+
+    The tree is stored in flat NumPy arrays, node `k` has the children `2k` and `2k + 1` and
+    the leaves start at `size`. Levels are built with vectorized operations.
+    """
+
+    def __init__(self, closes: np.ndarray):
+        self.length = len(closes)
+        self.size = 1
+        while self.size < max(self.length, 1):
+            self.size *= 2
+
+        self.min_close = np.full(2 * self.size, np.inf)
+        self.min_index = np.full(2 * self.size, _NO_INDEX, dtype=np.int64)
+        self.max_close = np.full(2 * self.size, -np.inf)
+        self.max_index = np.full(2 * self.size, _NO_INDEX, dtype=np.int64)
+        self.profit = np.full(2 * self.size, -np.inf)
+        self.buy = np.full(2 * self.size, _NO_INDEX, dtype=np.int64)
+        self.sell = np.full(2 * self.size, _NO_INDEX, dtype=np.int64)
+        self._set_leaves(closes, 0)
+        self._build(self.size, 2 * self.size)
+
+    def updated(self, closes: np.ndarray, first_changed: int) -> "TradeTree":
+        """
+        Create the tree of a changed series, rebuilding only the part after the first changed day.
+
+        Appending a day or changing a recent day only touches a few nodes per level. If the
+        series outgrows the tree, it is built from scratch.
+
+        :param closes: The close prices of the changed series.
+        :param first_changed: The position of the first close that differs from this tree.
+        :return: The tree of the changed series.
+        """
+        if len(closes) > self.size:
+            return TradeTree(closes)
+
+        tree = object.__new__(TradeTree)
+        tree.length = len(closes)
+        tree.size = self.size
+        for name in ("min_close", "min_index", "max_close", "max_index", "profit", "buy", "sell"):
+            setattr(tree, name, getattr(self, name).copy())
+
+        # Reset the leaves from the first change to the end of both series
+        first_changed = min(first_changed, len(closes), self.length)
+        stop = max(len(closes), self.length)
+        if first_changed < stop:
+            tree._clear_leaves(first_changed, stop)
+            tree._set_leaves(closes[first_changed:], first_changed)
+            tree._build(tree.size + first_changed, tree.size + stop)
+        return tree
+
+    def best_trade(self, start: int, stop: int) -> Optional[Tuple[int, int]]:
+        """
+        Find the most profitable single trade between two positions.
+
+        :param start: The first position of the window.
+        :param stop: The position after the last one of the window, clamped to the length of the series.
+        :return: A (buy_index, sell_index) tuple, or None if no trade makes a profit.
+        """
+        stop = min(stop, self.length)
+        if stop - start < 2:
+            return None
+
+        # Collect the nodes covering the window, from left to right
+        left, right = [], []
+        start += self.size
+        stop += self.size
+        while start < stop:
+            if start & 1:
+                left.append(start)
+                start += 1
+            if stop & 1:
+                stop -= 1
+                right.append(stop)
+            start //= 2
+            stop //= 2
+
+        # Combine them in order
+        min_close, min_index = np.inf, _NO_INDEX
+        profit, buy, sell = -np.inf, _NO_INDEX, _NO_INDEX
+        for node in left + right[::-1]:
+            cross = self.max_close[node] - min_close
+            if cross > profit or (cross == profit and (min_index, self.max_index[node]) < (buy, sell)):
+                profit, buy, sell = cross, min_index, self.max_index[node]
+            if self.profit[node] > profit:
+                profit, buy, sell = self.profit[node], self.buy[node], self.sell[node]
+            if self.min_close[node] < min_close:
+                min_close, min_index = self.min_close[node], self.min_index[node]
+
+        if not profit > 0:
+            return None
+        return int(buy), int(sell)
+
+    def _set_leaves(self, closes: np.ndarray, first: int):
+        leaves = slice(self.size + first, self.size + first + len(closes))
+        positions = np.arange(first, first + len(closes), dtype=np.int64)
+        self.min_close[leaves] = closes
+        self.max_close[leaves] = closes
+        self.min_index[leaves] = positions
+        self.max_index[leaves] = positions
+
+    def _clear_leaves(self, first: int, stop: int):
+        leaves = slice(self.size + first, self.size + stop)
+        self.min_close[leaves] = np.inf
+        self.max_close[leaves] = -np.inf
+        self.min_index[leaves] = _NO_INDEX
+        self.max_index[leaves] = _NO_INDEX
+
+    def _build(self, first: int, stop: int):
+        # Recalculate the parents of the nodes first..stop-1, one level at a time
+        first, stop = first // 2, (stop + 1) // 2
+        while stop > first >= 1:
+            nodes = np.arange(first, stop)
+            left, right = 2 * nodes, 2 * nodes + 1
+
+            # Lowest and highest close, the left child wins ties
+            take_right = self.min_close[right] < self.min_close[left]
+            self.min_close[nodes] = np.where(take_right, self.min_close[right], self.min_close[left])
+            self.min_index[nodes] = np.where(take_right, self.min_index[right], self.min_index[left])
+            take_right = self.max_close[right] > self.max_close[left]
+            self.max_close[nodes] = np.where(take_right, self.max_close[right], self.max_close[left])
+            self.max_index[nodes] = np.where(take_right, self.max_index[right], self.max_index[left])
+
+            # Best trade: inside the left child, across both children, or inside the right child
+            profit, buy, sell = self.profit[left], self.buy[left], self.sell[left]
+            cross = self.max_close[right] - self.min_close[left]
+            cross_buy, cross_sell = self.min_index[left], self.max_index[right]
+            take_cross = (cross > profit) | ((cross == profit) & (
+                (cross_buy < buy) | ((cross_buy == buy) & (cross_sell < sell))))
+            profit = np.where(take_cross, cross, profit)
+            buy = np.where(take_cross, cross_buy, buy)
+            sell = np.where(take_cross, cross_sell, sell)
+            take_right = self.profit[right] > profit
+            self.profit[nodes] = np.where(take_right, self.profit[right], profit)
+            self.buy[nodes] = np.where(take_right, self.buy[right], buy)
+            self.sell[nodes] = np.where(take_right, self.sell[right], sell)
+
+            first, stop = first // 2, (stop + 1) // 2